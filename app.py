@@ -1,142 +1,358 @@
-from flask import Flask, render_template, jsonify, make_response, request, session, send_from_directory
+from flask import Flask, Response, g, render_template, jsonify, request, session, send_from_directory, stream_with_context
+import json
 import os
 import re
 import shutil
+import threading
+import time
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
 from sklearn.linear_model import Ridge
-import hashlib
 from werkzeug.utils import secure_filename
 from urllib.parse import unquote
+from pricing import stack_coefficients, base_prices, margin_adjusted_prices, parse_product_requests, scenario_axis, expand_grid, scenario_prices
+from file_versions import stat_key
+from ridge_stats import RidgeStats, RidgePath, solve_batch, rolling_coefficients
+from model_registry import ModelRegistry
+from ingest import CsvIngest, UploadRejected, detach_stream
+from metrics import PricingMetrics, ProfilingMiddleware, current_route
+from monte_carlo import MonteCarloRunner, normalize_distribution
+from http_cache import HttpCache, make_etag
+from app_common import DataService, configure_app, register_common_routes, return_response, catalog_page_args, wants_progress
 
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'data'
+configure_app(app)
+# Ridge penalty: RIDGE_ALPHA for every product, or with RIDGE_ALPHA_SELECTION=gcv|loo the
+# value from the RIDGE_ALPHAS grid with the lowest cross-validated error per product
+app.config['RIDGE_ALPHA'] = float(os.environ.get('RIDGE_ALPHA', 1.0))
+app.config['RIDGE_ALPHA_SELECTION'] = os.environ.get('RIDGE_ALPHA_SELECTION', '').lower()
+app.config['RIDGE_ALPHAS'] = [float(a) for a in os.environ.get('RIDGE_ALPHAS', ','.join(f'{a:g}' for a in np.logspace(-3, 4, 29))).split(',')]
+# Product SVDs kept in memory for alpha selection
+app.config['RIDGE_PATH_CACHE_SIZE'] = int(os.environ.get('RIDGE_PATH_CACHE_SIZE', 32))
+# Most windows one /coefficients/<industry>/<product>/rolling request may ask for
+app.config['ROLLING_MAX_WINDOWS'] = int(os.environ.get('ROLLING_MAX_WINDOWS', 20000))
+# Upper bound on scenarios x products evaluated by one /simulate request
+app.config['SIMULATE_MAX_CELLS'] = int(os.environ.get('SIMULATE_MAX_CELLS', 5000000))
+# Monte Carlo draws allowed per product, and worker processes for whole-industry /risk runs (0 = one per CPU)
+app.config['RISK_MAX_DRAWS'] = int(os.environ.get('RISK_MAX_DRAWS', 1000000))
+app.config['RISK_WORKERS'] = int(os.environ.get('RISK_WORKERS', 0))
 
 # Allow cross-origin requests for development purposes
 from flask_cors import CORS
 CORS(app)
 
-data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+# Latency, read/hash/fit time, rows and bytes read and coefficient hits, served at /metrics
+metrics = PricingMetrics()
+if app.config['ALLOW_PROFILING']:
+    app.wsgi_app = ProfilingMiddleware(app.wsgi_app)
+
+# ETag / If-None-Match, Cache-Control and gzip for the read endpoints the analyzer polls
+http_cache = HttpCache(app, max_age=app.config['HTTP_CACHE_MAX_AGE'], min_size=app.config['COMPRESS_MIN_BYTES'])
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    current_route.set(request.url_rule.rule if request.url_rule is not None else 'unmatched')
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        metrics.requests.observe(time.perf_counter() - started, route=current_route.get(),
+                                 method=request.method, status=str(response.status_code))
+    return response
+
+# Product files, their columnar copies, the catalog, discovered schemas, file versions, trend
+# aggregates and the shared state, kept the same way as in the gradient-boosting app (app_common.py)
+data_service = DataService(app, metrics, invalidate_industry=lambda industry: invalidate_industry(industry))
+data_dir = data_service.data_dir
+columnar_store, dataset_cache, catalog = data_service.columnar_store, data_service.dataset_cache, data_service.catalog
+schemas, file_versions, trend_store = data_service.schemas, data_service.file_versions, data_service.trend_store
+factors, influencing_factors, target_variable = schemas.factors, schemas.influencing_factors, schemas.target_variable
+shared_state, state_lock, change_feed = data_service.shared_state, data_service.state_lock, data_service.change_feed
+declared_industries = data_service.declared_industries
+load_columns, load_tail = data_service.load_columns, data_service.load_tail
+get_industries, get_product_names, list_industries = data_service.get_industries, data_service.get_product_names, data_service.list_industries
+product_etag, industry_etag = data_service.product_etag, data_service.industry_etag
+describe_product, describe_products = data_service.describe_product, data_service.describe_products
+apply_schema, update_industry_schema = data_service.apply_schema, data_service.update_industry_schema
+update_declared_industries, publish_change = data_service.update_declared_industries, data_service.publish_change
+data_service.start()
+register_common_routes(app, data_service, http_cache)
 
 # -----------------------------------------------   python utility definitions -----------------------------------------------
 
-def return_response(*Value):
-    if len(Value) > 1:
-        response = make_response(Value[0], Value[1])
-    else:
-        response = make_response(Value[0])
-    response.headers['Content-Type'] = 'application/json; charset=utf-8'
-    return response 
-
-def get_industries():
-    data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
-    industries = [name for name in os.listdir(data_path) if os.path.isdir(os.path.join(data_path, name))]
-    return industries
-
-def load_factors_and_influencing_factors():
-    data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
-    industries = get_industries()
-    
-    factors = {}
-    influencing_factors = {}
-    target_variable = {}
-    
-    for industry in industries:
-        industry_path = os.path.join(data_path, industry)
-        csv_files = [f for f in os.listdir(industry_path) if f.endswith('.csv')]
-        
-        all_columns = set()
-        # for csv_file in csv_files:
-        file_path = os.path.join(industry_path, csv_files[0])
-        df = pd.read_csv(file_path)
-
-        # Select columns with numeric types only (integers and floats)
-        numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns
-        # Exclude datetime-like columns explicitly
-        non_date_numeric_cols = [col for col in numeric_cols if not pd.api.types.is_datetime64_any_dtype(df[col])]
-        all_columns.update(non_date_numeric_cols)
-
-        all_columns = list(all_columns)
-        if 'Sales Price' in all_columns:
-            influencing_columns = [col for col in all_columns if col != 'Sales Price']
-            factors[industry] = ['Sales Price'] + influencing_columns
-            influencing_factors[industry] = influencing_columns
-            target_variable[industry] = 'Sales Price'
-        else:
-            factors[industry] = all_columns
-            influencing_factors[industry] = all_columns
-            target_variable[industry] = 'Sales Price'  # Or handle the absence of 'Sales Price' appropriately
-
-    return factors, influencing_factors, target_variable
-
-# Generate the dictionaries
-factors, influencing_factors, target_variable = load_factors_and_influencing_factors()
-
 # Dictionary to store the last hash of each file and the corresponding coefficients
 file_hashes = {}
 coefficients = {}
+model_registry = ModelRegistry(app.config['MODEL_REGISTRY_DIR'])
 
-def calculate_file_hash(file_path):
-    with open(file_path, 'rb') as f:
-        file_hash = hashlib.md5()
-        while chunk := f.read(8192):
-            file_hash.update(chunk)
-    return file_hash.hexdigest()
+# Per-product Ridge sufficient statistics: (industry, product) -> (file version, factor tuple, RidgeStats)
+ridge_stats = {}
+# Serialises appends so the file, its hash and the statistics move together
+append_lock = threading.Lock()
+# Per-product SVDs for alpha selection, least recently used first: (industry, product) -> (file version, factor tuple, RidgePath)
+ridge_paths = OrderedDict()
+ridge_paths_lock = threading.Lock()
 
-def get_ridge_coefficients(df, industry):
+def get_ridge_coefficients(df, industry, alpha=1.0):
     X = df[influencing_factors[industry]]
     y = df[target_variable[industry]]
-    model = Ridge()
-    model.fit(X, y)
+    model = Ridge(alpha=alpha)
+    with metrics.stage('fit'):
+        model.fit(X, y)
     coefs = model.coef_
     const_coef = model.intercept_
     return coefs, const_coef
 
-# Global list to keep track of industries
-changed_industries = get_industries()
+def get_ridge_stats(industry, product, file_path, version):
+    feature_names = tuple(influencing_factors[industry])
+    entry = ridge_stats.get((industry, product))
+    if entry is not None and entry[0] == version and entry[1] == feature_names:
+        return entry[2]
+    df = dataset_cache.get(file_path, list(feature_names) + [target_variable[industry]])
+    stats = RidgeStats.from_arrays(df[list(feature_names)], df[target_variable[industry]])
+    ridge_stats[(industry, product)] = (version, feature_names, stats)
+    return stats
+
+def get_ridge_path(industry, product, file_path, version):
+    feature_names = tuple(influencing_factors[industry])
+    with ridge_paths_lock:
+        entry = ridge_paths.get((industry, product))
+        if entry is not None and entry[0] == version and entry[1] == feature_names:
+            ridge_paths.move_to_end((industry, product))
+            return entry[2]
+    df = dataset_cache.get(file_path, list(feature_names) + [target_variable[industry]])
+    with metrics.stage('svd'):
+        path = RidgePath(df[list(feature_names)], df[target_variable[industry]])
+    with ridge_paths_lock:
+        ridge_paths[(industry, product)] = (version, feature_names, path)
+        ridge_paths.move_to_end((industry, product))
+        while len(ridge_paths) > app.config['RIDGE_PATH_CACHE_SIZE']:
+            ridge_paths.popitem(last=False)
+    return path
+
+def choose_alpha(industry, product, file_path, version):
+    # (alpha, RidgePath or None): the configured alpha, or the grid value with the
+    # lowest GCV / leave-one-out error computed from the product's SVD
+    selection = app.config['RIDGE_ALPHA_SELECTION']
+    if not selection:
+        return app.config['RIDGE_ALPHA'], None
+    path = get_ridge_path(industry, product, file_path, version)
+    alpha, _ = path.select(app.config['RIDGE_ALPHAS'], selection)
+    return alpha, path
+
+def carried_alpha(industry, product):
+    # Incremental refits (appends, uploads) keep the product's last alpha; the next
+    # full fit or /refresh selects it again
+    if not app.config['RIDGE_ALPHA_SELECTION']:
+        return app.config['RIDGE_ALPHA']
+    return float(coefficients.get((industry, product), {}).get('alpha', app.config['RIDGE_ALPHA']))
+
+def registry_kind():
+    # Registry entries fitted under another alpha setting never match
+    if app.config['RIDGE_ALPHA_SELECTION']:
+        return f"ridge-{app.config['RIDGE_ALPHA_SELECTION']}"
+    return 'ridge' if app.config['RIDGE_ALPHA'] == 1.0 else f"ridge-alpha{app.config['RIDGE_ALPHA']:g}"
+
+def compute_default_factors(df, industry, window=30):
+    factors_val = factors.get(industry, [])
+    numeric_df = df[factors_val].iloc[-window:].copy()
+    df_mean = numeric_df.mean()  # Mean over the last `window` rows
+    return [round(df_mean[factor].item(), 2) if isinstance(df_mean[factor], (np.integer, np.floating)) else df_mean[factor] for factor in factors_val if factor in df_mean]
+
+def compute_industry_defaults(industry, products, window=30):
+    # Last-`window`-row means for many products in one vectorized groupby
+    factors_val = factors.get(industry, [])
+    frames, errors = {}, {}
+    for product in products:
+        try:
+            frames[product] = load_tail(os.path.join(data_dir, industry, f'{product}.csv'), factors_val, window)
+        except FileNotFoundError:
+            errors[product] = f"Product file {product}.csv not found in {industry}"
+        except KeyError as ke:
+            errors[product] = str(ke)
+    if not frames:
+        return {}, errors
+
+    means = pd.concat(frames, names=['product', 'row']).groupby(level='product', sort=False).mean().round(2)
+    sales_price = means['Sales Price'] if 'Sales Price' in means else np.nan
+    cog = means['COG'] if 'COG' in means else np.nan
+    margins = ((sales_price - cog) / sales_price) * 100
+
+    defaults = {}
+    for product, row in means.iterrows():
+        margin = margins[product] if isinstance(margins, pd.Series) else np.nan
+        defaults[product] = {
+            'defaults': [None if pd.isna(value) else value.item() for value in row.to_numpy()],
+            'sales_price': None if pd.isna(row.get('Sales Price', np.nan)) else float(row['Sales Price']),
+            'margin': None if pd.isna(margin) or np.isinf(margin) else float(margin),
+        }
+    return defaults, errors
+
+def ensure_coefficients(industry, product):
+    # Refit only when the product file changed since the last fit
+    file_path = os.path.join(data_dir, industry, f'{product}.csv')
+    current_hash = file_versions.version(file_path)
+
+    if file_path not in file_hashes or file_hashes[file_path] != current_hash:
+        if industry not in influencing_factors:
+            raise KeyError(f"Industry '{industry}' not found in influencing_factors")
+
+        # A fit persisted by an earlier process is reused if version and factors still match
+        stored = model_registry.load(industry, product, current_hash, influencing_factors[industry], kind=registry_kind())
+        decision = 'registry'
+        if stored is None:
+            decision = 'fit'
+            started = time.perf_counter()
+            alpha, path = choose_alpha(industry, product, file_path, current_hash)
+            if path is None:
+                df = dataset_cache.get(file_path, influencing_factors[industry] + [target_variable[industry]])
+                coefs, const_coef = get_ridge_coefficients(df, industry, alpha)
+            else:
+                coefs, const_coef = path.coefficients(alpha)
+            stored = dict(zip(influencing_factors[industry], coefs))
+            stored['const'] = const_coef  # Add the constant term to the coefficients
+            stored['alpha'] = alpha
+            metrics.fits.observe(time.perf_counter() - started, industry=industry, product=product, model='ridge')
+            model_registry.save(industry, product, current_hash, influencing_factors[industry], stored, kind=registry_kind())
+        store_coefficients(industry, product, file_path, current_hash, stored, fitted=decision == 'fit')
+    else:
+        decision = 'hit'
+
+    metrics.coefficient_lookups.inc(industry=industry, product=product, result=decision)
+    app.logger.info("coefficients %s/%s: %s (version %s)", industry, product, decision, current_hash[:12])
+    return coefficients[(industry, product)]
+
+def warm_up_models():
+    # Load or fit every product so the first requests after a deploy hit memory
+    for industry in get_industries():
+        try:
+            products = get_product_names(industry)
+        except FileNotFoundError:
+            continue
+        for product in products:
+            try:
+                ensure_coefficients(industry, product)
+            except Exception as e:
+                app.logger.warning("Warm-up failed for %s/%s: %s", industry, product, e)
+
+if app.config['MODEL_WARMUP']:
+    threading.Thread(target=warm_up_models, name='model-warmup', daemon=True).start()
+
+def invalidate_industry(industry):
+    # Drop everything derived from an industry's files or factor list
+    dataset_cache.invalidate_prefix(os.path.join(data_dir, industry))
+    file_versions.forget_prefix(os.path.join(data_dir, industry))
+    trend_store.forget_prefix(os.path.join(data_dir, industry))
+    for key in [key for key in coefficients if key[0] == industry]:
+        coefficients.pop(key, None)
+    for key in [key for key in ridge_stats if key[0] == industry]:
+        ridge_stats.pop(key, None)
+    with ridge_paths_lock:
+        for key in [key for key in ridge_paths if key[0] == industry]:
+            ridge_paths.pop(key, None)
+    industry_prefix = os.path.join(data_dir, industry, '')
+    for path in [path for path in file_hashes if path.startswith(industry_prefix)]:
+        file_hashes.pop(path, None)
+
+# Shared state version this worker has applied
+state_version = 0
+
+@app.before_request
+def sync_shared_state():
+    global state_version
+    if shared_state.version() == state_version:
+        return
+    with state_lock:
+        changes = shared_state.changes(state_version)
+        for industry, schema in changes['schemas'].items():
+            apply_schema(industry, schema)
+        declared_industries[:] = changes['values'].get('declared_industries', declared_industries) or []
+        for (industry, product), (file_path, version, coefs, kind) in changes['coefficients'].items():
+            # Coefficients fitted under another alpha setting are refitted, not served
+            if coefs is None or kind != registry_kind():
+                coefficients.pop((industry, product), None)
+                file_hashes.pop(file_path, None)
+            else:
+                coefficients[(industry, product)] = coefs
+                file_hashes[file_path] = version
+        state_version = changes['version']
+
+def store_coefficients(industry, product, file_path, version, coefs, fitted=True):
+    # fitted=False for coefficients loaded from the registry rather than fitted now
+    coefficients[(industry, product)] = coefs
+    file_hashes[file_path] = version
+    shared_state.set_coefficients(industry, product, file_path, version, coefs, kind=registry_kind())
+    if fitted:
+        catalog.record_fits([(industry, product, version)])
+
+def store_many_coefficients(entries):
+    # entries: (industry, product, file_path, version, coefs), published in one shared-state write
+    for industry, product, file_path, version, coefs in entries:
+        coefficients[(industry, product)] = coefs
+        file_hashes[file_path] = version
+    shared_state.set_many_coefficients(entries, kind=registry_kind())
+    catalog.record_fits([(industry, product, version) for industry, product, _, version, _ in entries])
+
+sync_shared_state()
 
 def custom_secure_filename(filename):
     filename = re.sub(r'[^a-zA-Z0-9\s_.-]', '', filename).strip()
     filename = re.sub(r'\s+', ' ', filename)
     return filename
 
-def update_factors_and_influencing_factors(industry, file_path):
-    df = pd.read_csv(file_path)
-    numeric_columns = df.select_dtypes(include=['float64', 'int64']).columns.tolist()
-    non_date_numeric_cols = [col for col in numeric_columns if not pd.api.types.is_datetime64_any_dtype(df[col])]
-    target_var = 'Sales Price'  # Default target variable
-
-    # Update the dictionaries
-    factors[industry] = [target_var] + non_date_numeric_cols
-    influencing_factors[industry] = non_date_numeric_cols
-    target_variable[industry] = target_var
-
+def publish_upload(industry, product, file_path, ingest):
+    # Swap the uploaded file in and seed what is derived from it with the
+    # statistics gathered while it streamed in, so nothing re-reads it
+    with append_lock:
+        ingest.commit()
+        dataset_cache.invalidate(file_path)
+        if not ingest.validate_schema:
+            # A new industry: the upload defines its factors
+            update_industry_schema(industry, lambda current: ingest.schema)
+            publish_change('industry-added', industry)
+        version = file_versions.record(file_path, ingest.hasher)
+        metrics.record_read('upload', ingest.rows, ingest.total_bytes or 0)
+        describe_product(industry, product)
+        publish_change('file', industry, product, file_version=version)
+        if ingest.trend is not None:
+            trend_store.seed(file_path, version, ingest.trend_by, ingest.trend)
+        if ingest.ridge is not None:
+            feature_names = ingest.schema[1]
+            ridge_stats[(industry, product)] = (version, tuple(feature_names), ingest.ridge)
+            alpha = carried_alpha(industry, product)
+            coefs, const_coef = ingest.ridge.solve(alpha)
+            fitted = dict(zip(feature_names, coefs))
+            fitted['const'] = const_coef
+            fitted['alpha'] = alpha
+            model_registry.save(industry, product, version, feature_names, fitted, kind=registry_kind())
+            store_coefficients(industry, product, file_path, version, fitted)
 
 # -----------------------------------------------   Flask Route definitions -----------------------------------------------
 
 @app.route('/', methods=['GET', 'POST'])
 def iex():
-    global changed_industries
-    industries = changed_industries if changed_industries else get_industries()
+    industries = list_industries()
+    schemas.load_all(industries)
     return render_template('new.html',  industries=industries, factors=factors, influencing_factors=influencing_factors)
 
 @app.route('/analyze')
 def index():
-    global changed_industries
-    industries = changed_industries if changed_industries else get_industries()
+    industries = list_industries()
+    schemas.load_all(industries)
     return render_template('new1.html', industries=industries, factors=factors, influencing_factors=influencing_factors)
 
 @app.route('/update-industries', methods=['POST'])
 def update_industries():
-    global changed_industries
     new_industry = request.json.get('new_industry')
     columns = request.json.get('columns')
     inF= request.json.get('inF')  ## inF is influencing factors.
     target_var = request.json.get('target_var')
     if new_industry and columns:
-        changed_industries.append(new_industry)
-        factors[new_industry] = [target_var] + columns
-        influencing_factors[new_industry] = inF
+        update_industry_schema(new_industry, lambda current: ([target_var] + columns, inF, target_var))
+        update_declared_industries(lambda names: names if new_industry in names else names + [new_industry])
         return {'success': True}
     return {'success': False}, 400
 
@@ -159,33 +375,55 @@ def upload_csv():
     industry_path = os.path.join(app.config['UPLOAD_FOLDER'], industry_name)
     if not os.path.exists(industry_path):
         os.makedirs(industry_path)
+        catalog.add_industry(industry_name)
     
-    # Save the file
     filename = custom_secure_filename(file.filename)
     file_path = os.path.join(industry_path, filename)
-    file.save(file_path)
-
-    # Update the factors and influencing factors for the new industry
-    update_factors_and_influencing_factors(industry_name, file_path)
-    
-    return jsonify(success=True, message="File uploaded successfully")
+    product = os.path.splitext(filename)[0]
+
+    # Uploads to an existing industry must carry its factors
+    schema = None
+    if industry_name in factors:
+        schema = (factors[industry_name], influencing_factors[industry_name], target_variable[industry_name])
+    stream = detach_stream(file.stream)
+    ingest = CsvIngest(stream, file_path, schema=schema, chunk_rows=app.config['UPLOAD_CHUNK_ROWS'],
+                       columnar_store=columnar_store)
+
+    def run():
+        try:
+            yield from ingest.run()
+            publish_upload(industry_name, product, file_path, ingest)
+        except UploadRejected as e:
+            yield {'success': False, 'message': str(e)}
+            return
+        finally:
+            stream.close()
+        yield {'success': True, 'message': "File uploaded successfully", 'rows': ingest.rows,
+               'means': {col: round(value, 2) for col, value in ingest.means.items()}}
+
+    # Clients that ask for it get one JSON line per parsed chunk, then the result
+    if wants_progress():
+        return Response(stream_with_context(json.dumps(event) + '\n' for event in run()), mimetype='application/x-ndjson')
+    for result in run():
+        pass
+    return jsonify(**result)
 
 @app.route('/update-columns', methods=['POST'])
 def update_columns():
-    global factors
     data = request.json
     industry = data.get('industry')
     new_column = data.get('columns')  ##  same for the inF, which is influencing_factors[selectedIndustry].
     if industry and new_column:
-        if industry in factors:
-            existing_columns = set(factors[industry])
-            if new_column not in existing_columns:
-                factors[industry].append(new_column)
-                influencing_factors[industry].append(new_column)
-        else:
+        def add_column(current):
+            if current is not None:
+                factors_val, influencing, target = current
+                existing_columns = set(factors_val)
+                if new_column not in existing_columns:
+                    return factors_val + [new_column], influencing + [new_column], target
+                return current
             gl_target_var = ['Sales Price']
-            factors[industry] = gl_target_var + new_column
-            influencing_factors[industry] = new_column
+            return gl_target_var + new_column, new_column, gl_target_var[0]
+        update_industry_schema(industry, add_column)
         return {'success': True}
     return {'success': False}, 400
 
@@ -199,8 +437,9 @@ def delete_columns():
         return jsonify(success=False, message="Industry does not exist")
     
     if columns_to_delete:
-        factors[industry] = [col for col in factors[industry] if col not in columns_to_delete]
-        influencing_factors[industry] = [col for col in influencing_factors[industry] if col not in columns_to_delete]
+        update_industry_schema(industry, lambda current: ([col for col in current[0] if col not in columns_to_delete],
+                                                          [col for col in current[1] if col not in columns_to_delete],
+                                                          current[2]))
     else:
         return jsonify(success=False, message="No columns specified for deletion")
     
@@ -208,46 +447,67 @@ def delete_columns():
 
 @app.route('/delete-industry', methods=['POST'])
 def delete_industry():
-    global changed_industries
     data = request.json
     industry = data.get('industry')
     
     if industry not in factors:
         return jsonify(success=False, message="Industry does not exist")
     
-    industries = get_industries()
-    industries.remove(industry)
-    changed_industries.remove(industry)
-    factors.pop(industry, None)
-    influencing_factors.pop(industry, None)
-    
     # Delete industry directory
     industry_dir = os.path.join(data_dir, industry)
     if os.path.exists(industry_dir):
         shutil.rmtree(industry_dir)
+    update_industry_schema(industry, lambda current: None)
+    catalog.remove_industry(industry)
+    update_declared_industries(lambda names: [name for name in names if name != industry])
+    model_registry.discard(industry)
     
     return jsonify(success=True)
 
 @app.route('/data/<industry>', methods=['GET'])
+@http_cache.conditional(lambda industry: make_etag(catalog_page_args(), get_product_names(industry, *catalog_page_args())))
 def get_products(industry):
-    data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', industry)
+    # Product names in order; ?prefix= narrows them, ?limit= / ?offset= page through them
     try:
-        products = [f.split('.')[0] for f in os.listdir(data_path) if f.endswith('.csv')]
+        prefix, limit, offset = catalog_page_args()
+        products = get_product_names(industry, prefix, limit, offset)
         response = return_response(jsonify(products))
+        response.headers['X-Total-Count'] = str(catalog.count_products(industry, prefix))
+        return response
+    except ValueError as ve:
+        response = return_response(jsonify({"error": str(ve)}), 400)
         return response
     except FileNotFoundError:
         response = return_response(jsonify({"error": f"Industry directory {industry} not found"}), 404)
         return response
 
+@app.route('/data/<industry>/defaults', methods=['GET'])
+@http_cache.conditional(lambda industry: industry_etag(industry, request.args.get('window', app.config['DEFAULTS_WINDOW'])))
+def get_industry_defaults(industry):
+    industry = unquote(industry)  # Decode the industry name
+
+    window = request.args.get('window', app.config['DEFAULTS_WINDOW'], type=int)
+    if window is None or window <= 0:
+        response = return_response(jsonify({"error": "window must be a positive integer"}), 400)
+        return response
+    try:
+        products = get_product_names(industry)
+    except FileNotFoundError:
+        response = return_response(jsonify({"error": f"Industry directory {industry} not found"}), 404)
+        return response
+
+    defaults, errors = compute_industry_defaults(industry, products, window)
+    response = return_response(jsonify({'factors': factors.get(industry, []), 'window': window,
+                                        'products': defaults, 'errors': errors}))
+    return response
+
 @app.route('/data/<industry>/<product>', methods=['GET'])
+@http_cache.conditional(lambda industry, product: product_etag(industry, product, app.config['DEFAULTS_WINDOW']))
 def get_default_factors(industry, product):
-    file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', industry, f'{product}.csv')
+    file_path = os.path.join(data_dir, industry, f'{product}.csv')
     try:
-        df = pd.read_csv(file_path)
-        factors_val = factors.get(industry, [])
-        numeric_df = df[factors_val].iloc[-30:].copy()
-        df_mean = numeric_df.mean()  # Get the last 30 rows
-        default_factors = [round(df_mean[factor].item(), 2) if isinstance(df_mean[factor], (np.integer, np.floating)) else df_mean[factor] for factor in factors_val if factor in df_mean]
+        df = load_tail(file_path, factors.get(industry, []), app.config['DEFAULTS_WINDOW'])
+        default_factors = compute_default_factors(df, industry, app.config['DEFAULTS_WINDOW'])
         response = return_response(jsonify(default_factors))
         return response
     except FileNotFoundError:
@@ -258,27 +518,89 @@ def get_default_factors(industry, product):
         return response
 
 
-@app.route('/coefficients/<industry>/<product>', methods=['GET', 'POST'])
-def get_coefficients(industry, product):
+@app.route('/data/<industry>/<product>/rows', methods=['POST'])
+def append_rows(industry, product):
     industry = unquote(industry)  # Decode the industry name
 
     file_path = os.path.join(data_dir, industry, f'{product}.csv')
-    
+    payload = request.get_json(silent=True) or {}
+    rows = payload.get('rows')
+    if not rows or not isinstance(rows, list):
+        response = return_response(jsonify({"error": "No rows provided"}), 400)
+        return response
+    if industry not in influencing_factors:
+        response = return_response(jsonify({"error": f"Industry '{industry}' not found in influencing_factors"}), 400)
+        return response
+
+    feature_names = influencing_factors[industry]
+    target = target_variable[industry]
     try:
-        current_hash = calculate_file_hash(file_path)
-        
-        if file_path not in file_hashes or file_hashes[file_path] != current_hash:
-            df = pd.read_csv(file_path)
+        new_rows = pd.DataFrame(rows)
+        with append_lock:
+            header = pd.read_csv(file_path, nrows=0).columns.tolist()
+            unknown = [col for col in new_rows.columns if col not in header]
+            if unknown:
+                raise ValueError(f"Unknown columns: {', '.join(map(str, unknown))}")
+            missing = [col for col in feature_names + [target] if col not in new_rows.columns or new_rows[col].isna().any()]
+            if missing:
+                raise ValueError(f"Missing values for: {', '.join(missing)}")
+            X_new = new_rows[feature_names].apply(pd.to_numeric).to_numpy(dtype=np.float64)
+            y_new = pd.to_numeric(new_rows[target]).to_numpy(dtype=np.float64)
+
+            # Statistics must describe the file as it is before the append
+            previous_key = stat_key(file_path)
+            previous_version = file_versions.version(file_path)
+            stats = get_ridge_stats(industry, product, file_path, previous_version)
+
+            # Match the file's line endings and terminate a dangling last line
+            with open(file_path, 'rb') as f:
+                size = f.seek(0, os.SEEK_END)
+                f.seek(max(size - 2, 0))
+                tail = f.read()
+            newline = '\r\n' if tail.endswith(b'\r\n') else '\n'
+            data = new_rows.reindex(columns=header).to_csv(header=False, index=False, lineterminator=newline).encode('utf-8')
+            if tail and not tail.endswith(b'\n'):
+                data = newline.encode('utf-8') + data
+            with open(file_path, 'ab') as f:
+                f.write(data)
+
+            new_version = file_versions.record_append(file_path, data, previous_key) or file_versions.version(file_path)
+            years = pd.to_numeric(new_rows['Year'], errors='coerce') if 'Year' in new_rows else None
+            catalog.record_append(industry, product, stat_key(file_path), new_version, len(new_rows),
+                                  (None, None) if years is None or years.isna().all() else (float(years.min()), float(years.max())))
+            publish_change('file', industry, product, file_version=new_version)
+            stats.update(X_new, y_new)
+            trend_store.append(file_path, previous_version, new_version, new_rows.assign(**{target: y_new}))
+            ridge_stats[(industry, product)] = (new_version, tuple(feature_names), stats)
+
+            alpha = carried_alpha(industry, product)
+            coefs, const_coef = stats.solve(alpha)
+            fitted = dict(zip(feature_names, coefs))
+            fitted['const'] = const_coef
+            fitted['alpha'] = alpha
+            model_registry.save(industry, product, new_version, feature_names, fitted, kind=registry_kind())
+            store_coefficients(industry, product, file_path, new_version, fitted)
+
+        response = return_response(jsonify({'success': True, 'appended': len(new_rows), 'rows': stats.n,
+                                            'coefficients': coefficients[(industry, product)]}))
+        return response
+    except FileNotFoundError:
+        response = return_response(jsonify({"error": f"Product file {product}.csv not found in {industry}"}), 404)
+        return response
+    except (KeyError, ValueError, TypeError) as e:
+        response = return_response(jsonify({"error": str(e)}), 400)
+        return response
+    except Exception as e:
+        response = return_response(jsonify({"error": str(e)}), 500)
+        return response
 
-            if industry not in influencing_factors:
-                raise KeyError(f"Industry '{industry}' not found in influencing_factors")
+@app.route('/coefficients/<industry>/<product>', methods=['GET', 'POST'])
+@http_cache.conditional(lambda industry, product: product_etag(industry, product, registry_kind(), app.config['RIDGE_ALPHAS']))
+def get_coefficients(industry, product):
+    industry = unquote(industry)  # Decode the industry name
 
-            coefs, const_coef = get_ridge_coefficients(df, industry)
-            coefficients[(industry, product)] = dict(zip(influencing_factors[industry], coefs))
-            coefficients[(industry, product)]['const'] = const_coef  # Add the constant term to the coefficients
-            file_hashes[file_path] = current_hash
-        
-        response = return_response(jsonify(coefficients[(industry, product)]))
+    try:
+        response = return_response(jsonify(ensure_coefficients(industry, product)))
         return response
     except FileNotFoundError:
         response = return_response(jsonify({"error": f"Product file {product}.csv not found in {industry}"}), 404)
@@ -290,21 +612,405 @@ def get_coefficients(industry, product):
         response = return_response(jsonify({"error": str(e)}), 500)
         return response
 
-@app.route('/sales_trend/<industry>/<product>', methods=['POST'])
-def sales_trend(industry, product):
+@app.route('/coefficients/<industry>/<product>/rolling', methods=['GET'])
+@http_cache.conditional(lambda industry, product: product_etag(industry, product, request.args.to_dict(),
+                                                               carried_alpha(unquote(industry), product)))
+def get_rolling_coefficients(industry, product):
+    # Ridge coefficients over sliding windows of ?window= rows, ?step= rows apart (1 by
+    # default), with rows ordered by Year and then file order. ?alpha= overrides the
+    # product's current alpha. Series are returned per factor, one value per window.
     industry = unquote(industry)  # Decode the industry name
 
+    window = request.args.get('window', type=int)
+    step = request.args.get('step', 1, type=int)
+    if window is None or window < 2 or step is None or step < 1:
+        response = return_response(jsonify({"error": "window must be an integer of at least 2 and step a positive integer"}), 400)
+        return response
+    alpha = request.args.get('alpha', type=float)
+    if 'alpha' in request.args and (alpha is None or not np.isfinite(alpha) or alpha < 0):
+        response = return_response(jsonify({"error": "alpha must be a non-negative number"}), 400)
+        return response
+    if industry not in influencing_factors:
+        response = return_response(jsonify({"error": f"Industry '{industry}' not found in influencing_factors"}), 400)
+        return response
+
+    feature_names = influencing_factors[industry]
+    target = target_variable[industry]
     file_path = os.path.join(data_dir, industry, f'{product}.csv')
     try:
-        df = pd.read_csv(file_path)
-        # Group by Year and calculate average Sales Price
-        trend_data = df.groupby('Year')['Sales Price'].mean().reset_index()
-
-        # Convert to dictionary for JSON response
-        trend_dict = trend_data.to_dict(orient='records')
-        
-        return jsonify(trend_dict)
+        if alpha is None:
+            alpha = carried_alpha(industry, product)
+        ordered = 'Year' in factors.get(industry, [])
+        df = dataset_cache.get(file_path, list(dict.fromkeys(feature_names + [target] + (['Year'] if ordered else []))))
+        if ordered:
+            df = df.iloc[np.argsort(df['Year'].to_numpy(), kind='stable')]
+        # Rows with a missing factor or target are left out
+        df = df[df[feature_names + [target]].notna().all(axis=1).to_numpy()]
+        n = len(df)
+        if window > n:
+            raise ValueError(f"window is larger than the product's {n} rows")
+        count = (n - window) // step + 1
+        if count > app.config['ROLLING_MAX_WINDOWS']:
+            raise ValueError(f"{count} windows requested, at most {app.config['ROLLING_MAX_WINDOWS']}; use a larger step")
+
+        started = time.perf_counter()
+        with metrics.stage('fit'):
+            starts, coefs, const_coefs = rolling_coefficients(df[feature_names], df[target], window, step, alpha)
+        metrics.fits.observe(time.perf_counter() - started, industry=industry, product=product, model='ridge-rolling')
+
+        windows = {'start': starts.tolist(), 'end': (starts + window).tolist()}
+        if ordered:
+            years = df['Year'].to_numpy()
+            windows['year_from'] = [value.item() if isinstance(value, np.generic) else value for value in years[starts]]
+            windows['year_to'] = [value.item() if isinstance(value, np.generic) else value for value in years[starts + window - 1]]
+        series = {name: matrix_to_json(coefs[:, i]) for i, name in enumerate(feature_names)}
+        series['const'] = matrix_to_json(const_coefs)
+        response = return_response(jsonify({'window': window, 'step': step, 'alpha': alpha, 'rows': n,
+                                            'order': 'Year' if ordered else 'row', 'windows': windows, 'coefficients': series}))
+        return response
+    except FileNotFoundError:
+        response = return_response(jsonify({"error": f"Product file {product}.csv not found in {industry}"}), 404)
+        return response
+    except (KeyError, ValueError, np.linalg.LinAlgError) as e:
+        response = return_response(jsonify({"error": str(e)}), 400)
+        return response
     except Exception as e:
+        response = return_response(jsonify({"error": str(e)}), 500)
+        return response
+
+def refresh_industry_coefficients(industry, products=None, force=False):
+    # Refit every stale product of an industry together: each product's Ridge
+    # sufficient statistics (kept across appends and uploads), then one batched
+    # solve for all of them. force=True refits products that are up to date too.
+    feature_names = influencing_factors[industry]
+    if products is None:
+        products = get_product_names(industry)
+    stale, stats, alphas, unchanged, errors = [], [], [], [], {}
+    for product in products:
+        file_path = os.path.join(data_dir, industry, f'{product}.csv')
+        try:
+            version = file_versions.version(file_path)
+            if not force and file_hashes.get(file_path) == version and (industry, product) in coefficients:
+                unchanged.append(product)
+                continue
+            product_stats = get_ridge_stats(industry, product, file_path, version)
+            alpha, _ = choose_alpha(industry, product, file_path, version)
+        except FileNotFoundError:
+            errors[product] = f"Product file {product}.csv not found in {industry}"
+            continue
+        except (KeyError, TypeError, ValueError) as e:
+            errors[product] = str(e)
+            continue
+        if product_stats.n == 0 or not (np.isfinite(product_stats.sxx).all() and np.isfinite(product_stats.sxy).all()):
+            errors[product] = "Input contains NaN or no rows"
+            continue
+        stale.append((product, file_path, version))
+        stats.append(product_stats)
+        alphas.append(alpha)
+
+    entries = []
+    if stale:
+        started = time.perf_counter()
+        with metrics.stage('fit'):
+            coefs, const_coefs = solve_batch(stats, alphas)
+        seconds = time.perf_counter() - started
+        for (product, file_path, version), row, const_coef, alpha in zip(stale, coefs, const_coefs, alphas):
+            fitted = dict(zip(feature_names, row))
+            fitted['const'] = const_coef  # Add the constant term to the coefficients
+            fitted['alpha'] = alpha
+            model_registry.save(industry, product, version, feature_names, fitted, kind=registry_kind())
+            entries.append((industry, product, file_path, version, fitted))
+            metrics.fits.observe(seconds / len(stale), industry=industry, product=product, model='ridge-batch')
+            metrics.coefficient_lookups.inc(industry=industry, product=product, result='batch')
+        store_many_coefficients(entries)
+        app.logger.info("coefficients %s: batch refit of %d products in %.1f ms", industry, len(stale), seconds * 1000)
+    return {
+        'refreshed': {product: fitted for _, product, _, _, fitted in entries},
+        'unchanged': unchanged,
+        'errors': errors,
+    }
+
+@app.route('/coefficients/<industry>/refresh', methods=['POST'])
+def refresh_coefficients(industry):
+    # {"products": [...], "force": false}; without products, every product of the industry
+    industry = unquote(industry)  # Decode the industry name
+
+    if industry not in influencing_factors:
+        response = return_response(jsonify({"error": f"Industry '{industry}' not found in influencing_factors"}), 400)
+        return response
+
+    payload = request.get_json(silent=True) or {}
+    products = payload.get('products')
+    if products is not None and (not isinstance(products, list) or not all(isinstance(p, str) for p in products)):
+        response = return_response(jsonify({"error": "products must be a list of product names"}), 400)
+        return response
+    try:
+        result = refresh_industry_coefficients(industry, products, bool(payload.get('force', False)))
+    except FileNotFoundError:
+        response = return_response(jsonify({"error": f"Industry '{industry}' has no data directory"}), 404)
+        return response
+    response = return_response(jsonify(result))
+    return response
+
+def collect_pricing_inputs(industry, requested):
+    # Coefficients, default factor values (with overrides) and margins for the requested
+    # products, stacked one row per product. Accepts {"p1": {...}}, [{"product": "p1", ...}]
+    # or ["p1", ...]; None means every product of the industry.
+    requested = parse_product_requests(get_product_names(industry) if requested is None else requested)
+
+    feature_names = influencing_factors[industry]
+    names, coef_dicts, factor_rows, sales_prices, cogs, margins = [], [], [], [], [], []
+    errors = {}
+    for product, overrides in requested.items():
+        try:
+            weights = ensure_coefficients(industry, product)
+            df = load_tail(os.path.join(data_dir, industry, f'{product}.csv'), factors.get(industry, []), app.config['DEFAULTS_WINDOW'])
+            values = dict(zip(factors.get(industry, []), compute_default_factors(df, industry, app.config['DEFAULTS_WINDOW'])))
+            values.update({factor: float(value) for factor, value in overrides['factors'].items() if value is not None})
+        except FileNotFoundError:
+            errors[product] = f"Product file {product}.csv not found in {industry}"
+            continue
+        except (KeyError, TypeError, ValueError) as e:
+            errors[product] = str(e)
+            continue
+
+        names.append(product)
+        coef_dicts.append(weights)
+        factor_rows.append([float(values.get(factor, np.nan)) for factor in feature_names])
+        sales_prices.append(values.get('Sales Price', np.nan))
+        cogs.append(values.get('COG', np.nan))
+        margins.append(np.nan if overrides['margin'] is None else overrides['margin'])
+
+    coef_matrix, intercepts = stack_coefficients(coef_dicts, feature_names)
+    return {
+        'products': names,
+        'errors': errors,
+        'feature_names': feature_names,
+        'coef_matrix': coef_matrix,
+        'intercepts': intercepts,
+        'factor_matrix': np.array(factor_rows, dtype=np.float64).reshape(len(names), len(feature_names)),
+        'sales_prices': np.array(sales_prices, dtype=np.float64),
+        'cogs': np.array(cogs, dtype=np.float64),
+        'margins': np.array(margins, dtype=np.float64),
+    }
+
+def matrix_to_json(values, decimals=None):
+    # Nested lists with NaN/inf as null
+    if decimals is not None:
+        values = np.round(values, decimals)
+    out = values.astype(object)
+    out[~np.isfinite(values)] = None
+    return out.tolist()
+
+@app.route('/price/<industry>', methods=['POST'])
+def price_products(industry):
+    industry = unquote(industry)  # Decode the industry name
+
+    if industry not in influencing_factors:
+        response = return_response(jsonify({"error": f"Industry '{industry}' not found in influencing_factors"}), 400)
+        return response
+
+    payload = request.get_json(silent=True) or {}
+    try:
+        if not isinstance(payload, dict):
+            raise TypeError("Request body must be a JSON object")
+        inputs = collect_pricing_inputs(industry, payload.get('products'))
+        names, errors = inputs['products'], inputs['errors']
+
+        prices = {}
+        if names:
+            dynamic, margin = margin_adjusted_prices(base_prices(inputs['coef_matrix'], inputs['intercepts'], inputs['factor_matrix']),
+                                                     inputs['sales_prices'], inputs['cogs'], inputs['margins'])
+            prices = {name: {'dynamic_price': float(dynamic[i]) if np.isfinite(dynamic[i]) else None,
+                             'margin': float(margin[i]) if np.isfinite(margin[i]) else None}
+                      for i, name in enumerate(names)}
+
+        response = return_response(jsonify({'prices': prices, 'errors': errors}))
+        return response
+    except (KeyError, TypeError, ValueError) as e:
         response = return_response(jsonify({"error": str(e)}), 400)
         return response
+    except Exception as e:
+        response = return_response(jsonify({"error": str(e)}), 500)
+        return response
 
+@app.route('/simulate/<industry>', methods=['POST'])
+def simulate_scenarios(industry):
+    # What-if sweep: every scenario (a target margin and/or percentage shocks to
+    # influencing factors) priced for every product in one broadcast computation.
+    #   {"products": [...], "margins": [10, 20] | {"start", "stop", "step"},
+    #    "shocks": {"Comp Price": [-10, 0, 10], ...}}      -> full grid
+    #   {"products": [...], "scenarios": [{"margin": 25, "shocks": {"COG": 5}}, ...]}
+    industry = unquote(industry)  # Decode the industry name
+
+    if industry not in influencing_factors:
+        response = return_response(jsonify({"error": f"Industry '{industry}' not found in influencing_factors"}), 400)
+        return response
+
+    payload = request.get_json(silent=True) or {}
+    feature_names = influencing_factors[industry]
+    try:
+        if not isinstance(payload, dict):
+            raise TypeError("Request body must be a JSON object")
+        if payload.get('scenarios') is not None:
+            if payload.get('margins') is not None or payload.get('shocks') is not None:
+                raise ValueError("Give either scenarios or margins/shocks, not both")
+            scenarios = payload['scenarios']
+            if not isinstance(scenarios, list) or not scenarios:
+                raise ValueError("scenarios must be a non-empty list")
+            if not all(isinstance(scenario, dict) and isinstance(scenario.get('shocks') or {}, dict) for scenario in scenarios):
+                raise TypeError("Each scenario must be an object with an optional margin and shocks object")
+            shocked = sorted({factor for scenario in scenarios for factor in (scenario.get('shocks') or {})})
+            columns = {'margin': np.array([np.nan if s.get('margin') is None else float(s['margin']) for s in scenarios])}
+            for factor in shocked:
+                columns[factor] = np.array([float((s.get('shocks') or {}).get(factor, 0.0)) for s in scenarios])
+        else:
+            limit = app.config['SIMULATE_MAX_CELLS']
+            axes = {'margin': scenario_axis(payload['margins'], limit) if payload.get('margins') is not None else np.array([np.nan])}
+            if not isinstance(payload.get('shocks') or {}, dict):
+                raise TypeError("shocks must be an object of factor -> values")
+            for factor, spec in (payload.get('shocks') or {}).items():
+                axes[factor] = scenario_axis(spec, limit)
+            shocked = [factor for factor in axes if factor != 'margin']
+            n_scenarios = int(np.prod([len(values) for values in axes.values()], dtype=np.float64))
+            if n_scenarios > limit:
+                raise ValueError(f"{n_scenarios} scenarios exceeds SIMULATE_MAX_CELLS ({limit})")
+            columns = expand_grid(axes)
+        unknown = [factor for factor in shocked if factor not in feature_names]
+        if unknown:
+            raise ValueError(f"Not influencing factors of {industry}: {', '.join(unknown)}")
+        decimals = payload.get('decimals')
+        decimals = None if decimals is None else int(decimals)
+        inputs = collect_pricing_inputs(industry, payload.get('products'))
+    except (KeyError, TypeError, ValueError) as e:
+        response = return_response(jsonify({"error": str(e)}), 400)
+        return response
+    except Exception as e:
+        response = return_response(jsonify({"error": str(e)}), 500)
+        return response
+
+    names = inputs['products']
+    n_scenarios = len(columns['margin'])
+    if n_scenarios * max(len(names), 1) > app.config['SIMULATE_MAX_CELLS']:
+        response = return_response(jsonify({"error": f"{n_scenarios} scenarios x {len(names)} products exceeds "
+                                                     f"SIMULATE_MAX_CELLS ({app.config['SIMULATE_MAX_CELLS']})"}), 400)
+        return response
+
+    # Scenario x factor multipliers; unshocked factors keep their value
+    multipliers = np.ones((n_scenarios, len(feature_names)))
+    for factor in shocked:
+        multipliers[:, feature_names.index(factor)] = 1 + columns[factor] / 100
+    prices = scenario_prices(inputs['coef_matrix'], inputs['intercepts'], inputs['factor_matrix'], multipliers)
+
+    # A shocked COG also moves the cost the margin adjustment divides by
+    cogs = inputs['cogs'][np.newaxis, :]
+    if 'COG' in feature_names:
+        cogs = cogs * multipliers[:, [feature_names.index('COG')]]
+    # Scenarios without a margin fall back to the product's own margin, then its current one
+    target_margins = np.where(np.isnan(columns['margin'])[:, np.newaxis], inputs['margins'][np.newaxis, :],
+                              columns['margin'][:, np.newaxis])
+    dynamic, margins = margin_adjusted_prices(prices, inputs['sales_prices'][np.newaxis, :], cogs, target_margins)
+
+    response = return_response(jsonify({
+        'products': names,
+        'scenarios': {name: matrix_to_json(values) for name, values in columns.items()},
+        'prices': matrix_to_json(dynamic, decimals),
+        'margins': matrix_to_json(margins, decimals),
+        'errors': inputs['errors'],
+    }))
+    return response
+
+# Fans whole-industry Monte Carlo runs out over worker processes
+risk_runner = MonteCarloRunner(app.config['RISK_WORKERS'] or None)
+
+def run_price_risk(industry, requested, payload):
+    # Monte Carlo price distribution per product. Factors listed in "distributions"
+    # are drawn ("empirical" bootstraps the product's own history; "normal",
+    # "uniform", "triangular" and "lognormal" take parameters or estimate them from
+    # that history); the others stay at their default values.
+    #   {"draws": 100000, "seed": 0, "percentiles": [5, 50, 95], "history_window": 365,
+    #    "distributions": {"Demand Score": "empirical", "COG": {"dist": "normal", "std": 0.5}}}
+    feature_names = influencing_factors[industry]
+    distributions = payload.get('distributions')
+    if distributions is None:
+        distributions = {factor: 'empirical' for factor in feature_names}
+    if not isinstance(distributions, dict):
+        raise ValueError("distributions must be an object of factor -> distribution")
+    distributions = {factor: normalize_distribution(spec) for factor, spec in distributions.items()}
+    unknown = [factor for factor in distributions if factor not in feature_names]
+    if unknown:
+        raise ValueError(f"Not influencing factors of {industry}: {', '.join(unknown)}")
+    draws = int(payload.get('draws', 100000))
+    if not 1 <= draws <= app.config['RISK_MAX_DRAWS']:
+        raise ValueError(f"draws must be between 1 and RISK_MAX_DRAWS ({app.config['RISK_MAX_DRAWS']})")
+    percentiles = [float(p) for p in payload.get('percentiles', [5, 25, 50, 75, 95])]
+    if any(not 0 <= p <= 100 for p in percentiles):
+        raise ValueError("percentiles must be between 0 and 100")
+    history_window = payload.get('history_window')
+    history_window = None if history_window is None else int(history_window)
+    seed = int(payload.get('seed', 0))
+
+    inputs = collect_pricing_inputs(industry, requested)
+    jobs = {}
+    for i, product in enumerate(inputs['products']):
+        jobs[product] = dict(file_path=os.path.join(data_dir, industry, f'{product}.csv'), industry=industry,
+                             product=product, feature_names=feature_names, coefs=inputs['coef_matrix'][i],
+                             intercept=float(inputs['intercepts'][i]), fixed=inputs['factor_matrix'][i],
+                             cost=float(inputs['cogs'][i]), distributions=distributions, draws=draws, seed=seed,
+                             percentiles=percentiles, history_window=history_window)
+    with metrics.stage('simulate'):
+        outcomes = risk_runner.run(jobs)
+    results, errors = {}, dict(inputs['errors'])
+    for product, outcome in outcomes.items():
+        if isinstance(outcome, Exception):
+            errors[product] = str(outcome)
+        else:
+            results[product] = outcome
+    return {'seed': seed, 'results': results, 'errors': errors}
+
+@app.route('/risk/<industry>', methods=['POST'])
+def industry_price_risk(industry):
+    industry = unquote(industry)  # Decode the industry name
+
+    if industry not in influencing_factors:
+        response = return_response(jsonify({"error": f"Industry '{industry}' not found in influencing_factors"}), 400)
+        return response
+
+    payload = request.get_json(silent=True) or {}
+    try:
+        result = run_price_risk(industry, payload.get('products'), payload)
+    except (KeyError, TypeError, ValueError) as e:
+        response = return_response(jsonify({"error": str(e)}), 400)
+        return response
+    response = return_response(jsonify(result))
+    return response
+
+@app.route('/risk/<industry>/<product>', methods=['POST'])
+def product_price_risk(industry, product):
+    industry = unquote(industry)  # Decode the industry name
+
+    if industry not in influencing_factors:
+        response = return_response(jsonify({"error": f"Industry '{industry}' not found in influencing_factors"}), 400)
+        return response
+
+    payload = request.get_json(silent=True) or {}
+    try:
+        result = run_price_risk(industry, {product: {'factors': payload.get('factors')}}, payload)
+    except (KeyError, TypeError, ValueError) as e:
+        response = return_response(jsonify({"error": str(e)}), 400)
+        return response
+    if product in result['errors']:
+        response = return_response(jsonify({"error": result['errors'][product]}), 400)
+        return response
+    response = return_response(jsonify({'product': product, 'seed': result['seed'], **result['results'][product]}))
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Prometheus text format; counts are per worker process
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    response = return_response(jsonify(dataset_cache.stats()))
+    return response
@@ -1,139 +1,288 @@
-from flask import Flask, render_template, jsonify, make_response, request, session, send_from_directory
+from flask import Flask, Response, g, render_template, jsonify, request, session, send_from_directory, stream_with_context
+import json
 import os
 import re
 import shutil
+import threading
+import time
 import pandas as pd
 import numpy as np
-from sklearn.experimental import enable_hist_gradient_boosting  # Enables HistGradientBoostingRegressor
-from sklearn.ensemble import HistGradientBoostingRegressor
-from sklearn.compose import ColumnTransformer
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
-from sklearn.pipeline import Pipeline
-import hashlib
 from werkzeug.utils import secure_filename
 from urllib.parse import unquote
+from model_registry import ModelRegistry
+from training_pool import TrainingPool, fit_pipeline_job, fit_and_explain_job, timed_job
+from prediction_service import ModelCache, MicroBatcher, coerce_rows, numeric_columns
+from pricing import margin_adjusted_prices, parse_product_requests
+from http_cache import HttpCache, make_etag
+from ingest import CsvIngest, UploadRejected, detach_stream
+from metrics import PricingMetrics, ProfilingMiddleware, current_route
+from app_common import DataService, configure_app, register_common_routes, return_response, catalog_page_args, wants_progress
 
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'data'
+configure_app(app)
+# Worker processes for pipeline fits (defaults to one per core)
+app.config['TRAINING_WORKERS'] = int(os.environ.get('TRAINING_WORKERS', 0)) or None
+# Fitted pipelines kept in memory for /predict, how long (ms) a prediction waits for others
+# to share its predict() call, the most rows one call takes, and the rows one request may send
+app.config['PREDICT_CACHE_MODELS'] = int(os.environ.get('PREDICT_CACHE_MODELS', 64))
+app.config['PREDICT_BATCH_WAIT_MS'] = float(os.environ.get('PREDICT_BATCH_WAIT_MS', 2))
+app.config['PREDICT_BATCH_ROWS'] = int(os.environ.get('PREDICT_BATCH_ROWS', 1024))
+app.config['PREDICT_MAX_ROWS'] = int(os.environ.get('PREDICT_MAX_ROWS', 10000))
+# Permutation importances shown as /coefficients: rows scored (0 = all), shuffles per factor,
+# seed, and joblib processes each training worker spreads the shuffles over
+app.config['IMPORTANCE_MAX_ROWS'] = int(os.environ.get('IMPORTANCE_MAX_ROWS', 5000))
+app.config['IMPORTANCE_REPEATS'] = int(os.environ.get('IMPORTANCE_REPEATS', 5))
+app.config['IMPORTANCE_SEED'] = int(os.environ.get('IMPORTANCE_SEED', 0))
+app.config['IMPORTANCE_JOBS'] = int(os.environ.get('IMPORTANCE_JOBS', 1))
 
 # Allow cross-origin requests for development purposes
 from flask_cors import CORS
 CORS(app)
 
-data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+# Latency, read/hash/fit time, rows and bytes read and coefficient hits, served at /metrics
+metrics = PricingMetrics()
+if app.config['ALLOW_PROFILING']:
+    app.wsgi_app = ProfilingMiddleware(app.wsgi_app)
+
+# ETag / If-None-Match, Cache-Control and gzip for the read endpoints the analyzer polls
+http_cache = HttpCache(app, max_age=app.config['HTTP_CACHE_MAX_AGE'], min_size=app.config['COMPRESS_MIN_BYTES'])
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    current_route.set(request.url_rule.rule if request.url_rule is not None else 'unmatched')
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        metrics.requests.observe(time.perf_counter() - started, route=current_route.get(),
+                                 method=request.method, status=str(response.status_code))
+    return response
+
+# Product files, their columnar copies, the catalog, discovered schemas, file versions, trend
+# aggregates and the shared state, kept the same way as in the Ridge app (app_common.py)
+data_service = DataService(app, metrics, invalidate_industry=lambda industry: invalidate_industry(industry), include_categorical=True)
+data_dir = data_service.data_dir
+columnar_store, dataset_cache, catalog = data_service.columnar_store, data_service.dataset_cache, data_service.catalog
+schemas, file_versions, trend_store = data_service.schemas, data_service.file_versions, data_service.trend_store
+factors, influencing_factors, target_variable = schemas.factors, schemas.influencing_factors, schemas.target_variable
+shared_state, state_lock, change_feed = data_service.shared_state, data_service.state_lock, data_service.change_feed
+declared_industries = data_service.declared_industries
+load_columns, load_tail = data_service.load_columns, data_service.load_tail
+get_industries, get_product_names, list_industries = data_service.get_industries, data_service.get_product_names, data_service.list_industries
+product_etag, industry_etag = data_service.product_etag, data_service.industry_etag
+describe_product, describe_products = data_service.describe_product, data_service.describe_products
+apply_schema, update_industry_schema = data_service.apply_schema, data_service.update_industry_schema
+update_declared_industries, publish_change = data_service.update_declared_industries, data_service.publish_change
+data_service.start()
+register_common_routes(app, data_service, http_cache)
 
 # -----------------------------------------------   python utility definitions -----------------------------------------------
 
-def return_response(*Value):
-    if len(Value) > 1:
-        response = make_response(Value[0], Value[1])
-    else:
-        response = make_response(Value[0])
-    response.headers['Content-Type'] = 'application/json; charset=utf-8'
-    return response 
-
-def get_industries():
-    data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
-    industries = [name for name in os.listdir(data_path) if os.path.isdir(os.path.join(data_path, name))]
-    return industries
-
-def load_factors_and_influencing_factors():
-    data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
-    industries = get_industries()
-    
-    factors = {}
-    influencing_factors = {}
-    target_variable = {}
-    
-    for industry in industries:
-        industry_path = os.path.join(data_path, industry)
-        csv_files = [f for f in os.listdir(industry_path) if f.endswith('.csv')]
-        
-        all_columns = set()
-        file_path = os.path.join(industry_path, csv_files[0])
-        df = pd.read_csv(file_path)
-
-        # Select columns with numeric and categorical types
-        numeric_cols = df.select_dtypes(include=['float64', 'int64', 'float32', 'int32']).columns
-        categorical_cols = df.select_dtypes(include=['object', 'category']).columns
-        all_columns.update(numeric_cols)
-        all_columns.update(categorical_cols)
-
-        all_columns = list(all_columns)
-        if 'Sales Price' in all_columns:
-            influencing_columns = [col for col in all_columns if col != 'Sales Price']
-            factors[industry] = ['Sales Price'] + influencing_columns
-            influencing_factors[industry] = influencing_columns
-            target_variable[industry] = 'Sales Price'
-        else:
-            factors[industry] = all_columns
-            influencing_factors[industry] = all_columns
-            target_variable[industry] = 'Sales Price'  # Or handle the absence of 'Sales Price' appropriately
-
-    return factors, influencing_factors, target_variable
-
-# Generate the dictionaries
-factors, influencing_factors, target_variable = load_factors_and_influencing_factors()
-
 # Dictionary to store the last hash of each file and the corresponding coefficients
 file_hashes = {}
 coefficients = {}
-
-def calculate_file_hash(file_path):
-    with open(file_path, 'rb') as f:
-        file_hash = hashlib.md5()
-        while chunk := f.read(8192):
-            file_hash.update(chunk)
-    return file_hash.hexdigest()
-
-def get_model_coefficients(df, industry):
-    X = df[influencing_factors[industry]]
-    y = df[target_variable[industry]]
-
-    # Identify numeric and categorical columns
-    numeric_cols = X.select_dtypes(include=['float64', 'int64', 'float32', 'int32']).columns
-    categorical_cols = X.select_dtypes(include=['object', 'category']).columns
-
-    # Define preprocessing steps for numeric and categorical data
-    preprocessor = ColumnTransformer(
-        transformers=[
-            ('num', StandardScaler(), numeric_cols),
-            ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_cols)
-        ])
-
-    # Create a pipeline with preprocessing and model fitting
-    model = Pipeline(steps=[
-        ('preprocessor', preprocessor),
-        ('regressor', HistGradientBoostingRegressor())
-    ])
-
-    model.fit(X, y)
-
-    # Extract coefficients and intercept for interpretation
-    coefs = model.named_steps['regressor'].feature_importances_
-    const_coef = model.named_steps['regressor'].baseline_prediction_
-    
-    # Combine numeric and categorical feature names after one-hot encoding
-    cat_feature_names = list(model.named_steps['preprocessor']
-                             .named_transformers_['cat']
-                             .get_feature_names_out(categorical_cols))
-    all_feature_names = list(numeric_cols) + cat_feature_names
-    
-    return coefs, const_coef, all_feature_names
-
-def update_factors_and_influencing_factors(industry, file_path):
-    df = pd.read_csv(file_path)
-    numeric_columns = df.select_dtypes(include=['float64', 'int64']).columns.tolist()
-    categorical_columns = df.select_dtypes(include=['object', 'category']).columns.tolist()
-    target_var = 'Sales Price'  # Default target variable
-
-    # Update the dictionaries
-    factors[industry] = [target_var] + numeric_columns + categorical_columns
-    influencing_factors[industry] = numeric_columns + categorical_columns
-    target_variable[industry] = target_var
-
-# Global list to keep track of industries
-changed_industries = get_industries()
+model_registry = ModelRegistry(app.config['MODEL_REGISTRY_DIR'])
+
+# Pipeline fits run here instead of in the request thread
+training_pool = TrainingPool(max_workers=app.config['TRAINING_WORKERS'])
+
+# Pipelines served by /predict, and the thread that batches concurrent predictions
+resident_models = ModelCache(max_models=app.config['PREDICT_CACHE_MODELS'])
+prediction_batcher = MicroBatcher(max_rows=app.config['PREDICT_BATCH_ROWS'], max_wait=app.config['PREDICT_BATCH_WAIT_MS'] / 1000,
+                                  on_batch=metrics.record_prediction_batch)
+
+def importance_options():
+    return {'max_rows': app.config['IMPORTANCE_MAX_ROWS'], 'n_repeats': app.config['IMPORTANCE_REPEATS'],
+            'seed': app.config['IMPORTANCE_SEED'], 'n_jobs': app.config['IMPORTANCE_JOBS']}
+
+def publish_upload(industry, file_path, ingest):
+    # Swap the uploaded file in and seed what is derived from it with the
+    # statistics gathered while it streamed in, so nothing re-reads it
+    ingest.commit()
+    dataset_cache.invalidate(file_path)
+    if not ingest.validate_schema:
+        # A new industry: the upload defines its factors
+        update_industry_schema(industry, lambda current: ingest.schema)
+        publish_change('industry-added', industry)
+    version = file_versions.record(file_path, ingest.hasher)
+    metrics.record_read('upload', ingest.rows, ingest.total_bytes or 0)
+    product = os.path.splitext(os.path.basename(file_path))[0]
+    describe_product(industry, product)
+    publish_change('file', industry, product, file_version=version)
+    if ingest.trend is not None:
+        trend_store.seed(file_path, version, ingest.trend_by, ingest.trend)
+
+def compute_industry_defaults(industry, products, window=30):
+    # Numeric factors average over the last `window` rows; categorical ones keep
+    # their most recent value. All products are reduced in one groupby.
+    factors_val = factors.get(industry, [])
+    frames, errors = {}, {}
+    for product in products:
+        try:
+            frames[product] = load_tail(os.path.join(data_dir, industry, f'{product}.csv'), factors_val, window)
+        except FileNotFoundError:
+            errors[product] = f"File {product}.csv not found in industry {industry}"
+        except KeyError as ke:
+            errors[product] = str(ke)
+    if not frames:
+        return {}, errors
+
+    stacked = pd.concat(frames, names=['product', 'row'])
+    numeric_cols = stacked.select_dtypes(include='number').columns
+    grouped = stacked.groupby(level='product', sort=False)
+    summary = grouped[list(numeric_cols)].mean().round(2)
+    for col in stacked.columns.difference(numeric_cols):
+        summary[col] = grouped[col].last()
+    summary = summary[factors_val]
+
+    defaults = {}
+    for product, row in summary.iterrows():
+        sales_price = row.get('Sales Price')
+        cog = row.get('COG')
+        margin = ((sales_price - cog) / sales_price) * 100 if sales_price and cog is not None else None
+        defaults[product] = {
+            'defaults': [value.item() if isinstance(value, np.generic) else value for value in row.tolist()],
+            'sales_price': None if sales_price is None else float(sales_price),
+            'margin': None if margin is None or pd.isna(margin) else float(margin),
+        }
+    return defaults, errors
+
+def ensure_coefficients(industry, product):
+    # Returns (coefficients, None) when a fit is available, otherwise (None, job)
+    # for the background fit; identical requests share one job
+    file_path = os.path.join(data_dir, industry, f'{product}.csv')
+    current_hash = file_versions.version(file_path)
+    if file_path in file_hashes and file_hashes[file_path] == current_hash:
+        log_coefficient_decision(industry, product, 'hit', current_hash)
+        return coefficients[(industry, product)], None
+    if industry not in influencing_factors:
+        raise KeyError(f"Industry '{industry}' not found in influencing_factors")
+
+    feature_names = list(influencing_factors[industry])
+    # A pipeline and importances persisted by an earlier process are reused if version
+    # and factors still match; a stored pipeline without importances is only scored
+    model = model_registry.load(industry, product, current_hash, feature_names, kind='hgb')
+    importances = None
+    if model is not None:
+        resident_models.put((industry, product), current_hash, feature_names, model)
+        importances = model_registry.load(industry, product, current_hash, feature_names, kind='hgb-importance')
+    if importances is not None:
+        store_coefficients(industry, product, file_path, current_hash, importances, fitted=False)
+        log_coefficient_decision(industry, product, 'registry', current_hash)
+        return coefficients[(industry, product)], None
+
+    return None, submit_fit(industry, product, file_path, current_hash, feature_names, model)
+
+def ensure_model(industry, product):
+    # Returns (pipeline, None) from memory or the registry, otherwise (None, job)
+    # for the background fit, shared with /coefficients
+    file_path = os.path.join(data_dir, industry, f'{product}.csv')
+    current_hash = file_versions.version(file_path)
+    if industry not in influencing_factors:
+        raise KeyError(f"Industry '{industry}' not found in influencing_factors")
+
+    feature_names = list(influencing_factors[industry])
+    model = resident_models.get((industry, product), current_hash, feature_names)
+    if model is not None:
+        return model, None
+    model = model_registry.load(industry, product, current_hash, feature_names, kind='hgb')
+    if model is not None:
+        resident_models.put((industry, product), current_hash, feature_names, model)
+        return model, None
+    return None, submit_fit(industry, product, file_path, current_hash, feature_names)
+
+def submit_fit(industry, product, file_path, current_hash, feature_names, model=None):
+    # Fits the pipeline (unless `model` is given) and computes its permutation
+    # importances in one pool job
+    key = (industry, product, current_hash, tuple(feature_names))
+    error = training_pool.failure(key)
+    if error is not None:
+        log_coefficient_decision(industry, product, 'failed', current_hash)
+        raise RuntimeError(error)
+
+    def on_done(result):
+        (fitted, importances), seconds = result
+        metrics.fits.observe(seconds, industry=industry, product=product, model='hgb' if model is None else 'hgb-importance')
+        if model is None:
+            model_registry.save(industry, product, current_hash, feature_names, fitted, kind='hgb')
+        model_registry.save(industry, product, current_hash, feature_names, importances, kind='hgb-importance')
+        resident_models.put((industry, product), current_hash, feature_names, fitted)
+        store_coefficients(industry, product, file_path, current_hash, importances)
+
+    job, created = training_pool.submit(key, timed_job, fit_and_explain_job, file_path, feature_names, target_variable[industry],
+                                        importance_options(), model, on_done=on_done)
+    # A request that joins a fit already in flight is 'pending', not another fit
+    log_coefficient_decision(industry, product, 'fit' if created else 'pending', current_hash)
+    return job
+
+def log_coefficient_decision(industry, product, decision, version):
+    metrics.coefficient_lookups.inc(industry=industry, product=product, result=decision)
+    app.logger.info("coefficients %s/%s: %s (version %s)", industry, product, decision, version[:12])
+
+def warm_up_models():
+    # Load every stored product and queue fits for the rest, so the first
+    # requests after a deploy hit memory and stale products train on all cores
+    for industry in get_industries():
+        try:
+            products = get_product_names(industry)
+        except FileNotFoundError:
+            continue
+        for product in products:
+            try:
+                ensure_coefficients(industry, product)
+            except Exception as e:
+                app.logger.warning("Warm-up failed for %s/%s: %s", industry, product, e)
+
+if app.config['MODEL_WARMUP']:
+    threading.Thread(target=warm_up_models, name='model-warmup', daemon=True).start()
+
+def invalidate_industry(industry):
+    # Drop everything derived from an industry's files or factor list
+    dataset_cache.invalidate_prefix(os.path.join(data_dir, industry))
+    file_versions.forget_prefix(os.path.join(data_dir, industry))
+    trend_store.forget_prefix(os.path.join(data_dir, industry))
+    for key in [key for key in coefficients if key[0] == industry]:
+        coefficients.pop(key, None)
+    resident_models.invalidate_industry(industry)
+    industry_prefix = os.path.join(data_dir, industry, '')
+    for path in [path for path in file_hashes if path.startswith(industry_prefix)]:
+        file_hashes.pop(path, None)
+
+# Shared state version this worker has applied
+state_version = 0
+
+@app.before_request
+def sync_shared_state():
+    global state_version
+    if shared_state.version() == state_version:
+        return
+    with state_lock:
+        changes = shared_state.changes(state_version)
+        for industry, schema in changes['schemas'].items():
+            apply_schema(industry, schema)
+        declared_industries[:] = changes['values'].get('declared_industries', declared_industries) or []
+        for (industry, product), (file_path, version, coefs, kind) in changes['coefficients'].items():
+            # Only permutation importances of the gradient-boosted pipeline are served here;
+            # Ridge coefficients another app wrote to the same store are not
+            if coefs is None or kind != 'hgb-importance':
+                coefficients.pop((industry, product), None)
+                file_hashes.pop(file_path, None)
+            else:
+                coefficients[(industry, product)] = coefs
+                file_hashes[file_path] = version
+        state_version = changes['version']
+
+def store_coefficients(industry, product, file_path, version, coefs, fitted=True):
+    # fitted=False for importances loaded from the registry rather than computed now
+    coefficients[(industry, product)] = coefs
+    file_hashes[file_path] = version
+    shared_state.set_coefficients(industry, product, file_path, version, coefs, kind='hgb-importance')
+    if fitted:
+        catalog.record_fits([(industry, product, version)])
+
+sync_shared_state()
 
 def custom_secure_filename(filename):
     filename = re.sub(r'[^a-zA-Z0-9\s_.-]', '', filename).strip()
@@ -144,27 +293,25 @@ def custom_secure_filename(filename):
 
 @app.route('/', methods=['GET', 'POST'])
 def iex():
-    global changed_industries
-    industries = changed_industries if changed_industries else get_industries()
+    industries = list_industries()
+    schemas.load_all(industries)
     return render_template('new.html',  industries=industries, factors=factors, influencing_factors=influencing_factors)
 
 @app.route('/analyze')
 def index():
-    global changed_industries
-    industries = changed_industries if changed_industries else get_industries()
+    industries = list_industries()
+    schemas.load_all(industries)
     return render_template('new1.html', industries=industries, factors=factors, influencing_factors=influencing_factors)
 
 @app.route('/update-industries', methods=['POST'])
 def update_industries():
-    global changed_industries
     new_industry = request.json.get('new_industry')
     columns = request.json.get('columns')
     inF= request.json.get('inF')  ## inF is influencing factors.
     target_var = request.json.get('target_var')
     if new_industry and columns:
-        changed_industries.append(new_industry)
-        factors[new_industry] = [target_var] + columns
-        influencing_factors[new_industry] = inF
+        update_industry_schema(new_industry, lambda current: ([target_var] + columns, inF, target_var))
+        update_declared_industries(lambda names: names if new_industry in names else names + [new_industry])
         return {'success': True}
     return {'success': False}, 400
 
@@ -187,33 +334,54 @@ def upload_csv():
     industry_path = os.path.join(app.config['UPLOAD_FOLDER'], industry_name)
     if not os.path.exists(industry_path):
         os.makedirs(industry_path)
+        catalog.add_industry(industry_name)
     
-    # Save the file
     filename = custom_secure_filename(file.filename)
     file_path = os.path.join(industry_path, filename)
-    file.save(file_path)
 
-    # Update the factors and influencing factors for the new industry
-    update_factors_and_influencing_factors(industry_name, file_path)
-    
-    return jsonify(success=True, message="File uploaded successfully")
+    # Uploads to an existing industry must carry its factors
+    schema = None
+    if industry_name in factors:
+        schema = (factors[industry_name], influencing_factors[industry_name], target_variable[industry_name])
+    stream = detach_stream(file.stream)
+    ingest = CsvIngest(stream, file_path, schema=schema, chunk_rows=app.config['UPLOAD_CHUNK_ROWS'],
+                       include_categorical=True, fit_ridge=False, columnar_store=columnar_store)
+
+    def run():
+        try:
+            yield from ingest.run()
+            publish_upload(industry_name, file_path, ingest)
+        except UploadRejected as e:
+            yield {'success': False, 'message': str(e)}
+            return
+        finally:
+            stream.close()
+        yield {'success': True, 'message': "File uploaded successfully", 'rows': ingest.rows,
+               'means': {col: round(value, 2) for col, value in ingest.means.items()}}
+
+    # Clients that ask for it get one JSON line per parsed chunk, then the result
+    if wants_progress():
+        return Response(stream_with_context(json.dumps(event) + '\n' for event in run()), mimetype='application/x-ndjson')
+    for result in run():
+        pass
+    return jsonify(**result)
 
 @app.route('/update-columns', methods=['POST'])
 def update_columns():
-    global factors
     data = request.json
     industry = data.get('industry')
     new_column = data.get('columns')  ##  same for the inF, which is influencing_factors[selectedIndustry].
     if industry and new_column:
-        if industry in factors:
-            existing_columns = set(factors[industry])
-            if new_column not in existing_columns:
-                factors[industry].append(new_column)
-                influencing_factors[industry].append(new_column)
-        else:
+        def add_column(current):
+            if current is not None:
+                factors_val, influencing, target = current
+                existing_columns = set(factors_val)
+                if new_column not in existing_columns:
+                    return factors_val + [new_column], influencing + [new_column], target
+                return current
             gl_target_var = ['Sales Price']
-            factors[industry] = gl_target_var + new_column
-            influencing_factors[industry] = new_column
+            return gl_target_var + new_column, new_column, gl_target_var[0]
+        update_industry_schema(industry, add_column)
         return {'success': True}
     return {'success': False}, 400
 
@@ -227,8 +395,9 @@ def delete_columns():
         return jsonify(success=False, message="Industry does not exist")
     
     if columns_to_delete:
-        factors[industry] = [col for col in factors[industry] if col not in columns_to_delete]
-        influencing_factors[industry] = [col for col in influencing_factors[industry] if col not in columns_to_delete]
+        update_industry_schema(industry, lambda current: ([col for col in current[0] if col not in columns_to_delete],
+                                                          [col for col in current[1] if col not in columns_to_delete],
+                                                          current[2]))
     else:
         return jsonify(success=False, message="No columns specified for deletion")
     
@@ -236,45 +405,63 @@ def delete_columns():
 
 @app.route('/delete-industry', methods=['POST'])
 def delete_industry():
-    global changed_industries
     data = request.json
     industry = data.get('industry')
     
     if industry not in factors:
         return jsonify(success=False, message="Industry does not exist")
     
-    industries = get_industries()
-    industries.remove(industry)
-    changed_industries.remove(industry)
-    factors.pop(industry, None)
-    influencing_factors.pop(industry, None)
-    
     # Delete industry directory
     industry_dir = os.path.join(data_dir, industry)
     if os.path.exists(industry_dir):
         shutil.rmtree(industry_dir)
+    update_industry_schema(industry, lambda current: None)
+    catalog.remove_industry(industry)
+    update_declared_industries(lambda names: [name for name in names if name != industry])
+    model_registry.discard(industry)
     
     return jsonify(success=True)
 
 @app.route('/data/<industry>', methods=['GET'])
+@http_cache.conditional(lambda industry: make_etag(catalog_page_args(), get_product_names(industry, *catalog_page_args())))
 def get_products(industry):
-    data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', industry)
+    # Product names in order; ?prefix= narrows them, ?limit= / ?offset= page through them
     try:
-        products = [f.split('.')[0] for f in os.listdir(data_path) if f.endswith('.csv')]
+        prefix, limit, offset = catalog_page_args()
+        products = get_product_names(industry, prefix, limit, offset)
         response = return_response(jsonify(products))
+        response.headers['X-Total-Count'] = str(catalog.count_products(industry, prefix))
+        return response
+    except ValueError as ve:
+        response = return_response(jsonify({"error": str(ve)}), 400)
         return response
     except FileNotFoundError:
         response = return_response(jsonify({"error": f"Industry directory {industry} not found"}), 404)
         return response
 
+@app.route('/data/<industry>/defaults', methods=['GET'])
+@http_cache.conditional(lambda industry: industry_etag(industry, request.args.get('window', app.config['DEFAULTS_WINDOW'])))
+def get_industry_defaults(industry):
+    industry = unquote(industry)
+    window = request.args.get('window', app.config['DEFAULTS_WINDOW'], type=int)
+    if window is None or window <= 0:
+        return jsonify({"error": "window must be a positive integer"}), 400
+    try:
+        products = get_product_names(industry)
+    except FileNotFoundError:
+        return jsonify({"error": f"Industry directory {industry} not found"}), 404
+    defaults, errors = compute_industry_defaults(industry, products, window)
+    return jsonify({'factors': factors.get(industry, []), 'window': window, 'products': defaults, 'errors': errors})
+
 @app.route('/data/<industry>/<product>', methods=['GET'])
+@http_cache.conditional(lambda industry, product: product_etag(industry, product))
 def get_default_factors(industry, product):
     industry = unquote(industry)
     file_path = os.path.join(data_dir, industry, f'{product}.csv')
     try:
-        df = pd.read_csv(file_path)
+        df = columnar_store.head(file_path, influencing_factors[industry], 1)
         # Assuming the order of columns is consistent with influencing_factors
-        factor_values = df[influencing_factors[industry]].iloc[0].tolist()
+        factor_values = [value.item() if isinstance(value, np.generic) else value for value in df.iloc[0].tolist()]
         return jsonify(factor_values)
     except FileNotFoundError:
         return jsonify({"error": f"File {product}.csv not found in industry {industry}"}), 404
@@ -284,20 +471,18 @@ def get_default_factors(industry, product):
         return jsonify({"error": str(e)}), 500
 
 @app.route('/coefficients/<industry>/<product>', methods=['GET', 'POST'])
+@http_cache.conditional(lambda industry, product: product_etag(industry, product, importance_options()))
 def get_coefficients(industry, product):
     industry = unquote(industry)
     file_path = os.path.join(data_dir, industry, f'{product}.csv')
     try:
-        current_hash = calculate_file_hash(file_path)
-        if file_path not in file_hashes or file_hashes[file_path] != current_hash:
-            df = pd.read_csv(file_path)
-            if industry not in influencing_factors:
-                raise KeyError(f"Industry '{industry}' not found in influencing_factors")
-            coefs, const_coef, feature_names = get_model_coefficients(df, industry)
-            coefficients[(industry, product)] = dict(zip(feature_names, coefs))
-            coefficients[(industry, product)]['const'] = const_coef
-            file_hashes[file_path] = current_hash
-        response = return_response(jsonify(coefficients[(industry, product)]))
+        coefs, job = ensure_coefficients(industry, product)
+        if job is not None:
+            # Training in flight: poll /jobs/<id>, then ask again
+            response = return_response(jsonify(training_pool.status(job['id'])), 202)
+            response.headers['Location'] = f"/jobs/{job['id']}"
+            return response
+        response = return_response(jsonify(coefs))
         return response
     except FileNotFoundError:
         response = return_response(jsonify({"error": f"Product file {product}.csv not found in {industry}"}), 404)
@@ -309,23 +494,142 @@ def get_coefficients(industry, product):
         response = return_response(jsonify({"error": str(e)}), 500)
         return response
 
-@app.route('/sales_trend/<industry>/<product>', methods=['POST'])
-def sales_trend(industry, product):
-    industry = unquote(industry)  # Decode the industry name
+@app.route('/predict/<industry>/<product>', methods=['POST'])
+def predict_prices(industry, product):
+    # Gradient-boosted Sales Price for {"factors": {...}} -> {"prediction": p} or
+    # {"rows": [{...}, ...]} -> {"predictions": [...]}. Factors left out are treated
+    # as missing values. Concurrent requests share batched predict() calls.
+    industry = unquote(industry)
+    payload = request.get_json(silent=True) or {}
+    single = 'rows' not in payload
+    rows = [payload.get('factors') or {}] if single else payload['rows']
+    if not isinstance(rows, list) or not rows:
+        response = return_response(jsonify({"error": "rows must be a non-empty list"}), 400)
+        return response
+    if len(rows) > app.config['PREDICT_MAX_ROWS']:
+        response = return_response(jsonify({"error": f"At most {app.config['PREDICT_MAX_ROWS']} rows per request"}), 400)
+        return response
 
-    file_path = os.path.join(data_dir, industry, f'{product}.csv')
     try:
-        df = pd.read_csv(file_path)
-        # Group by Year and calculate average Sales Price
-        trend_data = df.groupby('Year')['Sales Price'].mean().reset_index()
-
-        # Convert to dictionary for JSON response
-        trend_dict = trend_data.to_dict(orient='records')
-        
-        return jsonify(trend_dict)
+        model, job = ensure_model(industry, product)
+        if job is not None:
+            # Training in flight: poll /jobs/<id>, then ask again
+            response = return_response(jsonify(training_pool.status(job['id'])), 202)
+            response.headers['Location'] = f"/jobs/{job['id']}"
+            return response
+        feature_names = influencing_factors[industry]
+        numeric = numeric_columns(model)
+        values = coerce_rows(rows, feature_names, numeric)
+    except FileNotFoundError:
+        response = return_response(jsonify({"error": f"Product file {product}.csv not found in {industry}"}), 404)
+        return response
+    except (KeyError, TypeError, ValueError) as e:
+        response = return_response(jsonify({"error": str(e)}), 400)
+        return response
+    except Exception as e:
+        response = return_response(jsonify({"error": str(e)}), 500)
+        return response
+
+    try:
+        predictions = prediction_batcher.predict(model, feature_names, numeric, values, timeout=60)
     except Exception as e:
+        response = return_response(jsonify({"error": str(e)}), 500)
+        return response
+    if single:
+        response = return_response(jsonify({'prediction': float(predictions[0])}))
+    else:
+        response = return_response(jsonify({'predictions': predictions.tolist()}))
+    return response
+
+@app.route('/price/<industry>', methods=['POST'])
+def price_products(industry):
+    # Dynamic prices for many products in one request, as the analyzer page asks for
+    # them: each product's default factors (with overrides) go through its pipeline via
+    # the /predict batcher, then get the same margin adjustment as the Ridge app.
+    # Accepts {"p1": {...}}, [{"product": "p1", "factors": {...}, "margin": m}] or
+    # ["p1", ...]; products whose model is still training are listed under "jobs".
+    industry = unquote(industry)
+    if industry not in influencing_factors:
+        response = return_response(jsonify({"error": f"Industry '{industry}' not found in influencing_factors"}), 400)
+        return response
+
+    payload = request.get_json(silent=True) or {}
+    try:
+        if not isinstance(payload, dict):
+            raise TypeError("Request body must be a JSON object")
+        requested = payload.get('products')
+        requested = parse_product_requests(get_product_names(industry) if requested is None else requested)
+
+        feature_names = influencing_factors[industry]
+        defaults, errors = compute_industry_defaults(industry, list(requested), app.config['DEFAULTS_WINDOW'])
+        pending, jobs = [], {}
+        for product, entry in defaults.items():
+            overrides = requested[product]
+            try:
+                model, job = ensure_model(industry, product)
+                if job is not None:
+                    jobs[product] = job['id']
+                    errors[product] = "Model training in progress"
+                    continue
+                values = dict(zip(factors.get(industry, []), entry['defaults']))
+                values.update({factor: value for factor, value in overrides['factors'].items() if value is not None})
+                numeric = numeric_columns(model)
+                rows = coerce_rows([{name: values.get(name) for name in feature_names}], feature_names, numeric)
+                future = prediction_batcher.submit(model, feature_names, numeric, rows)
+            except FileNotFoundError:
+                errors[product] = f"Product file {product}.csv not found in {industry}"
+                continue
+            except (KeyError, TypeError, ValueError) as e:
+                errors[product] = str(e)
+                continue
+            pending.append((product, future, values.get('Sales Price'), values.get('COG'), overrides['margin']))
+
+        names, predictions, sales_prices, cogs, margins = [], [], [], [], []
+        for product, future, sales_price, cog, margin in pending:
+            try:
+                predictions.append(float(future.result(timeout=60)[0]))
+            except Exception as e:
+                errors[product] = str(e)
+                continue
+            names.append(product)
+            sales_prices.append(np.nan if sales_price is None else float(sales_price))
+            cogs.append(np.nan if cog is None else float(cog))
+            margins.append(np.nan if margin is None else margin)
+
+        prices = {}
+        if names:
+            dynamic, margin = margin_adjusted_prices(np.array(predictions), sales_prices, cogs, np.array(margins))
+            prices = {name: {'dynamic_price': float(dynamic[i]) if np.isfinite(dynamic[i]) else None,
+                             'margin': float(margin[i]) if np.isfinite(margin[i]) else None}
+                      for i, name in enumerate(names)}
+
+        response = return_response(jsonify({'prices': prices, 'errors': errors, 'jobs': jobs}))
+        return response
+    except (KeyError, TypeError, ValueError) as e:
         response = return_response(jsonify({"error": str(e)}), 400)
         return response
+    except Exception as e:
+        response = return_response(jsonify({"error": str(e)}), 500)
+        return response
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    status = training_pool.status(job_id)
+    if status is None:
+        response = return_response(jsonify({"error": f"Job {job_id} not found"}), 404)
+        return response
+    response = return_response(jsonify(status))
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Prometheus text format; counts are per worker process
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    response = return_response(jsonify({**dataset_cache.stats(), 'models': resident_models.stats()}))
+    return response
 
 if __name__ == '__main__':
     app.run(debug=True)
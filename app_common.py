@@ -0,0 +1,388 @@
+import os
+import threading
+from urllib.parse import unquote
+
+import pandas as pd
+from flask import Response, jsonify, make_response, request
+
+from catalog import ProductCatalog
+from change_feed import ChangeFeed
+from columnar_store import ColumnarStore
+from dataset_cache import DatasetCache
+from file_versions import FileVersionTracker, DirectoryWatcher, hash_file, stat_key
+from http_cache import make_etag
+from schema_discovery import IndustrySchemas
+from shared_state import SharedState
+from trend_store import TrendStore, aggregate, to_records
+
+
+# -----------------------------------------------   configuration shared by app.py and app2.py -----------------------------------------------
+
+def configure_app(app):
+    # Industry directories of product CSVs; PRICING_DATA_DIR points the app at another tree
+    app.config['UPLOAD_FOLDER'] = os.environ.get('PRICING_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+    app.config['DATASET_CACHE_MAX_BYTES'] = int(os.environ.get('DATASET_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+    # Rows sampled (after the header) to tell numeric from categorical columns
+    app.config['SCHEMA_SAMPLE_ROWS'] = int(os.environ.get('SCHEMA_SAMPLE_ROWS', 1000))
+    # Seconds between scans of data_dir for changed product files (0 disables the watcher)
+    app.config['DATA_WATCH_INTERVAL'] = float(os.environ.get('DATA_WATCH_INTERVAL', 0))
+    # Fitted models survive restarts here; MODEL_WARMUP=1 pre-fits every product in the background
+    app.config['MODEL_REGISTRY_DIR'] = os.environ.get('MODEL_REGISTRY_DIR', os.path.join(app.instance_path, 'models'))
+    app.config['MODEL_WARMUP'] = os.environ.get('MODEL_WARMUP', '0') == '1'
+    # Number of most recent rows summarised into a product's default factor values
+    app.config['DEFAULTS_WINDOW'] = int(os.environ.get('DEFAULTS_WINDOW', 30))
+    # Rows parsed per chunk while an upload streams in; bounds upload memory
+    app.config['UPLOAD_CHUNK_ROWS'] = int(os.environ.get('UPLOAD_CHUNK_ROWS', 50000))
+    # SQLite file through which worker processes share factors, declared industries and coefficients
+    app.config['SHARED_STATE_PATH'] = os.environ.get('SHARED_STATE_PATH', os.path.join(app.instance_path, f'{app.name}-state.sqlite3'))
+    # SQLite file holding the industry/product catalog (the shared state file unless set), the page size of
+    # /catalog listings, and whether products new or changed since the last run are described at startup
+    app.config['CATALOG_PATH'] = os.environ.get('CATALOG_PATH', app.config['SHARED_STATE_PATH'])
+    app.config['CATALOG_PAGE_SIZE'] = int(os.environ.get('CATALOG_PAGE_SIZE', 100))
+    app.config['CATALOG_DESCRIBE_ON_START'] = os.environ.get('CATALOG_DESCRIBE_ON_START', '1') == '1'
+    # How often (s) a process with /events subscribers checks the shared change log, and the keep-alive period
+    app.config['EVENTS_POLL_INTERVAL'] = float(os.environ.get('EVENTS_POLL_INTERVAL', 1.0))
+    app.config['EVENTS_HEARTBEAT'] = float(os.environ.get('EVENTS_HEARTBEAT', 15.0))
+    # Open /events streams allowed per process. Each holds a request thread while connected,
+    # so serve the app from threaded or async workers (gunicorn -k gthread --threads N, or
+    # -k gevent); under sync workers set 0, and pages fall back to polling
+    app.config['EVENTS_MAX_SUBSCRIBERS'] = int(os.environ.get('EVENTS_MAX_SUBSCRIBERS', 32))
+    # With ALLOW_PROFILING=1, requests sent with an X-Profile header get a cProfile summary
+    # back. Off by default: it exposes server internals to any client that asks
+    app.config['ALLOW_PROFILING'] = os.environ.get('ALLOW_PROFILING', '0') == '1'
+    # Seconds browsers and proxies may reuse a tagged response without revalidating (0 = always revalidate),
+    # and the smallest response body that gets compressed
+    app.config['HTTP_CACHE_MAX_AGE'] = int(os.environ.get('HTTP_CACHE_MAX_AGE', 0))
+    app.config['COMPRESS_MIN_BYTES'] = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+    app.logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+
+
+# -----------------------------------------------   request helpers -----------------------------------------------
+
+def return_response(*Value):
+    if len(Value) > 1:
+        response = make_response(Value[0], Value[1])
+    else:
+        response = make_response(Value[0])
+    response.headers['Content-Type'] = 'application/json; charset=utf-8'
+    return response
+
+
+def parse_trend_grouping():
+    by = [col.strip() for col in request.args.get('by', 'Year').split(',') if col.strip()]
+    return by or ['Year']
+
+
+def parse_trend_years():
+    # ?years=2016,2018-2020 -> [2016, 2018, 2019, 2020]; None for every year
+    spec = request.args.get('years', '').strip()
+    if not spec:
+        return None
+    years = []
+    for part in spec.split(','):
+        low, _, high = part.strip().partition('-')
+        years.extend(range(int(low), int(high or low) + 1))
+    return years
+
+
+def catalog_page_args(default_limit=None):
+    # ?prefix=, ?limit= and ?offset= of a catalog listing
+    prefix = request.args.get('prefix', '')
+    limit = request.args.get('limit', default_limit, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    if (limit is not None and limit < 0) or offset < 0:
+        raise ValueError("limit and offset must be non-negative integers")
+    return prefix, limit, offset
+
+
+def wants_progress():
+    return request.args.get('progress') == '1' or request.accept_mimetypes.best == 'application/x-ndjson'
+
+
+# -----------------------------------------------   product data shared by app.py and app2.py -----------------------------------------------
+
+class DataService:
+    # The product files and everything both apps derive from them the same way: columnar
+    # copies, the catalog, discovered schemas, file versions and trend aggregates, plus the
+    # shared state through which worker processes agree on schemas and publish changes.
+    # `invalidate_industry(industry)` is the app's hook for dropping what it derived itself.
+
+    def __init__(self, app, metrics, invalidate_industry, include_categorical=False):
+        self.app = app
+        self.metrics = metrics
+        self.invalidate_industry = invalidate_industry
+        self.include_categorical = include_categorical
+        self.data_dir = os.path.abspath(app.config['UPLOAD_FOLDER'])
+
+        # Typed, memory-mapped column copies of the product CSVs, and the frames read from them
+        self.columnar_store = ColumnarStore()
+        self.dataset_cache = DatasetCache(max_bytes=app.config['DATASET_CACHE_MAX_BYTES'], loader=self.load_columns)
+
+        # Industries and products with file version, rows, columns, Year range and last fit; listings read this
+        self.catalog = ProductCatalog(app.config['CATALOG_PATH'])
+
+        self.schemas = self.load_factors_and_influencing_factors()
+        self.factors = self.schemas.factors
+        self.influencing_factors = self.schemas.influencing_factors
+        self.target_variable = self.schemas.target_variable
+
+        # MD5 content hashes, only recomputed when a file's stat (mtime, size, inode) changes
+        self.file_versions = FileVersionTracker(hash_func=self.timed_hash_file)
+
+        # Sales Price aggregates by Year (and any other grouping asked for), kept per file version
+        self.trend_store = TrendStore(value_col='Sales Price')
+
+        # Explicit schema edits, industries declared without files yet, and fitted coefficients
+        # go through this store so every worker process serves the same prices. Each worker
+        # applies what changed since its last look before handling a request.
+        self.shared_state = SharedState(app.config['SHARED_STATE_PATH'])
+        self.state_lock = threading.RLock()
+        self.declared_industries = []
+        # Pushes the store's change log to /events subscribers
+        self.change_feed = ChangeFeed(self.shared_state, poll_interval=app.config['EVENTS_POLL_INTERVAL'],
+                                      heartbeat=app.config['EVENTS_HEARTBEAT'], max_subscribers=app.config['EVENTS_MAX_SUBSCRIBERS'])
+
+    def start(self):
+        if self.app.config['DATA_WATCH_INTERVAL'] > 0:
+            self.data_watcher = DirectoryWatcher(self.data_dir, self.file_versions, interval=self.app.config['DATA_WATCH_INTERVAL'],
+                                                 on_change=self.on_data_file_changed)
+            self.data_watcher.start()
+
+        # Reconcile the catalog with data_dir once per start; only new or changed files are read
+        stale = self.catalog.rescan(self.data_dir)
+        if stale and self.app.config['CATALOG_DESCRIBE_ON_START']:
+            threading.Thread(target=self.describe_products, args=(stale,), name='catalog-describe', daemon=True).start()
+
+    def load_factors_and_influencing_factors(self):
+        # Nothing is read here: each industry's schema is discovered from the header and
+        # a bounded sample of its first CSV the first time the industry is asked for, and
+        # again if that file changes underneath (which drops what was derived from it)
+        return IndustrySchemas(self.data_dir, sample_rows=self.app.config['SCHEMA_SAMPLE_ROWS'],
+                               include_categorical=self.include_categorical,
+                               on_change=lambda industry: self.invalidate_industry(industry))
+
+    def product_path(self, industry, product):
+        return os.path.join(self.data_dir, industry, f'{product}.csv')
+
+    def load_columns(self, file_path, columns=None, years=None):
+        with self.metrics.stage('read'):
+            frame = self.columnar_store.load(file_path, columns, years=years)
+        self.metrics.record_read('read', len(frame), int(frame.memory_usage(index=False).sum()))
+        return frame
+
+    def load_tail(self, file_path, columns, rows):
+        # Only the last `rows` records, for the defaults lookups
+        with self.metrics.stage('read'):
+            frame = self.columnar_store.tail(file_path, columns, rows)
+        self.metrics.record_read('tail', len(frame), int(frame.memory_usage(index=False).sum()))
+        return frame
+
+    def timed_hash_file(self, file_path):
+        with self.metrics.stage('hash'):
+            hasher = hash_file(file_path)
+        self.metrics.record_read('hash', 0, os.path.getsize(file_path))
+        return hasher
+
+    def get_industries(self):
+        return [industry for industry, _ in self.catalog.industries()]
+
+    def get_product_names(self, industry, prefix='', limit=None, offset=0):
+        if not self.catalog.has_industry(industry):
+            raise FileNotFoundError(f"Industry directory {industry} not found")
+        return self.catalog.product_names(industry, prefix, limit, offset)
+
+    def list_industries(self):
+        # Industries on disk, then ones declared through /update-industries that have no files yet
+        industries = self.get_industries()
+        return industries + [name for name in self.declared_industries if name not in industries]
+
+    def product_trend(self, file_path, by, years=None):
+        # Aggregates over every year come from the trend store; a year filter reads
+        # just those Year partitions of the product and aggregates them
+        if years is None:
+            return self.trend_store.get(file_path, self.file_versions.version(file_path), by,
+                                        lambda: self.dataset_cache.get(file_path, by + ['Sales Price']))
+        return aggregate(self.load_columns(file_path, by + ['Sales Price'], years=years), by, 'Sales Price')
+
+    def schema_tag(self, industry):
+        return [self.factors.get(industry), self.influencing_factors.get(industry), self.target_variable.get(industry)]
+
+    def product_etag(self, industry, product, *extra):
+        # Product file version (a stat check unless the file changed) and the factor configuration
+        industry = unquote(industry)
+        version = self.file_versions.version(self.product_path(industry, product))
+        return make_etag(industry, product, version, self.schema_tag(industry), *extra)
+
+    def industry_etag(self, industry, *extra):
+        industry = unquote(industry)
+        products = sorted(self.get_product_names(industry))
+        versions = [self.file_versions.version(self.product_path(industry, product)) for product in products]
+        return make_etag(industry, products, versions, self.schema_tag(industry), *extra)
+
+    def on_data_file_changed(self, file_path):
+        self.dataset_cache.invalidate(file_path)
+        parts = os.path.relpath(file_path, self.data_dir).split(os.sep)
+        if len(parts) == 2:
+            industry, product = parts[0], os.path.splitext(parts[1])[0]
+            try:
+                if not self.catalog.is_current(industry, product, stat_key(file_path)):
+                    self.describe_product(industry, product)
+            except FileNotFoundError:
+                self.catalog.remove_product(industry, product)
+            self.publish_change('file', industry, product, removed=not os.path.exists(file_path))
+
+    def describe_product(self, industry, product):
+        # File version, row count, columns and Year range for the catalog, read from the columnar copy
+        file_path = self.product_path(industry, product)
+        key = stat_key(file_path)
+        version = self.file_versions.version(file_path)
+        frame = self.columnar_store.load(file_path)
+        years = frame['Year'] if 'Year' in frame and pd.api.types.is_numeric_dtype(frame['Year']) else None
+        date_range = (None, None) if years is None or years.isna().all() else (float(years.min()), float(years.max()))
+        self.catalog.record_product(industry, product, key, version, len(frame), frame.columns, date_range)
+
+    def describe_products(self, stale):
+        for industry, product, _ in stale:
+            try:
+                self.describe_product(industry, product)
+            except Exception as e:
+                self.app.logger.warning("Catalog could not describe %s/%s: %s", industry, product, e)
+
+    def apply_schema(self, industry, schema):
+        factors, influencing_factors, target_variable = self.factors, self.influencing_factors, self.target_variable
+        current = (factors.get(industry), influencing_factors.get(industry), target_variable.get(industry)) if industry in factors else None
+        if schema is None:
+            for mapping in (factors, influencing_factors, target_variable):
+                mapping.pop(industry, None)
+        else:
+            factors[industry], influencing_factors[industry], target_variable[industry] = list(schema[0]), list(schema[1]), schema[2]
+        if current != schema:
+            self.invalidate_industry(industry)
+
+    def update_industry_schema(self, industry, change):
+        # change(current schema or None) -> new schema or None to delete; runs inside the
+        # store's write transaction so concurrent edits from other workers aren't lost
+        with self.state_lock:
+            local = (self.factors[industry], self.influencing_factors[industry], self.target_variable.get(industry)) \
+                if industry in self.factors else None
+            schema = self.shared_state.update_schema(industry, lambda current: change(current or local))
+            self.apply_schema(industry, schema)
+        return schema
+
+    def update_declared_industries(self, change):
+        with self.state_lock:
+            previous = list(self.declared_industries)
+            self.declared_industries[:] = self.shared_state.update_value('declared_industries', change, [])
+        for industry in self.declared_industries:
+            if industry not in previous:
+                self.publish_change('industry-added', industry)
+        for industry in previous:
+            if industry not in self.declared_industries:
+                self.publish_change('industry-removed', industry)
+
+    def publish_change(self, kind, industry, product=None, **data):
+        # Schema and coefficient writes log their own events; this covers the rest
+        self.shared_state.publish(kind, industry, product, data)
+        self.change_feed.poke()
+
+
+# -----------------------------------------------   routes shared by app.py and app2.py -----------------------------------------------
+
+def register_common_routes(app, data, http_cache):
+    catalog = data.catalog
+
+    @app.route('/events', methods=['GET'])
+    def change_events():
+        # Server-Sent Events: 'file' (a product file changed), 'coefficients' (a refit),
+        # 'factors' (factor list edited), 'industry-added' / 'industry-removed'. Each
+        # carries the shared state version; a reconnect resumes from Last-Event-ID
+        # (or ?since=<id>), a new client starts from now. 'reset' means the events
+        # since the client's id are gone from the log and it should refetch everything.
+        if not data.change_feed.accepting():
+            response = return_response(jsonify({"error": "Too many open event streams; poll instead"}), 503)
+            response.headers['Retry-After'] = '60'
+            return response
+        after = request.headers.get('Last-Event-ID') or request.args.get('since')
+        after = int(after) if after is not None and after.isdigit() else data.change_feed.last_id()
+        return Response(data.change_feed.stream(after), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    @app.route('/catalog', methods=['GET'])
+    def catalog_industries():
+        # Industries with their product counts, ?prefix= / ?limit= / ?offset= paged
+        try:
+            prefix, limit, offset = catalog_page_args(app.config['CATALOG_PAGE_SIZE'])
+        except ValueError as ve:
+            response = return_response(jsonify({"error": str(ve)}), 400)
+            return response
+        industries = [{'industry': industry, 'products': count} for industry, count in catalog.industries(prefix, limit, offset)]
+        response = return_response(jsonify({'total': catalog.count_industries(prefix), 'offset': offset, 'limit': limit,
+                                            'industries': industries}))
+        return response
+
+    @app.route('/catalog/<industry>', methods=['GET'])
+    def catalog_products(industry):
+        # One page of an industry's products with file version, rows, columns, Year range and last fit
+        industry = unquote(industry)  # Decode the industry name
+
+        try:
+            prefix, limit, offset = catalog_page_args(app.config['CATALOG_PAGE_SIZE'])
+        except ValueError as ve:
+            response = return_response(jsonify({"error": str(ve)}), 400)
+            return response
+        if not catalog.has_industry(industry):
+            response = return_response(jsonify({"error": f"Industry directory {industry} not found"}), 404)
+            return response
+        response = return_response(jsonify({'industry': industry, 'total': catalog.count_products(industry, prefix),
+                                            'offset': offset, 'limit': limit,
+                                            'products': catalog.products(industry, prefix, limit, offset)}))
+        return response
+
+    @app.route('/catalog/rescan', methods=['POST'])
+    def rescan_catalog():
+        # Picks up files added, replaced or removed outside the app, describing the changed ones now
+        stale = catalog.rescan(data.data_dir)
+        data.describe_products(stale)
+        response = return_response(jsonify({'described': len(stale), 'industries': catalog.count_industries()}))
+        return response
+
+    @app.route('/sales_trend/<industry>/<product>', methods=['GET', 'POST'])
+    @http_cache.conditional(lambda industry, product: data.product_etag(industry, product, parse_trend_grouping(), parse_trend_years()))
+    def sales_trend(industry, product):
+        industry = unquote(industry)  # Decode the industry name
+
+        file_path = data.product_path(industry, product)
+        try:
+            # Average Sales Price per group (Year unless ?by= says otherwise), served from memory;
+            # ?years= restricts it to those years
+            by = parse_trend_grouping()
+            trend_data = data.product_trend(file_path, by, parse_trend_years())
+
+            # Convert to dictionary for JSON response
+            trend_dict = to_records(trend_data, 'Sales Price')
+
+            return jsonify(trend_dict)
+        except Exception as e:
+            response = return_response(jsonify({"error": str(e)}), 400)
+            return response
+
+    @app.route('/sales_trend/<industry>', methods=['GET', 'POST'])
+    @http_cache.conditional(lambda industry: data.industry_etag(industry, parse_trend_grouping(), parse_trend_years()))
+    def industry_sales_trend(industry):
+        industry = unquote(industry)  # Decode the industry name
+
+        try:
+            by = parse_trend_grouping()
+            years = parse_trend_years()
+            aggregates = []
+            for product in data.get_product_names(industry):
+                aggregates.append(data.product_trend(data.product_path(industry, product), by, years))
+            if not aggregates:
+                return jsonify([])
+            return jsonify(to_records(TrendStore.rollup(aggregates), 'Sales Price'))
+        except FileNotFoundError:
+            response = return_response(jsonify({"error": f"Industry directory {industry} not found"}), 404)
+            return response
+        except Exception as e:
+            response = return_response(jsonify({"error": str(e)}), 400)
+            return response
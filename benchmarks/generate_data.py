@@ -0,0 +1,67 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# -----------------------------------------------   synthetic product data -----------------------------------------------
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def product_frame(rows, rng, start_year=2014):
+    # Same columns, order and rough ranges as data/Pharma/Drug1.csv; prices carry a
+    # linear signal so Ridge has something to fit
+    day = np.arange(rows)
+    year = start_year + day * 6 // max(rows, 1)
+    seasonal = (day // 30) % 12 + 1
+    cog = rng.normal(6.5, 1.5, rows).clip(2.5, 12)
+    mrp = cog * rng.uniform(2.2, 2.7, rows)
+    comp_price = mrp * rng.uniform(0.7, 0.95, rows)
+    demand = rng.gamma(2.0, 1.8, rows)
+    discount = rng.integers(5, 20, rows)
+    inflation = rng.uniform(-0.2, 2.9, rows).round(1)
+    sales_price = (0.45 * mrp + 0.35 * comp_price + 0.2 * demand - 0.05 * discount
+                   + 0.1 * inflation + rng.normal(0, 0.4, rows))
+    return pd.DataFrame({
+        'Customer segment': rng.integers(1, 4, rows),
+        'Year': year,
+        'Seasonal': seasonal,
+        'Weekday Name': np.array(WEEKDAYS)[day % 7],
+        'Sales Price': sales_price.round(2),
+        'Comp Price': comp_price.round(2),
+        'MRP': mrp.round(2),
+        'COG': cog.round(2),
+        'inflation rate': inflation,
+        'Demand Score': demand.round(2),
+        'discount rate': discount,
+        'Inventory levels': rng.uniform(30, 275, rows).round(2),
+        'Govt regulations': rng.uniform(11.6, 19.8, rows).round(1),
+        'Expiry days': rng.integers(30, 91, rows),
+    })
+
+
+def generate(root, industries=4, products=5, rows=2000, seed=0):
+    # Writes <root>/Industry<i>/Product<j>.csv; the same seed always gives the same files
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(industries):
+        industry_dir = os.path.join(root, f'Industry{i}')
+        os.makedirs(industry_dir, exist_ok=True)
+        for j in range(products):
+            path = os.path.join(industry_dir, f'Product{j}.csv')
+            product_frame(rows, rng).to_csv(path, index=False)
+            paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic data/ tree for benchmarks.')
+    parser.add_argument('root')
+    parser.add_argument('--industries', type=int, default=4)
+    parser.add_argument('--products', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate(args.root, args.industries, args.products, args.rows, args.seed)
@@ -0,0 +1,183 @@
+import argparse
+import datetime
+import importlib.metadata
+import importlib.util
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from generate_data import generate, product_frame
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# -----------------------------------------------   timing helpers -----------------------------------------------
+
+def summarize(samples):
+    ms = sorted(s * 1000 for s in samples)
+    return {
+        'n': len(ms),
+        'min_ms': round(ms[0], 3),
+        'median_ms': round(statistics.median(ms), 3),
+        'mean_ms': round(statistics.fmean(ms), 3),
+        'p95_ms': round(ms[min(len(ms) - 1, int(round(0.95 * (len(ms) - 1))))], 3),
+        'max_ms': round(ms[-1], 3),
+    }
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def load_app(module, alias):
+    # A fresh copy of app.py / app2.py under its own module name, i.e. a cold process
+    spec = importlib.util.spec_from_file_location(alias, os.path.join(ROOT, f'{module}.py'))
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[alias] = mod
+    start = time.perf_counter()
+    spec.loader.exec_module(mod)
+    return mod, time.perf_counter() - start
+
+
+def request(client, method, url, **kwargs):
+    response = getattr(client, method)(url, **kwargs)
+    if response.status_code >= 400:
+        raise RuntimeError(f"{method.upper()} {url} -> {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return response
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# -----------------------------------------------   benchmark suite -----------------------------------------------
+
+def run(args):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        data_root = os.path.join(tmp, 'data')
+        generate(data_root, args.industries, args.products, args.rows, args.seed)
+        os.environ.update({
+            'PRICING_DATA_DIR': data_root,
+            'MODEL_REGISTRY_DIR': os.path.join(tmp, 'models'),
+            'MODEL_WARMUP': '0',
+            'DATA_WATCH_INTERVAL': '0',
+            'CATALOG_DESCRIBE_ON_START': '0',
+        })
+
+        # Cold startup: module import (config, caches, shared state) and schema discovery
+        import_samples = []
+        for i in range(args.repeat):
+            os.environ['SHARED_STATE_PATH'] = os.path.join(tmp, f'state-{i}.sqlite3')
+            app_module, seconds = load_app('app', f'bench_app_{i}')
+            import_samples.append(seconds)
+        results['startup.import_app'] = import_samples
+        industries = app_module.get_industries()
+        load_schemas = app_module.data_service.load_factors_and_influencing_factors
+        results['startup.load_factors_and_influencing_factors'] = timed(load_schemas, args.repeat)
+        results['startup.discover_all_schemas'] = timed(lambda: load_schemas().load_all(industries), args.repeat)
+
+        client = app_module.app.test_client()
+        industry = industries[0]
+        products = sorted(app_module.get_product_names(industry))
+
+        # The first request per product is cold (columnar copy, cache, fit); repeats are warm
+        for name, url in [('GET /data/<industry>/<product>', '/data/{industry}/{product}'),
+                          ('GET /coefficients/<industry>/<product>', '/coefficients/{industry}/{product}'),
+                          ('GET /sales_trend/<industry>/<product>', '/sales_trend/{industry}/{product}')]:
+            cold = []
+            for product in products:
+                cold += timed(lambda: request(client, 'get', url.format(industry=industry, product=product)), 1)
+            results[f'{name} cold'] = cold
+            results[f'{name} warm'] = timed(
+                lambda: request(client, 'get', url.format(industry=industry, product=products[0])), args.repeat)
+        results['GET /data/<industry>'] = timed(lambda: request(client, 'get', f'/data/{industry}'), args.repeat)
+        results['GET /data/<industry>/defaults'] = timed(lambda: request(client, 'get', f'/data/{industry}/defaults'), args.repeat)
+
+        upload = product_frame(args.rows, np.random.default_rng(args.seed + 1)).to_csv(index=False).encode()
+        counter = iter(range(args.repeat))
+        results['POST /upload-csv'] = timed(lambda: request(
+            client, 'post', '/upload-csv', content_type='multipart/form-data',
+            data={'industryName': industry, 'csvFile': (io.BytesIO(upload), f'Upload{next(counter)}.csv')}), args.repeat)
+
+        # Model fits on the same product, outside of any request
+        file_path = os.path.join(data_root, industry, f'{products[0]}.csv')
+        features = app_module.influencing_factors[industry]
+        target = app_module.target_variable[industry]
+        df = app_module.dataset_cache.get(file_path, features + [target])
+        results['fit.ridge (app.py)'] = timed(lambda: app_module.get_ridge_coefficients(df, industry), args.repeat)
+
+        os.environ['SHARED_STATE_PATH'] = os.path.join(tmp, 'state-app2.sqlite3')
+        app2_module, _ = load_app('app2', 'bench_app2')
+        hgb_features = app2_module.influencing_factors[industry]
+        results['fit.hist_gradient_boosting (app2.py)'] = timed(
+            lambda: app2_module.fit_pipeline_job(file_path, hgb_features, target), args.fit_repeat)
+
+    return {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'params': {'industries': args.industries, 'products': args.products, 'rows': args.rows,
+                   'seed': args.seed, 'repeat': args.repeat, 'fit_repeat': args.fit_repeat},
+        'environment': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            **{package: importlib.metadata.version(package) for package in ('numpy', 'pandas', 'scikit-learn', 'flask')},
+        },
+        'results': {name: summarize(samples) for name, samples in results.items()},
+    }
+
+
+def compare(report, baseline, tolerance):
+    # Names whose median got slower than `tolerance` x the baseline median
+    regressions = {}
+    for name, current in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if previous and previous['median_ms'] > 0 and current['median_ms'] > tolerance * previous['median_ms']:
+            regressions[name] = {'baseline_ms': previous['median_ms'], 'current_ms': current['median_ms'],
+                                 'ratio': round(current['median_ms'] / previous['median_ms'], 2)}
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the pricing apps on synthetic data and print JSON.')
+    parser.add_argument('--industries', type=int, default=4)
+    parser.add_argument('--products', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--fit-repeat', type=int, default=3)
+    parser.add_argument('--output', help='write the report here instead of stdout')
+    parser.add_argument('--baseline', help='earlier report; exit 1 if any median regressed')
+    parser.add_argument('--tolerance', type=float, default=1.25)
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = compare(report, json.load(f), args.tolerance)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if report.get('regressions'):
+        sys.exit(1)
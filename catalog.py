@@ -0,0 +1,181 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from file_versions import stat_key
+from shared_state import _Transaction
+
+
+# -----------------------------------------------   industry / product catalog -----------------------------------------------
+
+def key_text(key):
+    return '-'.join(str(part) for part in key)
+
+
+class ProductCatalog:
+    # Every industry directory and product CSV under the data directory, with the
+    # product's file version, row count, columns, Year range and last fit time,
+    # kept in SQLite so listings are one indexed query instead of a directory walk
+    # per request. Uploads, appends, fits and deletions write through; rescan()
+    # reconciles with the tree for files that changed behind the app's back.
+    # Rows whose metadata is still NULL are listed but not yet described.
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS catalog_industries (industry TEXT PRIMARY KEY, updated_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS catalog_products (industry TEXT NOT NULL, product TEXT NOT NULL, "
+                         "stat_key TEXT, file_version TEXT, rows INTEGER, columns TEXT, date_min REAL, date_max REAL, "
+                         "fitted_at REAL, fitted_version TEXT, updated_at REAL NOT NULL, PRIMARY KEY (industry, product))")
+
+    def _connect(self):
+        # One connection per thread, never reused across a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self, mode='IMMEDIATE'):
+        return _Transaction(self._connect(), mode)
+
+    def rescan(self, root):
+        # One listing per industry directory. Adds and drops industries and products
+        # to match the tree; returns (industry, product, path) for every product that
+        # is new, changed since it was described, or not described yet.
+        on_disk = {}
+        for industry in os.listdir(root):
+            industry_dir = os.path.join(root, industry)
+            if industry.startswith('.') or not os.path.isdir(industry_dir):
+                continue
+            products = on_disk[industry] = {}
+            for name in os.listdir(industry_dir):
+                if name.endswith('.csv'):
+                    try:
+                        products[os.path.splitext(name)[0]] = key_text(stat_key(os.path.join(industry_dir, name)))
+                    except FileNotFoundError:
+                        continue
+
+        now = time.time()
+        stale = []
+        with self._transaction() as conn:
+            known_industries = {row[0] for row in conn.execute("SELECT industry FROM catalog_industries")}
+            known = {(industry, product): (key, rows) for industry, product, key, rows in conn.execute(
+                "SELECT industry, product, stat_key, rows FROM catalog_products")}
+            conn.executemany("DELETE FROM catalog_industries WHERE industry = ?",
+                             [(industry,) for industry in known_industries if industry not in on_disk])
+            conn.executemany("DELETE FROM catalog_products WHERE industry = ? AND product = ?",
+                             [key for key in known if key[1] not in on_disk.get(key[0], {})])
+            conn.executemany("INSERT OR IGNORE INTO catalog_industries VALUES (?, ?)",
+                             [(industry, now) for industry in on_disk if industry not in known_industries])
+            for industry, products in on_disk.items():
+                for product, key in products.items():
+                    entry = known.get((industry, product))
+                    if entry is not None and entry[0] == key and entry[1] is not None:
+                        continue
+                    if entry is None or entry[0] != key:
+                        conn.execute("INSERT OR REPLACE INTO catalog_products (industry, product, stat_key, updated_at) "
+                                     "VALUES (?, ?, ?, ?)", (industry, product, key, now))
+                    stale.append((industry, product, os.path.join(root, industry, f'{product}.csv')))
+        return stale
+
+    def add_industry(self, industry):
+        with self._transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO catalog_industries VALUES (?, ?)", (industry, time.time()))
+
+    def record_product(self, industry, product, key, file_version, rows, columns, date_range=(None, None)):
+        # The product as it is on disk now; its last fit is kept
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO catalog_industries VALUES (?, ?)", (industry, now))
+            conn.execute("INSERT OR IGNORE INTO catalog_products (industry, product, updated_at) VALUES (?, ?, ?)",
+                         (industry, product, now))
+            conn.execute("UPDATE catalog_products SET stat_key = ?, file_version = ?, rows = ?, columns = ?, "
+                         "date_min = ?, date_max = ?, updated_at = ? WHERE industry = ? AND product = ?",
+                         (key_text(key), file_version, rows, json.dumps(list(columns)), date_range[0], date_range[1],
+                          now, industry, product))
+
+    def record_append(self, industry, product, key, file_version, rows, date_range=(None, None)):
+        # Rows added at the end of an already described product
+        with self._transaction() as conn:
+            conn.execute("UPDATE catalog_products SET stat_key = ?, file_version = ?, rows = rows + ?, "
+                         "date_min = MIN(COALESCE(date_min, ?), COALESCE(?, date_min)), "
+                         "date_max = MAX(COALESCE(date_max, ?), COALESCE(?, date_max)), updated_at = ? "
+                         "WHERE industry = ? AND product = ?",
+                         (key_text(key), file_version, rows, date_range[0], date_range[0], date_range[1], date_range[1],
+                          time.time(), industry, product))
+
+    def record_fits(self, entries, fitted_at=None):
+        # entries: (industry, product, file version fitted)
+        fitted_at = time.time() if fitted_at is None else fitted_at
+        with self._transaction() as conn:
+            conn.executemany("UPDATE catalog_products SET fitted_at = ?, fitted_version = ? WHERE industry = ? AND product = ?",
+                             [(fitted_at, version, industry, product) for industry, product, version in entries])
+
+    def is_current(self, industry, product, key):
+        row = self._connect().execute("SELECT stat_key, rows FROM catalog_products WHERE industry = ? AND product = ?",
+                                      (industry, product)).fetchone()
+        return row is not None and row[0] == key_text(key) and row[1] is not None
+
+    def remove_product(self, industry, product):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM catalog_products WHERE industry = ? AND product = ?", (industry, product))
+
+    def remove_industry(self, industry):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM catalog_products WHERE industry = ?", (industry,))
+            conn.execute("DELETE FROM catalog_industries WHERE industry = ?", (industry,))
+
+    @staticmethod
+    def _prefix_clause(column, prefix):
+        # A range over the primary key rather than LIKE, so the index is used
+        if not prefix:
+            return '', ()
+        return f' AND {column} >= ? AND {column} < ?', (prefix, prefix + '\U0010ffff')
+
+    def has_industry(self, industry):
+        return self._connect().execute("SELECT 1 FROM catalog_industries WHERE industry = ?", (industry,)).fetchone() is not None
+
+    def industries(self, prefix='', limit=None, offset=0):
+        # [(industry, product count)] in name order
+        clause, params = self._prefix_clause('i.industry', prefix)
+        return self._connect().execute(
+            "SELECT i.industry, (SELECT COUNT(*) FROM catalog_products p WHERE p.industry = i.industry) "
+            f"FROM catalog_industries i WHERE 1 = 1{clause} ORDER BY i.industry LIMIT ? OFFSET ?",
+            params + (-1 if limit is None else limit, offset)).fetchall()
+
+    def count_industries(self, prefix=''):
+        clause, params = self._prefix_clause('industry', prefix)
+        return self._connect().execute(f"SELECT COUNT(*) FROM catalog_industries WHERE 1 = 1{clause}", params).fetchone()[0]
+
+    def product_names(self, industry, prefix='', limit=None, offset=0):
+        clause, params = self._prefix_clause('product', prefix)
+        return [row[0] for row in self._connect().execute(
+            f"SELECT product FROM catalog_products WHERE industry = ?{clause} ORDER BY product LIMIT ? OFFSET ?",
+            (industry,) + params + (-1 if limit is None else limit, offset))]
+
+    def count_products(self, industry, prefix=''):
+        clause, params = self._prefix_clause('product', prefix)
+        return self._connect().execute(f"SELECT COUNT(*) FROM catalog_products WHERE industry = ?{clause}",
+                                       (industry,) + params).fetchone()[0]
+
+    def products(self, industry, prefix='', limit=None, offset=0):
+        clause, params = self._prefix_clause('product', prefix)
+        rows = self._connect().execute(
+            "SELECT product, file_version, rows, columns, date_min, date_max, fitted_at, fitted_version, updated_at "
+            f"FROM catalog_products WHERE industry = ?{clause} ORDER BY product LIMIT ? OFFSET ?",
+            (industry,) + params + (-1 if limit is None else limit, offset)).fetchall()
+        return [{'product': product, 'file_version': file_version, 'rows': rows_count,
+                 'columns': None if columns is None else json.loads(columns),
+                 'date_range': None if date_min is None else [date_min, date_max],
+                 'fitted_at': fitted_at, 'fitted_current': fitted_version is not None and fitted_version == file_version,
+                 'updated_at': updated_at}
+                for product, file_version, rows_count, columns, date_min, date_max, fitted_at, fitted_version, updated_at in rows]
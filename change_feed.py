@@ -0,0 +1,89 @@
+import json
+import threading
+
+
+# -----------------------------------------------   Server-Sent Events change feed -----------------------------------------------
+
+class ChangeFeed:
+    # Streams the shared event log to SSE clients. One thread per process checks
+    # the log's newest id every `poll_interval` seconds, and only while someone is
+    # subscribed; clients block on a condition until it moves, so an idle
+    # connection costs no work beyond a keep-alive comment every `heartbeat` seconds.
+    # Each connection does hold a request thread for as long as it stays open, so
+    # serve /events from threaded or async workers; `max_subscribers` (None = no
+    # limit) caps how many one process keeps open at a time.
+
+    def __init__(self, shared_state, poll_interval=1.0, heartbeat=15.0, max_subscribers=None):
+        self.shared_state = shared_state
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.max_subscribers = max_subscribers
+        self._cond = threading.Condition()
+        self._last_id = None
+        self._subscribers = 0
+        self._thread = None
+
+    def last_id(self):
+        with self._cond:
+            if self._last_id is None:
+                self._last_id = self.shared_state.last_event_id()
+            return self._last_id
+
+    def accepting(self):
+        with self._cond:
+            return self.max_subscribers is None or self._subscribers < self.max_subscribers
+
+    def poke(self):
+        # Wake subscribers now instead of at the next poll, after a local write
+        latest = self.shared_state.last_event_id()
+        with self._cond:
+            if latest != self._last_id:
+                self._last_id = latest
+                self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._subscribers == 0:
+                    self._thread = None
+                    return
+            self.poke()
+            with self._cond:
+                self._cond.wait(self.poll_interval)
+
+    def _subscribe(self):
+        with self._cond:
+            self._subscribers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+                self._thread.start()
+
+    def _unsubscribe(self):
+        with self._cond:
+            self._subscribers -= 1
+
+    def stream(self, after_id):
+        # SSE text for every event after `after_id`; each carries its id so a
+        # reconnecting EventSource resumes through Last-Event-ID. When events after
+        # `after_id` have already been trimmed from the log (or the id is from another
+        # log), a 'reset' event tells the client to refetch everything instead.
+        self._subscribe()
+        try:
+            yield f'retry: {int(self.poll_interval * 3000)}\n\n'
+            while True:
+                latest = self.shared_state.last_event_id()
+                if after_id > latest or after_id < self.shared_state.first_event_id() - 1:
+                    after_id = latest
+                    yield f"id: {latest}\nevent: reset\ndata: {json.dumps({'id': latest, 'kind': 'reset'})}\n\n"
+                events = self.shared_state.events(after_id)
+                for event in events:
+                    yield f"id: {event['id']}\nevent: {event['kind']}\ndata: {json.dumps(event)}\n\n"
+                    after_id = event['id']
+                if events:
+                    continue
+                with self._cond:
+                    moved = self._cond.wait_for(lambda: (self._last_id or 0) > after_id, self.heartbeat)
+                if not moved:
+                    yield ': keep-alive\n\n'
+        finally:
+            self._unsubscribe()
@@ -0,0 +1,386 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from dataset_cache import read_csv_columns
+
+
+# -----------------------------------------------   raw CSV head / tail reads -----------------------------------------------
+
+def select_columns(frame, columns):
+    if columns is None:
+        return frame
+    missing = [name for name in columns if name not in frame.columns]
+    if missing:
+        raise KeyError(f"{missing} not in index")
+    return frame[list(columns)]
+
+
+def read_csv_head(file_path, rows, columns=None):
+    return select_columns(pd.read_csv(file_path, nrows=rows), columns)
+
+
+def read_csv_tail(file_path, rows, columns=None, block_size=8192):
+    # The last `rows` records without scanning the file: blocks are read backwards
+    # from the end until enough line breaks are seen, then parsed under the header.
+    # Quoted fields may span lines, so a tail containing quotes is read in full.
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        start = f.tell()
+        position = f.seek(0, os.SEEK_END)
+        data = b''
+        while position > start and data.rstrip(b'\r\n').count(b'\n') < rows:
+            step = min(block_size, position - start)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    if b'"' in data:
+        frame = read_csv_columns(file_path, columns)
+        return frame.iloc[max(len(frame) - rows, 0):].reset_index(drop=True)
+    lines = data.rstrip(b'\r\n').split(b'\n')[-rows:] if rows > 0 and data.strip() else []
+    body = header if header.endswith(b'\n') else header + b'\n'
+    return select_columns(pd.read_csv(io.BytesIO(body + b'\n'.join(lines))), columns)
+
+
+# -----------------------------------------------   columnar product storage -----------------------------------------------
+
+COLUMNAR_DIR = '.columnar'
+# Rows are indexed by runs of equal Year values; past this many runs (an unordered
+# history) there is no index and year reads fall back to one pass over Year
+PARTITION_COLUMN = 'Year'
+MAX_PARTITION_RUNS = 4096
+# Versions kept per product: the current one plus the one before it, which readers
+# that resolved it just before a rewrite may still be opening columns from
+KEEP_VERSIONS = 2
+
+
+def partition_runs(values, offset=0):
+    # [[value, start, stop], ...] for each run of equal values, in row order
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return []
+    same = (values[1:] == values[:-1]) | (np.isnan(values[1:]) & np.isnan(values[:-1]))
+    starts = np.r_[0, np.flatnonzero(~same) + 1]
+    stops = np.r_[starts[1:], len(values)]
+    return [[None if np.isnan(values[start]) else _partition_value(values[start]), int(start) + offset, int(stop) + offset]
+            for start, stop in zip(starts, stops)]
+
+
+def _partition_value(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def extend_runs(runs, more):
+    # Append runs from later rows, joining the boundary run if the value carries on
+    if runs is None:
+        return None
+    if runs and more and runs[-1][0] == more[0][0] and runs[-1][2] == more[0][1]:
+        runs[-1][2] = more[0][2]
+        more = more[1:]
+    runs.extend(more)
+    return runs if len(runs) <= MAX_PARTITION_RUNS else None
+
+
+def _version_order(name):
+    # Version directories are named <mtime_ns>-<size> of the CSV they were built from
+    try:
+        return tuple(int(part) for part in name.split('-'))
+    except ValueError:
+        return (0,)
+
+
+def _take(values, selection):
+    # selection: None (every row), a list of (start, stop) ranges, or row positions
+    if selection is None:
+        return values
+    if isinstance(selection, np.ndarray):
+        return values[selection]
+    if not selection:
+        return values[:0]
+    return np.concatenate([values[start:stop] for start, stop in selection])
+
+
+def _positions(selection):
+    if isinstance(selection, np.ndarray):
+        return selection
+    if not selection:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate([np.arange(start, stop) for start, stop in selection])
+
+
+def filter_years(frame, years, columns):
+    # Row-level fallback for frames parsed straight from the CSV
+    wanted = [float(year) for year in years]
+    frame = frame[pd.to_numeric(frame[PARTITION_COLUMN], errors='coerce').isin(wanted).to_numpy()]
+    return (frame if columns is None else frame[list(columns)]).reset_index(drop=True)
+
+
+class ColumnarStore:
+    # Typed, per-column copy of each product CSV:
+    #   <industry>/.columnar/<product>/<mtime_ns>-<size>/meta.json + <i>.npy
+    # Numeric columns keep their parsed dtype, other columns are dictionary-encoded
+    # (int32 codes + categories in meta.json). Reads memory-map only the requested
+    # columns, so worker processes share the page cache instead of re-parsing text.
+    # The CSV stays the source of truth; a copy whose stat key no longer matches
+    # the CSV is rebuilt on the next read. A reader resolves the version once and
+    # reads everything from it; old versions are removed a generation later.
+
+    @staticmethod
+    def _product_dir(csv_path):
+        industry_dir, filename = os.path.split(os.path.abspath(csv_path))
+        return os.path.join(industry_dir, COLUMNAR_DIR, os.path.splitext(filename)[0])
+
+    @staticmethod
+    def _source_key(csv_path):
+        st = os.stat(csv_path)
+        return f'{st.st_mtime_ns}-{st.st_size}'
+
+    def _version_dir(self, csv_path):
+        return os.path.join(self._product_dir(csv_path), self._source_key(csv_path))
+
+    def is_fresh(self, csv_path):
+        return os.path.exists(os.path.join(self._version_dir(csv_path), 'meta.json'))
+
+    @staticmethod
+    def _partitions(df):
+        if PARTITION_COLUMN not in df or not pd.api.types.is_numeric_dtype(df[PARTITION_COLUMN]):
+            return None
+        return extend_runs([], partition_runs(df[PARTITION_COLUMN].to_numpy()))
+
+    def build(self, csv_path, df=None):
+        source_key = self._source_key(csv_path)
+        product_dir = self._product_dir(csv_path)
+        final_dir = os.path.join(product_dir, source_key)
+        if df is None:
+            df = pd.read_csv(csv_path)
+            if self._source_key(csv_path) != source_key:
+                # The CSV changed while it was being read; don't label it with a stale key
+                return None
+
+        os.makedirs(product_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=product_dir, prefix='.build-')
+        try:
+            columns = []
+            for i, name in enumerate(df.columns):
+                series = df[name]
+                entry = {'name': name, 'file': f'{i}.npy'}
+                if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                    values = series.to_numpy()
+                    entry['kind'] = 'numeric'
+                else:
+                    codes, categories = pd.factorize(series)
+                    values = codes.astype(np.int32)
+                    entry['kind'] = 'categorical'
+                    entry['categories'] = [str(c) for c in categories]
+                entry['dtype'] = str(values.dtype)
+                np.save(os.path.join(tmp_dir, entry['file']), values)
+                columns.append(entry)
+
+            self._publish(tmp_dir, product_dir, source_key, len(df), columns, self._partitions(df))
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return final_dir
+
+    @staticmethod
+    def _publish(tmp_dir, product_dir, source_key, rows, columns, partitions=None):
+        meta = {'source': source_key, 'rows': rows, 'columns': columns,
+                'partitions': None if partitions is None else {'column': PARTITION_COLUMN, 'runs': partitions}}
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        try:
+            os.rename(tmp_dir, os.path.join(product_dir, source_key))
+        except OSError:
+            # Another worker published this version first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        # Older versions are no longer reachable for new readers, but one still
+        # mid-read may hold the previous one: keep it until the next publish
+        older = sorted((name for name in os.listdir(product_dir) if name != source_key and not name.startswith('.')),
+                       key=_version_order, reverse=True)
+        for name in older[KEEP_VERSIONS - 1:]:
+            shutil.rmtree(os.path.join(product_dir, name), ignore_errors=True)
+
+    def writer(self, csv_path):
+        return ColumnarWriter(self, csv_path)
+
+    def read_meta(self, csv_path):
+        with open(os.path.join(self._version_dir(csv_path), 'meta.json')) as f:
+            return json.load(f)
+
+    def load(self, csv_path, columns=None, rows=None, years=None):
+        # DataFrame over memory-mapped columns; converts the CSV first if needed.
+        # `rows` (a slice) and `years` (Year values) keep only those records, and
+        # only their pages of each column are read: a Year maps to row ranges.
+        version_dir = self._version_dir(csv_path)
+        if not os.path.exists(os.path.join(version_dir, 'meta.json')):
+            version_dir = self.build(csv_path)
+        if version_dir is None:
+            if years is None:
+                frame = read_csv_columns(csv_path, columns)
+            else:
+                names = None if columns is None else list(dict.fromkeys(list(columns) + [PARTITION_COLUMN]))
+                frame = filter_years(read_csv_columns(csv_path, names), years, columns)
+            return frame if rows is None else frame.iloc[rows].reset_index(drop=True)
+        with open(os.path.join(version_dir, 'meta.json')) as f:
+            meta = json.load(f)
+        by_name = {entry['name']: entry for entry in meta['columns']}
+
+        # A column asked for twice (e.g. the target also listed as a factor) is read once
+        names = [entry['name'] for entry in meta['columns']] if columns is None else list(dict.fromkeys(columns))
+        missing = [name for name in names if name not in by_name]
+        if missing:
+            raise KeyError(f"{missing} not in index")
+
+        selection = None
+        if years is not None:
+            selection = self._year_selection(version_dir, meta, by_name, years)
+        if rows is not None:
+            if selection is None:
+                start, stop, _ = rows.indices(meta['rows'])
+                selection = [(start, max(start, stop))]
+            else:
+                selection = _positions(selection)[rows]
+
+        data = {}
+        for name in names:
+            entry = by_name[name]
+            values = _take(np.load(os.path.join(version_dir, entry['file']), mmap_mode='r'), selection)
+            if entry['kind'] == 'categorical':
+                data[name] = pd.Categorical.from_codes(np.asarray(values), entry['categories'])
+            else:
+                data[name] = values
+        return pd.DataFrame(data, columns=names, copy=False)
+
+    def _year_selection(self, version_dir, meta, by_name, years):
+        wanted = {float(year) for year in years}
+        partitions = meta.get('partitions')
+        if partitions is not None:
+            return [(start, stop) for value, start, stop in partitions['runs'] if value is not None and float(value) in wanted]
+        # No run index: one pass over the Year column
+        if PARTITION_COLUMN not in by_name:
+            raise KeyError(f"{[PARTITION_COLUMN]} not in index")
+        entry = by_name[PARTITION_COLUMN]
+        values = np.load(os.path.join(version_dir, entry['file']), mmap_mode='r')
+        if entry['kind'] == 'categorical':
+            values = pd.Categorical.from_codes(np.asarray(values), entry['categories'])
+        return np.flatnonzero(pd.to_numeric(pd.Series(values), errors='coerce').isin(list(wanted)).to_numpy())
+
+    def head(self, csv_path, columns, n):
+        if self.is_fresh(csv_path):
+            return self.load(csv_path, columns, rows=slice(0, n))
+        return read_csv_head(csv_path, n, columns)
+
+    def tail(self, csv_path, columns, n):
+        # The last `n` records: a slice of the columnar copy when it is current,
+        # otherwise a backwards read of the CSV rather than converting all of it
+        if self.is_fresh(csv_path):
+            return self.load(csv_path, columns, rows=slice(-n, None) if n > 0 else slice(0, 0))
+        return read_csv_tail(csv_path, n, columns)
+
+    def discard(self, csv_path):
+        shutil.rmtree(self._product_dir(csv_path), ignore_errors=True)
+
+
+class ColumnarWriter:
+    # Builds a product's columnar copy from DataFrame chunks, for files too large
+    # to parse in one go. Each chunk is spilled as its own .npy part; finish()
+    # concatenates the parts per column once the total row count and the widest
+    # dtype are known, then publishes under the CSV's stat key.
+
+    def __init__(self, store, csv_path):
+        self.store = store
+        self.csv_path = csv_path
+        self.product_dir = store._product_dir(csv_path)
+        os.makedirs(self.product_dir, exist_ok=True)
+        self.tmp_dir = tempfile.mkdtemp(dir=self.product_dir, prefix='.build-')
+        self.columns = None  # [{'name', 'kind', 'parts': [(file, dtype, rows)], 'lookup'}]
+        self.rows = 0
+        self.runs = []  # Year runs seen so far, None once there are too many
+        self.usable = True
+
+    def write(self, chunk):
+        if not self.usable:
+            return
+        if self.columns is None:
+            self.columns = []
+            for name in chunk.columns:
+                series = chunk[name]
+                numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+                self.columns.append({'name': name, 'kind': 'numeric' if numeric else 'categorical',
+                                     'parts': [], 'lookup': {}, 'categories': []})
+
+        part = len(self.columns[0]['parts'])
+        for i, column in enumerate(self.columns):
+            series = chunk[column['name']]
+            if column['kind'] == 'numeric':
+                if not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+                    # Column turned out to be mixed; leave the copy to a lazy full build
+                    self.usable = False
+                    return
+                values = series.to_numpy()
+            else:
+                # Chunk-local codes are remapped onto the codes seen so far
+                codes, uniques = pd.factorize(series)
+                mapping = np.empty(len(uniques) + 1, dtype=np.int32)
+                mapping[-1] = -1
+                for j, value in enumerate(uniques):
+                    value = str(value)
+                    code = column['lookup'].get(value)
+                    if code is None:
+                        code = column['lookup'][value] = len(column['categories'])
+                        column['categories'].append(value)
+                    mapping[j] = code
+                values = mapping[codes]
+            part_file = f'{i}.{part}.part.npy'
+            np.save(os.path.join(self.tmp_dir, part_file), values)
+            column['parts'].append((part_file, values.dtype, len(values)))
+            if column['name'] == PARTITION_COLUMN:
+                self.runs = extend_runs(self.runs, partition_runs(values, self.rows)) if column['kind'] == 'numeric' else None
+        self.rows += len(chunk)
+
+    def finish(self):
+        # Call once the CSV is in place under its final name
+        if not self.usable or self.columns is None:
+            self.abort()
+            return None
+        try:
+            columns = []
+            for i, column in enumerate(self.columns):
+                dtype = np.result_type(*[dtype for _, dtype, _ in column['parts']])
+                entry = {'name': column['name'], 'file': f'{i}.npy', 'kind': column['kind'], 'dtype': str(dtype)}
+                if column['kind'] == 'categorical':
+                    entry['categories'] = column['categories']
+                out = np.lib.format.open_memmap(os.path.join(self.tmp_dir, entry['file']), mode='w+',
+                                                dtype=dtype, shape=(self.rows,))
+                offset = 0
+                for part_file, _, rows in column['parts']:
+                    part_path = os.path.join(self.tmp_dir, part_file)
+                    out[offset:offset + rows] = np.load(part_path, mmap_mode='r')
+                    offset += rows
+                    os.remove(part_path)
+                out.flush()
+                del out
+                columns.append(entry)
+            source_key = self.store._source_key(self.csv_path)
+            runs = self.runs if any(column['name'] == PARTITION_COLUMN for column in self.columns) else None
+            self.store._publish(self.tmp_dir, self.product_dir, source_key, self.rows, columns, runs)
+        except BaseException:
+            self.abort()
+            raise
+        return os.path.join(self.product_dir, source_key)
+
+    def abort(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        try:
+            os.rmdir(self.product_dir)
+        except OSError:
+            # Still holds a published version
+            pass
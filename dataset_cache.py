@@ -0,0 +1,98 @@
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+# -----------------------------------------------   shared dataset cache -----------------------------------------------
+
+def read_csv_columns(file_path, columns=None):
+    if columns is None:
+        return pd.read_csv(file_path)
+    return pd.read_csv(file_path, usecols=list(columns))[list(columns)]
+
+
+class DatasetCache:
+    # Parsed product files kept in memory, keyed by file identity (path, mtime, size)
+    # and the columns asked for, so a rewritten file is never served stale. Least
+    # recently used entries are evicted once the memory budget is exceeded.
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, loader=read_csv_columns):
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self._entries = OrderedDict()  # (path, columns) -> (identity, frame, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def file_identity(file_path):
+        st = os.stat(file_path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def get(self, file_path, columns=None):
+        # Callers share the returned DataFrame and must not mutate it in place
+        path = os.path.abspath(file_path)
+        key = (path, None if columns is None else tuple(columns))
+        identity = self.file_identity(path)  # Raises FileNotFoundError like pd.read_csv
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == identity:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        frame = self.loader(path, key[1])
+        nbytes = int(frame.memory_usage(deep=True).sum())
+
+        with self._lock:
+            self._drop(key)
+            if nbytes <= self.max_bytes:
+                self._entries[key] = (identity, frame, nbytes)
+                self._bytes += nbytes
+                while self._bytes > self.max_bytes:
+                    oldest = next(iter(self._entries))
+                    self._drop(oldest)
+                    self.evictions += 1
+        return frame
+
+    def invalidate(self, file_path):
+        path = os.path.abspath(file_path)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                self._drop(key)
+
+    def invalidate_prefix(self, directory):
+        # Drop every cached file below `directory`, e.g. a whole industry
+        prefix = os.path.join(os.path.abspath(directory), '')
+        with self._lock:
+            for key in [key for key in self._entries if key[0].startswith(prefix)]:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
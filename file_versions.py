@@ -0,0 +1,147 @@
+import hashlib
+import os
+import threading
+
+
+# -----------------------------------------------   file change detection -----------------------------------------------
+
+def stat_key(file_path):
+    st = os.stat(file_path)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def hash_file(file_path, hasher_factory=hashlib.md5):
+    # Returns the hasher itself so appends can extend it without re-reading the file
+    file_hash = hasher_factory()
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(8192):
+            file_hash.update(chunk)
+    return file_hash
+
+
+class FileVersionTracker:
+    # Content version of each product file. A stat() decides whether the file may
+    # have changed; the content hash is only recomputed when the stat changes or
+    # the file was marked dirty, so an unchanged file costs O(1) per lookup.
+
+    def __init__(self, hash_func=hash_file):
+        self.hash_func = hash_func
+        self._versions = {}  # path -> (stat key, content hash, hasher state)
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def version(self, file_path):
+        path = os.path.abspath(file_path)
+        key = stat_key(path)  # Raises FileNotFoundError for missing products
+        with self._lock:
+            known = self._versions.get(path)
+            if known is not None and known[0] == key and path not in self._dirty:
+                return known[1]
+
+        hasher = self.hash_func(path)
+        digest = hasher.hexdigest()
+        with self._lock:
+            self._versions[path] = (key, digest, hasher)
+            self._dirty.discard(path)
+        return digest
+
+    def record(self, file_path, hasher):
+        # Register a version whose hash was computed while the file was written
+        path = os.path.abspath(file_path)
+        digest = hasher.hexdigest()
+        with self._lock:
+            self._versions[path] = (stat_key(path), digest, hasher)
+            self._dirty.discard(path)
+        return digest
+
+    def record_append(self, file_path, data, previous_key):
+        # Extend the stored hash with bytes just appended to the file. Falls back
+        # to a full re-hash on the next lookup if the file moved on in between.
+        path = os.path.abspath(file_path)
+        with self._lock:
+            known = self._versions.get(path)
+            if known is None or known[0] != previous_key or path in self._dirty:
+                self._versions.pop(path, None)
+                return None
+            hasher = known[2].copy()
+            hasher.update(data)
+            digest = hasher.hexdigest()
+            self._versions[path] = (stat_key(path), digest, hasher)
+            return digest
+
+    def is_current(self, file_path, version):
+        try:
+            return self.version(file_path) == version
+        except FileNotFoundError:
+            return False
+
+    def mark_dirty(self, file_path, observed_key=None):
+        # A watcher passes the stat it saw; versions already recorded for that
+        # stat (e.g. by record_append) stay valid
+        path = os.path.abspath(file_path)
+        with self._lock:
+            known = self._versions.get(path)
+            if observed_key is not None and known is not None and known[0] == observed_key:
+                return
+            self._dirty.add(path)
+
+    def forget(self, file_path):
+        path = os.path.abspath(file_path)
+        with self._lock:
+            self._versions.pop(path, None)
+            self._dirty.discard(path)
+
+    def forget_prefix(self, directory):
+        prefix = os.path.join(os.path.abspath(directory), '')
+        with self._lock:
+            for path in [p for p in self._versions if p.startswith(prefix)]:
+                self._versions.pop(path, None)
+            self._dirty = {p for p in self._dirty if not p.startswith(prefix)}
+
+    def known_stat(self, file_path):
+        with self._lock:
+            known = self._versions.get(os.path.abspath(file_path))
+        return known[0] if known else None
+
+
+class DirectoryWatcher(threading.Thread):
+    # Polls `root` for added, changed or removed CSVs and marks them dirty in the
+    # tracker before the next request asks for them. `on_change(path)` is called
+    # for every file whose stat differs from the previous scan.
+
+    def __init__(self, root, tracker, interval=2.0, on_change=None):
+        super().__init__(name='data-dir-watcher', daemon=True)
+        self.root = root
+        self.tracker = tracker
+        self.interval = interval
+        self.on_change = on_change
+        self._snapshot = {}
+        self._stop_event = threading.Event()
+
+    def scan(self):
+        current = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for name in filenames:
+                if name.endswith('.csv'):
+                    path = os.path.join(dirpath, name)
+                    try:
+                        current[path] = stat_key(path)
+                    except FileNotFoundError:
+                        continue
+
+        changed = [(path, key) for path, key in current.items() if self._snapshot.get(path) != key]
+        changed += [(path, None) for path in self._snapshot if path not in current]
+        self._snapshot = current
+        return changed
+
+    def run(self):
+        self.scan()
+        while not self._stop_event.wait(self.interval):
+            for path, key in self.scan():
+                self.tracker.mark_dirty(path, key)
+                if self.on_change is not None:
+                    self.on_change(path)
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,83 @@
+import functools
+import gzip
+import hashlib
+import json
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # optional: responses are gzip-only without it
+    brotli = None
+
+
+# -----------------------------------------------   conditional requests and compression -----------------------------------------------
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript', 'application/x-ndjson')
+
+
+def make_etag(*parts):
+    # Opaque tag over whatever versions a response is derived from
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class HttpCache:
+    # Weak ETags (the body differs per Content-Encoding) plus Cache-Control on the
+    # views wrapped with conditional(), and gzip/brotli for large responses. A GET
+    # whose If-None-Match matches gets a 304 before the view runs, so nothing is
+    # read, fitted or serialised. Cache-Control defaults to max-age=0 with
+    # must-revalidate: browsers and proxies keep the body and ask again cheaply;
+    # a larger max_age lets them skip the request entirely for that long.
+
+    def __init__(self, app, max_age=0, min_size=1024, level=6):
+        self.max_age = max_age
+        self.min_size = min_size
+        self.level = level
+        app.after_request(self.compress)
+
+    def cache_control(self):
+        return f'public, max-age={self.max_age}, must-revalidate'
+
+    def conditional(self, etag_for):
+        # etag_for(**view_args) -> tag, or None to serve the request unconditionally.
+        # Only GET/HEAD responses with status 200 are tagged.
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return view(*args, **kwargs)
+                try:
+                    etag = etag_for(**kwargs)
+                except Exception:
+                    etag = None  # e.g. a missing file: let the view report it
+                if etag is None:
+                    return view(*args, **kwargs)
+                if request.if_none_match.contains_weak(etag):
+                    response = current_app.response_class(status=304)
+                else:
+                    response = current_app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                response.set_etag(etag, weak=True)
+                response.headers['Cache-Control'] = self.cache_control()
+                return response
+            return wrapper
+        return decorator
+
+    def compress(self, response):
+        response.vary.add('Accept-Encoding')
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or not response.mimetype.startswith(COMPRESSIBLE_TYPES)):
+            return response
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            response.set_data(brotli.compress(data, quality=min(self.level, 11)))
+            response.headers['Content-Encoding'] = 'br'
+        elif accepted['gzip']:
+            response.set_data(gzip.compress(data, compresslevel=self.level))
+            response.headers['Content-Encoding'] = 'gzip'
+        return response
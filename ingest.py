@@ -0,0 +1,182 @@
+import hashlib
+import io
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from ridge_stats import RidgeStats
+from schema_discovery import schema_from_frame
+from trend_store import aggregate, merge_aggregates
+
+
+# -----------------------------------------------   streaming CSV ingestion -----------------------------------------------
+
+class UploadRejected(ValueError):
+    pass
+
+
+class _TeeStream(io.RawIOBase):
+    # Everything the parser reads is also written to `sink` and hashed, so the
+    # upload is copied, hashed and parsed in a single pass
+    def __init__(self, source, sink, hasher):
+        self.source = source
+        self.sink = sink
+        self.hasher = hasher
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.source.read(len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        self.sink.write(data)
+        self.hasher.update(data)
+        self.bytes_read += n
+        return n
+
+
+def detach_stream(stream):
+    # The request closes its uploads once the view returns; a streamed response
+    # keeps reading the spooled upload through its own descriptor
+    try:
+        return os.fdopen(os.dup(stream.fileno()), 'rb')
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        # Small uploads are spooled in memory
+        return io.BytesIO(stream.read())
+
+
+def _stream_size(stream):
+    try:
+        position = stream.tell()
+        size = stream.seek(0, os.SEEK_END)
+        stream.seek(position)
+        return size - position
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+
+class CsvIngest:
+    # Writes an uploaded CSV to `file_path` while parsing it `chunk_rows` rows at
+    # a time; only one chunk is held in memory. Each chunk is validated against
+    # the industry schema and folded into running statistics (column means, Year
+    # trend aggregates, Ridge sufficient statistics) and the columnar copy.
+    # run() yields progress after every chunk; commit() then moves the file into
+    # place atomically, abort() leaves the previous file untouched.
+
+    def __init__(self, stream, file_path, schema=None, chunk_rows=50000, include_categorical=False,
+                 fit_ridge=True, trend_by=('Year',), trend_value='Sales Price', columnar_store=None):
+        self.stream = stream
+        self.file_path = file_path
+        self.schema = schema  # (factors, influencing_factors, target); None lets the first chunk decide
+        self.validate_schema = schema is not None
+        self.chunk_rows = chunk_rows
+        self.include_categorical = include_categorical
+        self.fit_ridge = fit_ridge
+        self.trend_by = tuple(trend_by)
+        self.trend_value = trend_value
+        self.columnar_store = columnar_store
+
+        self.total_bytes = _stream_size(stream)
+        self.hasher = hashlib.md5()
+        self.rows = 0
+        self.means = {}
+        self.ridge = None
+        self.trend = None
+        self._sums = {}
+        self._counts = {}
+        self._tmp_path = None
+        self._writer = None
+
+    def run(self):
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        fd, self._tmp_path = tempfile.mkstemp(dir=directory, prefix='.upload-', suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as sink:
+                tee = _TeeStream(self.stream, sink, self.hasher)
+                source = io.BufferedReader(tee)
+                try:
+                    for chunk in pd.read_csv(source, chunksize=self.chunk_rows):
+                        self._consume(chunk)
+                        yield self.progress(tee)
+                except pd.errors.EmptyDataError:
+                    raise UploadRejected("The uploaded file is empty")
+                except pd.errors.ParserError as e:
+                    raise UploadRejected(f"Could not parse the uploaded file: {e}")
+                # Copy anything the parser did not need (e.g. trailing blank lines)
+                while source.read(1024 * 1024):
+                    pass
+            if self.rows == 0:
+                raise UploadRejected("The uploaded file has no data rows")
+            self.means = {col: self._sums[col] / self._counts[col] for col in self._sums if self._counts[col]}
+            yield self.progress(tee)
+        except BaseException:
+            self.abort()
+            raise
+
+    def progress(self, tee):
+        return {'rows': self.rows, 'bytes': tee.bytes_read, 'total_bytes': self.total_bytes}
+
+    def _consume(self, chunk):
+        if self.schema is None:
+            self.schema = schema_from_frame(chunk, self.include_categorical)
+            if not self.schema[0]:
+                raise UploadRejected("The uploaded file has no numeric columns")
+        factors_val, influencing, target = self.schema
+
+        missing = [col for col in factors_val if col not in chunk.columns]
+        if missing:
+            raise UploadRejected(f"Missing columns: {', '.join(map(str, missing))}")
+        if not self.include_categorical:
+            non_numeric = [col for col in factors_val if not pd.api.types.is_numeric_dtype(chunk[col])]
+            if non_numeric:
+                raise UploadRejected(f"Non-numeric values in rows {self.rows + 1}-{self.rows + len(chunk)} of: "
+                                     f"{', '.join(map(str, non_numeric))}")
+
+        for col in chunk.columns:
+            if pd.api.types.is_numeric_dtype(chunk[col]) and not pd.api.types.is_bool_dtype(chunk[col]):
+                values = chunk[col]
+                self._sums[col] = self._sums.get(col, 0.0) + float(values.sum())
+                self._counts[col] = self._counts.get(col, 0) + int(values.count())
+
+        if self.trend_value in chunk.columns and all(col in chunk.columns for col in self.trend_by):
+            self.trend = merge_aggregates(self.trend, aggregate(chunk, self.trend_by, self.trend_value))
+
+        if self.fit_ridge and target in chunk.columns:
+            X = chunk[influencing].to_numpy(dtype=np.float64)
+            y = chunk[target].to_numpy(dtype=np.float64)
+            if np.isnan(X).any() or np.isnan(y).any():
+                # Ridge can't be fitted on missing values; stop accumulating
+                self.fit_ridge = False
+                self.ridge = None
+            else:
+                if self.ridge is None:
+                    self.ridge = RidgeStats(len(influencing))
+                self.ridge.update(X, y)
+
+        if self.columnar_store is not None:
+            if self._writer is None:
+                self._writer = self.columnar_store.writer(self.file_path)
+            self._writer.write(chunk)
+        self.rows += len(chunk)
+
+    def commit(self):
+        os.replace(self._tmp_path, self.file_path)
+        self._tmp_path = None
+        if self._writer is not None:
+            self._writer.finish()
+            self._writer = None
+
+    def abort(self):
+        if self._tmp_path is not None:
+            try:
+                os.remove(self._tmp_path)
+            except FileNotFoundError:
+                pass
+            self._tmp_path = None
+        if self._writer is not None:
+            self._writer.abort()
+            self._writer = None
@@ -0,0 +1,183 @@
+import contextvars
+import cProfile
+import io
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+
+# -----------------------------------------------   Prometheus metrics -----------------------------------------------
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+
+# Route template of the request being handled; work outside requests is 'background'
+current_route = contextvars.ContextVar('current_route', default='background')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label values -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += 1
+            entry[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, entry in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, entry):
+                    lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, [("le", repr(bound))])} {count}')
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, [("le", "+Inf")])} {entry[-2]}')
+                lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {entry[-2]}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {entry[-1]}')
+        return lines
+
+
+class PricingMetrics:
+    # The app's metric families. Values are per process; each worker exposes its own.
+
+    def __init__(self, prefix='pricing'):
+        self.requests = Histogram(f'{prefix}_request_duration_seconds', 'Request latency by route.',
+                                  ('route', 'method', 'status'))
+        self.stages = Histogram(f'{prefix}_stage_duration_seconds', 'Time spent in data reads, file hashing and model fits.',
+                                ('route', 'stage'))
+        self.rows_read = Counter(f'{prefix}_rows_read_total', 'Rows read from product files.', ('route', 'stage'))
+        self.bytes_read = Counter(f'{prefix}_bytes_read_total', 'Bytes read from product files.', ('route', 'stage'))
+        self.coefficient_lookups = Counter(f'{prefix}_coefficient_lookups_total',
+                                           'Coefficient requests by outcome (memory hit, registry load, fit, pending fit).',
+                                           ('industry', 'product', 'result'))
+        self.fits = Histogram(f'{prefix}_fit_duration_seconds', 'Model fit time per product.',
+                              ('industry', 'product', 'model'))
+        self.prediction_batches = Histogram(f'{prefix}_prediction_batch_rows', 'Rows per micro-batched predict() call.',
+                                            buckets=ROW_BUCKETS)
+        self._families = [self.requests, self.stages, self.rows_read, self.bytes_read, self.coefficient_lookups, self.fits,
+                          self.prediction_batches]
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.observe(time.perf_counter() - start, route=current_route.get(), stage=name)
+
+    def record_read(self, stage, rows, nbytes):
+        route = current_route.get()
+        self.rows_read.inc(rows, route=route, stage=stage)
+        self.bytes_read.inc(nbytes, route=route, stage=stage)
+
+    def record_prediction_batch(self, rows, seconds):
+        self.prediction_batches.observe(rows)
+        self.stages.observe(seconds, route=current_route.get(), stage='predict')
+
+    def render(self):
+        lines = []
+        for family in self._families:
+            lines += family.render()
+        return '\n'.join(lines) + '\n'
+
+
+# -----------------------------------------------   per-request profiling -----------------------------------------------
+
+PROFILE_SORT_KEYS = {'cumulative', 'tottime', 'ncalls', 'time', 'calls'}
+
+
+class ProfilingMiddleware:
+    # WSGI wrapper: a request carrying `X-Profile: 1` (or a pstats sort key such as
+    # `X-Profile: tottime`) runs under cProfile and gets the top of the profile back
+    # as text/plain instead of its normal body; the original status is kept in
+    # X-Profile-Status. Streamed responses (no Content-Length, e.g. the /events
+    # feed) are passed through unprofiled rather than buffered until they end.
+
+    def __init__(self, wsgi_app, limit=40, header='HTTP_X_PROFILE'):
+        self.wsgi_app = wsgi_app
+        self.limit = limit
+        self.header = header
+
+    def __call__(self, environ, start_response):
+        mode = environ.get(self.header, '').strip().lower()
+        if not mode or mode in ('0', 'false', 'no'):
+            return self.wsgi_app(environ, start_response)
+        sort_key = mode if mode in PROFILE_SORT_KEYS else 'cumulative'
+
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured['status'] = status
+            captured['headers'] = headers
+            captured['exc_info'] = exc_info
+            return lambda data: None
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            body = self.wsgi_app(environ, capture)
+            if 'headers' in captured and not any(name.lower() == 'content-length' for name, _ in captured['headers']):
+                profiler.disable()
+                start_response(captured['status'], captured['headers'], captured['exc_info'])
+                return body
+            try:
+                for _ in body:
+                    pass
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+        finally:
+            profiler.disable()
+        elapsed = time.perf_counter() - start
+
+        out = io.StringIO()
+        out.write(f"{environ.get('REQUEST_METHOD')} {environ.get('PATH_INFO')} -> {captured.get('status')} "
+                  f"in {elapsed * 1000:.1f} ms\n\n")
+        pstats.Stats(profiler, stream=out).sort_stats(sort_key).print_stats(self.limit)
+        data = out.getvalue().encode('utf-8')
+        start_response('200 OK', [('Content-Type', 'text/plain; charset=utf-8'), ('Content-Length', str(len(data))),
+                                  ('X-Profile-Status', captured.get('status', ''))])
+        return [data]
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import joblib
+
+
+# -----------------------------------------------   on-disk model registry -----------------------------------------------
+
+class ModelRegistry:
+    # Fitted models persisted under <root>/<industry>/<product>.<kind>.joblib.
+    # Each entry records the product file version and the influencing factors it
+    # was fitted with; a lookup with a different version or factor list misses.
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def entry_key(version, feature_names):
+        # Factor order is irrelevant to the fit, only the set of factors is
+        payload = json.dumps([version, sorted(feature_names)])
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, industry, product, kind):
+        return os.path.join(self.root, industry, f'{product}.{kind}.joblib')
+
+    def load(self, industry, product, version, feature_names, kind='ridge'):
+        path = self._path(industry, product, kind)
+        try:
+            entry = joblib.load(path)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Unreadable or written by an incompatible library version: refit
+            return None
+        if entry.get('key') != self.entry_key(version, feature_names):
+            return None
+        return entry['model']
+
+    def save(self, industry, product, version, feature_names, model, kind='ridge'):
+        path = self._path(industry, product, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {'key': self.entry_key(version, feature_names), 'version': version,
+                 'features': list(feature_names), 'model': model}
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(fd)
+        try:
+            joblib.dump(entry, tmp_path)
+            with self._lock:
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def discard(self, industry, product=None):
+        if product is None:
+            paths = [os.path.join(self.root, industry, name) for name in self._listdir(industry)]
+        else:
+            paths = [os.path.join(self.root, industry, name) for name in self._listdir(industry)
+                     if name.startswith(f'{product}.')]
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _listdir(self, industry):
+        try:
+            return os.listdir(os.path.join(self.root, industry))
+        except FileNotFoundError:
+            return []
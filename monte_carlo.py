@@ -0,0 +1,171 @@
+import os
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from columnar_store import ColumnarStore
+
+
+# -----------------------------------------------   Monte Carlo price risk -----------------------------------------------
+
+DISTRIBUTIONS = ('empirical', 'normal', 'uniform', 'triangular', 'lognormal')
+CHUNK_DRAWS = 262144
+
+
+def product_rng(seed, industry, product):
+    # Independent, reproducible stream per product whichever process runs it
+    return np.random.default_rng([int(seed), zlib.crc32(f'{industry}/{product}'.encode('utf-8'))])
+
+
+def normalize_distribution(spec):
+    if isinstance(spec, str):
+        spec = {'dist': spec}
+    if not isinstance(spec, dict) or spec.get('dist', 'empirical') not in DISTRIBUTIONS:
+        raise ValueError(f"Distribution must be one of {', '.join(DISTRIBUTIONS)}")
+    return {'dist': 'empirical', **spec}
+
+
+def _parametric(rng, spec, n, column):
+    # Parameters left out are estimated from the product's history
+    dist = spec['dist']
+    if dist == 'normal':
+        mean = spec['mean'] if 'mean' in spec else np.nanmean(column)
+        std = spec['std'] if 'std' in spec else np.nanstd(column)
+        return rng.normal(float(mean), float(std), n)
+    if dist == 'uniform':
+        low = spec['low'] if 'low' in spec else np.nanmin(column)
+        high = spec['high'] if 'high' in spec else np.nanmax(column)
+        return rng.uniform(float(low), float(high), n)
+    if dist == 'triangular':
+        low = spec['low'] if 'low' in spec else np.nanmin(column)
+        high = spec['high'] if 'high' in spec else np.nanmax(column)
+        mode = spec['mode'] if 'mode' in spec else np.nanmedian(column)
+        return rng.triangular(float(low), float(mode), float(high), n)
+    # lognormal: mean/sigma of the underlying normal
+    if 'mean' in spec and 'sigma' in spec:
+        mean, sigma = float(spec['mean']), float(spec['sigma'])
+    else:
+        logs = np.log(column[column > 0])
+        mean, sigma = float(np.mean(logs)), float(np.std(logs))
+    return rng.lognormal(mean, sigma, n)
+
+
+def simulate_prices(rng, feature_names, coefs, intercept, fixed, distributions, history, draws,
+                    percentiles=(5, 25, 50, 75, 95), cost=np.nan, cost_factor='COG'):
+    # Sales Price = intercept + coefs . factors, with the factors named in
+    # `distributions` drawn and the rest held at `fixed`. Empirical factors are
+    # bootstrapped together, row by row, so their joint behaviour is kept.
+    # Margin is negative when the price falls below `cost`, or below the drawn
+    # COG when COG is one of the uncertain factors. Draws are generated in
+    # fixed-size chunks; everything within a chunk is vectorised.
+    coefs = np.asarray(coefs, dtype=np.float64)
+    fixed = np.asarray(fixed, dtype=np.float64)
+    uncertain = [name for name in feature_names if name in distributions]
+    unknown = [name for name in distributions if name not in feature_names]
+    if unknown:
+        raise ValueError(f"Not influencing factors: {', '.join(unknown)}")
+    positions = {name: i for i, name in enumerate(feature_names)}
+    empirical = [name for name in uncertain if distributions[name]['dist'] == 'empirical']
+    parametric = [name for name in uncertain if distributions[name]['dist'] != 'empirical']
+
+    if uncertain and (history is None or len(history) == 0):
+        raise ValueError("No history to draw from")
+    history_columns = {name: np.asarray(history[name], dtype=np.float64) for name in uncertain}
+    if empirical:
+        # Rows with a missing value in any bootstrapped factor are left out
+        empirical_matrix = np.column_stack([history_columns[name] for name in empirical])
+        empirical_matrix = empirical_matrix[~np.isnan(empirical_matrix).any(axis=1)]
+        if len(empirical_matrix) == 0:
+            raise ValueError("History has no complete rows for the empirical factors")
+
+    held = np.nan_to_num(fixed)
+    held[[positions[name] for name in uncertain]] = 0.0
+    base = intercept + float(coefs @ held)
+    empirical_coefs = coefs[[positions[name] for name in empirical]]
+    has_cost = cost_factor in uncertain or not np.isnan(cost)
+    prices = np.empty(draws)
+    negative = 0
+    for start in range(0, draws, CHUNK_DRAWS):
+        n = min(CHUNK_DRAWS, draws - start)
+        chunk = np.full(n, base)
+        chunk_cost = cost
+        if empirical:
+            rows = empirical_matrix[rng.integers(0, len(empirical_matrix), n)]
+            chunk += rows @ empirical_coefs
+            if cost_factor in empirical:
+                chunk_cost = rows[:, empirical.index(cost_factor)]
+        for name in parametric:
+            values = _parametric(rng, distributions[name], n, history_columns[name])
+            chunk += coefs[positions[name]] * values
+            if name == cost_factor:
+                chunk_cost = values
+        prices[start:start + n] = chunk
+        if has_cost:
+            negative += int(np.count_nonzero(chunk < chunk_cost))
+
+    qs = np.percentile(prices, percentiles)
+    return {
+        'draws': draws,
+        'uncertain': uncertain,
+        'mean': float(prices.mean()),
+        'std': float(prices.std()),
+        'min': float(prices.min()),
+        'max': float(prices.max()),
+        'percentiles': {f'{p:g}': float(q) for p, q in zip(percentiles, qs)},
+        'prob_negative_margin': negative / draws if has_cost else None,
+    }
+
+
+def simulate_product_job(file_path, industry, product, feature_names, coefs, intercept, fixed, cost, distributions,
+                         draws, seed, percentiles, history_window=None):
+    # Runs in a pool worker as well as inline: reads the product's history from its
+    # columnar copy itself so only the path crosses the process boundary
+    needed = [name for name in feature_names if name in distributions]
+    history = None
+    if needed:
+        history = ColumnarStore().load(file_path, needed)
+        if history_window:
+            history = history.iloc[-history_window:]
+    rng = product_rng(seed, industry, product)
+    return simulate_prices(rng, feature_names, coefs, intercept, fixed, distributions, history, draws, percentiles, cost)
+
+
+class MonteCarloRunner:
+    # Runs one job per product, inline for a single product and across worker
+    # processes for whole-industry runs
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def run(self, jobs):
+        # jobs: {product: kwargs for simulate_product_job} -> {product: result or Exception}
+        results = {}
+        if len(jobs) <= 1 or self.max_workers <= 1:
+            for product, kwargs in jobs.items():
+                try:
+                    results[product] = simulate_product_job(**kwargs)
+                except Exception as e:
+                    results[product] = e
+            return results
+        executor = self._get_executor()
+        futures = {product: executor.submit(simulate_product_job, **kwargs) for product, kwargs in jobs.items()}
+        for product, future in futures.items():
+            try:
+                results[product] = future.result()
+            except Exception as e:
+                results[product] = e
+        return results
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
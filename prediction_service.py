@@ -0,0 +1,155 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+
+
+# -----------------------------------------------   resident fitted pipelines -----------------------------------------------
+
+class ModelCache:
+    # Fitted pipelines kept in memory, least recently used evicted past `max_models`.
+    # An entry only answers for the file version and factor list it was fitted on.
+
+    def __init__(self, max_models=64):
+        self.max_models = max_models
+        self._models = OrderedDict()  # (industry, product) -> (version, factor tuple, model)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, feature_names):
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is None or entry[0] != version or entry[1] != tuple(feature_names):
+                self.misses += 1
+                return None
+            self._models.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, version, feature_names, model):
+        with self._lock:
+            self._models[key] = (version, tuple(feature_names), model)
+            self._models.move_to_end(key)
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+
+    def invalidate_industry(self, industry):
+        with self._lock:
+            for key in [key for key in self._models if key[0] == industry]:
+                del self._models[key]
+
+    def stats(self):
+        with self._lock:
+            return {'models': len(self._models), 'max_models': self.max_models, 'hits': self.hits, 'misses': self.misses}
+
+
+def numeric_columns(model):
+    # Columns the pipeline's preprocessor scales as numbers
+    for name, _, cols in model.named_steps['preprocessor'].transformers_:
+        if name == 'num':
+            return list(cols)
+    return []
+
+
+def coerce_rows(rows, feature_names, numeric):
+    # Row dicts -> value lists in factor order; numbers for numeric factors, strings
+    # for the rest, missing values as NaN/None (the regressor handles missing values)
+    numeric = set(numeric)
+    coerced = []
+    for row in rows:
+        if not isinstance(row, dict):
+            raise ValueError("Each row must be an object of factor -> value")
+        unknown = [name for name in row if name not in feature_names]
+        if unknown:
+            raise ValueError(f"Not influencing factors: {', '.join(map(str, unknown))}")
+        values = []
+        for name in feature_names:
+            value = row.get(name)
+            if name in numeric:
+                values.append(np.nan if value is None else float(value))
+            else:
+                values.append(None if value is None else str(value))
+        coerced.append(values)
+    return coerced
+
+
+# -----------------------------------------------   request micro-batching -----------------------------------------------
+
+class MicroBatcher:
+    # Predictions are queued to one thread that waits up to `max_wait` seconds after
+    # the first arrival for more (or until `max_rows` rows are waiting), then runs a
+    # single predict() per model over all the rows collected. Concurrent single-row
+    # requests thus share one sklearn call instead of paying its overhead each.
+
+    def __init__(self, max_rows=1024, max_wait=0.002, on_batch=None):
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self.on_batch = on_batch  # on_batch(rows, seconds) after every predict() call
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_thread(self):
+        # Started on first use so importing the app never starts threads
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='prediction-batcher', daemon=True)
+                self._thread.start()
+
+    def submit(self, model, feature_names, numeric, rows):
+        # rows: value lists from coerce_rows(); the future resolves to an array of predictions
+        future = Future()
+        self._ensure_thread()
+        self._queue.put((model, tuple(feature_names), tuple(numeric), rows, future))
+        return future
+
+    def predict(self, model, feature_names, numeric, rows, timeout=None):
+        return self.submit(model, feature_names, numeric, rows).result(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            waiting = len(batch[0][3])
+            deadline = time.monotonic() + self.max_wait
+            while waiting < self.max_rows:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+                waiting += len(item[3])
+            self._flush(batch)
+
+    def _flush(self, batch):
+        groups = {}
+        for item in batch:
+            groups.setdefault((id(item[0]), item[1]), []).append(item)
+        for items in groups.values():
+            model, feature_names, numeric = items[0][0], items[0][1], items[0][2]
+            futures = [item[4] for item in items if item[4].set_running_or_notify_cancel()]
+            items = [item for item in items if item[4] in futures]
+            if not items:
+                continue
+            try:
+                start = time.perf_counter()
+                frame = pd.DataFrame([row for item in items for row in item[3]], columns=list(feature_names))
+                for name in numeric:
+                    frame[name] = frame[name].astype(np.float64)
+                predictions = model.predict(frame)
+                if self.on_batch is not None:
+                    self.on_batch(len(frame), time.perf_counter() - start)
+            except Exception as e:
+                for item in items:
+                    item[4].set_exception(e)
+                continue
+            offset = 0
+            for item in items:
+                count = len(item[3])
+                item[4].set_result(predictions[offset:offset + count])
+                offset += count
@@ -0,0 +1,102 @@
+import numpy as np
+
+
+# -----------------------------------------------   vectorized pricing helpers -----------------------------------------------
+
+def stack_coefficients(coefficient_dicts, feature_names):
+    # One row per product, one column per influencing factor (missing factors weigh 0)
+    coef_matrix = np.array([[float(coefs.get(name, 0.0)) for name in feature_names] for coefs in coefficient_dicts], dtype=np.float64)
+    intercepts = np.array([float(coefs.get('const', 0.0)) for coefs in coefficient_dicts], dtype=np.float64)
+    return coef_matrix.reshape(len(coefficient_dicts), len(feature_names)), intercepts
+
+
+def base_prices(coef_matrix, intercepts, factor_matrix):
+    # const + sum(coef * factor) for every product at once
+    return intercepts + np.einsum('pf,pf->p', coef_matrix, factor_matrix)
+
+
+def margin_adjusted_prices(prices, sales_price, cog, margin=None):
+    # Same adjustment the analyzer applies in the browser:
+    #   prevMargin = (SP - COG) / SP * 100
+    #   price      = 1 / ((1 / price) - (margin - prevMargin) / (100 * COG))
+    # Inputs broadcast, so `margin` may carry extra leading (scenario) axes.
+    sales_price = np.asarray(sales_price, dtype=np.float64)
+    cog = np.asarray(cog, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prev_margin = (sales_price - cog) / sales_price * 100
+        if margin is None:
+            margin = prev_margin
+        margin = np.where(np.isnan(margin), prev_margin, margin)
+        change = margin - prev_margin
+        adjusted = 1 / ((1 / prices) - (change / (100 * cog)))
+    return adjusted, margin
+
+
+def parse_product_requests(requested):
+    # {"p1": {...}}, [{"product": "p1", "factors": {...}, "margin": m}] or ["p1", ...]
+    # -> {product: {"factors": {...}, "margin": float | None}}; any other shape raises
+    # TypeError/ValueError so the routes can answer 400
+    if isinstance(requested, list):
+        entries = {}
+        for item in requested:
+            if isinstance(item, str):
+                entries[item] = {}
+            elif isinstance(item, dict) and isinstance(item.get('product'), str):
+                entries[item['product']] = item
+            else:
+                raise TypeError(f"Invalid product entry {item!r}; expected a name or an object with 'product'")
+        requested = entries
+    if not isinstance(requested, dict):
+        raise TypeError("products must be an object, a list or null")
+
+    parsed = {}
+    for product, overrides in requested.items():
+        overrides = {} if overrides is None else overrides
+        if not isinstance(overrides, dict):
+            raise TypeError(f"Overrides for {product} must be an object")
+        factor_values = overrides.get('factors') or {}
+        if not isinstance(factor_values, dict):
+            raise TypeError(f"factors of {product} must be an object")
+        margin = overrides.get('margin')
+        parsed[product] = {'factors': factor_values, 'margin': None if margin is None else float(margin)}
+    return parsed
+
+
+# -----------------------------------------------   what-if scenario sweeps -----------------------------------------------
+
+def scenario_axis(spec, max_values=None):
+    # A list of values, or {"start", "stop", "step"} (stop inclusive) / {"start", "stop", "num"}
+    if isinstance(spec, dict):
+        start, stop = float(spec['start']), float(spec['stop'])
+        if 'num' in spec:
+            count = int(spec['num'])
+        else:
+            step = float(spec.get('step', 1.0))
+            if step <= 0:
+                raise ValueError("step must be positive")
+            count = int(np.floor((stop - start) / step + 1e-9)) + 1
+        if max_values is not None and count > max_values:
+            raise ValueError(f"Axis has {count} values, more than {max_values}")
+        if 'num' in spec:
+            return np.linspace(start, stop, count)
+        return np.arange(max(count, 0)) * step + start
+    if isinstance(spec, (list, tuple)):
+        return np.array([np.nan if value is None else float(value) for value in spec], dtype=np.float64)
+    return np.array([float(spec)], dtype=np.float64)
+
+
+def expand_grid(axes):
+    # Cartesian product of named axes -> one flat column per name (first axis varies slowest)
+    names = list(axes)
+    if not names:
+        return {}
+    mesh = np.meshgrid(*[axes[name] for name in names], indexing='ij')
+    return {name: values.reshape(-1) for name, values in zip(names, mesh)}
+
+
+def scenario_prices(coef_matrix, intercepts, factor_matrix, multipliers):
+    # multipliers: (scenarios x factors) scale applied to every product's factors.
+    # price[s, p] = const[p] + sum_f coef[p, f] * factor[p, f] * multiplier[s, f],
+    # i.e. one (S x F) @ (F x P) product.
+    contributions = coef_matrix * factor_matrix
+    return intercepts[np.newaxis, :] + multipliers @ contributions.T
@@ -0,0 +1,222 @@
+import numpy as np
+
+
+# -----------------------------------------------   Ridge sufficient statistics -----------------------------------------------
+
+class RidgeStats:
+    # Sufficient statistics for a Ridge fit with an intercept: n, column means and
+    # the centered cross products Xc'Xc, Xc'yc. They are the mean-shifted form of
+    # X'X, X'y and the column sums; keeping them centered avoids the cancellation
+    # X'X - n*mean*mean' suffers on columns like Year. Batches are merged with the
+    # pairwise update of Chan et al., O(k*p^2) for k new rows.
+
+    def __init__(self, n_features):
+        self.n = 0
+        self.mean_x = np.zeros(n_features)
+        self.mean_y = 0.0
+        self.sxx = np.zeros((n_features, n_features))
+        self.sxy = np.zeros(n_features)
+        self.syy = 0.0
+
+    @classmethod
+    def from_arrays(cls, X, y):
+        X = np.asarray(X, dtype=np.float64)
+        stats = cls(X.shape[1])
+        stats.update(X, y)
+        return stats
+
+    @staticmethod
+    def _batch(X, y):
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        mean_x = X.mean(axis=0)
+        mean_y = y.mean()
+        Xc = X - mean_x
+        yc = y - mean_y
+        return len(y), mean_x, mean_y, Xc.T @ Xc, Xc.T @ yc, yc @ yc
+
+    def update(self, X, y):
+        if len(y) == 0:
+            return self
+        nb, mean_xb, mean_yb, sxx_b, sxy_b, syy_b = self._batch(X, y)
+        na = self.n
+        n = na + nb
+        dx = mean_xb - self.mean_x
+        dy = mean_yb - self.mean_y
+        w = na * nb / n
+        self.sxx = self.sxx + sxx_b + np.outer(dx, dx) * w
+        self.sxy = self.sxy + sxy_b + dx * dy * w
+        self.syy = self.syy + syy_b + dy * dy * w
+        self.mean_x = self.mean_x + dx * nb / n
+        self.mean_y = self.mean_y + dy * nb / n
+        self.n = n
+        return self
+
+    def downdate(self, X, y):
+        # Inverse of update(): remove rows that were previously added
+        if len(y) == 0:
+            return self
+        nb, mean_xb, mean_yb, sxx_b, sxy_b, syy_b = self._batch(X, y)
+        n = self.n
+        na = n - nb
+        if na <= 0:
+            self.__init__(len(self.mean_x))
+            return self
+        mean_xa = (n * self.mean_x - nb * mean_xb) / na
+        mean_ya = (n * self.mean_y - nb * mean_yb) / na
+        dx = mean_xb - mean_xa
+        dy = mean_yb - mean_ya
+        w = na * nb / n
+        self.sxx = self.sxx - sxx_b - np.outer(dx, dx) * w
+        self.sxy = self.sxy - sxy_b - dx * dy * w
+        self.syy = self.syy - syy_b - dy * dy * w
+        self.mean_x = mean_xa
+        self.mean_y = mean_ya
+        self.n = na
+        return self
+
+    def solve(self, alpha=1.0):
+        # Same system sklearn's Ridge(fit_intercept=True) solves with the cholesky solver
+        p = len(self.mean_x)
+        coefs = np.linalg.solve(self.sxx + alpha * np.eye(p), self.sxy)
+        const_coef = self.mean_y - self.mean_x @ coefs
+        return coefs, const_coef
+
+
+def solve_batch(stats, alpha=1.0):
+    # RidgeStats.solve() for many products sharing one factor list: the systems are
+    # stacked into (k, p, p) and (k, p) arrays and solved in one batched call.
+    # `alpha` is one value for all products or one per product.
+    return _solve_stacked(np.stack([s.sxx for s in stats]), np.stack([s.sxy for s in stats]),
+                          np.stack([s.mean_x for s in stats]), np.array([s.mean_y for s in stats]), alpha)
+
+
+def _solve_stacked(sxx, sxy, mean_x, mean_y, alpha):
+    p = sxx.shape[-1]
+    alpha = np.broadcast_to(np.asarray(alpha, dtype=np.float64), (len(sxx),))
+    coefs = np.linalg.solve(sxx + alpha[:, np.newaxis, np.newaxis] * np.eye(p), sxy[..., np.newaxis])[..., 0]
+    const_coefs = mean_y - np.einsum('kp,kp->k', mean_x, coefs)
+    return coefs, const_coefs
+
+
+def rolling_coefficients(X, y, window, step=1, alpha=1.0, chunk_rows=65536):
+    # Ridge fits over windows of `window` consecutive rows, `step` rows apart. Each
+    # window's X'X and X'y are the previous window's plus the rank-`step`
+    # contribution of the rows entering and minus that of the rows leaving, so no
+    # window is refitted. The contributions of all steps come from one batched
+    # matmul and are accumulated with a cumulative sum, restarting from an exactly
+    # computed window every `window` rows slid. Rows are shifted by that anchor
+    # window's means, which keeps the sums from cancelling on columns like Year and
+    # bounds rounding drift. All windows are solved in one batched call.
+    # Returns (window start rows, (k, p) coefficients, (k,) constants).
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n, p = X.shape
+    starts = np.arange(0, n - window + 1, step)
+    k = len(starts)
+    if not k:
+        return starts, np.empty((0, p)), np.empty(0)
+
+    # One Gram matrix of [x, y, 1] carries X'X, X'y, the column sums and the row count
+    Z = np.column_stack([X, y, np.ones(n)])
+    q = Z.shape[1]
+    per_anchor = min(max(1, window // step), k)
+    anchors = np.arange(0, k, per_anchor)
+    totals = np.vstack([np.zeros(q), np.cumsum(Z, axis=0)])
+    shifts = (totals[starts[anchors] + window] - totals[starts[anchors]]) / window
+    shifts[:, -1] = 0.0
+    shift = np.repeat(shifts, per_anchor, axis=0)[:k]
+
+    steps = np.zeros((len(anchors) * per_anchor, q, q))
+    if per_anchor > 1:
+        previous = starts[:-1]
+        steps[1:k] = (_block_grams(Z, previous + window, step, shift[1:], chunk_rows)
+                      - _block_grams(Z, previous, step, shift[1:], chunk_rows))
+    steps[anchors] = _block_grams(Z, starts[anchors], window, shifts, chunk_rows)
+    G = np.cumsum(steps.reshape(len(anchors), per_anchor, q, q), axis=1).reshape(-1, q, q)[:k]
+
+    count = G[:, -1, -1]
+    mean_x = G[:, :p, -1] / count[:, np.newaxis]
+    mean_y = G[:, p, -1] / count
+    sxx = G[:, :p, :p] - count[:, np.newaxis, np.newaxis] * mean_x[:, :, np.newaxis] * mean_x[:, np.newaxis, :]
+    sxy = G[:, :p, p] - count[:, np.newaxis] * mean_x * mean_y[:, np.newaxis]
+    coefs, const_coefs = _solve_stacked(sxx, sxy, mean_x + shift[:, :p], mean_y + shift[:, p], alpha)
+    return starts, coefs, const_coefs
+
+
+def _block_grams(Z, offsets, length, shifts, chunk_rows=65536):
+    # (Z[o:o + length] - c)' (Z[o:o + length] - c) for each offset o and its shift c, batched
+    q = Z.shape[1]
+    out = np.empty((len(offsets), q, q))
+    per_chunk = max(1, chunk_rows // length)
+    rows = np.arange(length)
+    for i in range(0, len(offsets), per_chunk):
+        blocks = Z[offsets[i:i + per_chunk, np.newaxis] + rows] - shifts[i:i + per_chunk, np.newaxis]
+        if length == 1:
+            out[i:i + per_chunk] = blocks[:, 0, :, np.newaxis] * blocks[:, 0, np.newaxis, :]
+        else:
+            out[i:i + per_chunk] = np.matmul(np.ascontiguousarray(blocks.transpose(0, 2, 1)), blocks)
+    return out
+
+
+# -----------------------------------------------   Ridge regularization path -----------------------------------------------
+
+ALPHA_CRITERIA = ('gcv', 'loo')
+
+
+class RidgePath:
+    # One thin SVD of the centered design matrix, Xc = U diag(s) V'. For any alpha
+    # the Ridge solution is V diag(s / (s^2 + alpha)) U'yc and the hat matrix is
+    # 1/n + U diag(s^2 / (s^2 + alpha)) U', so generalized cross-validation costs
+    # O(p) per alpha and exact leave-one-out (e_i / (1 - h_ii)) O(n*p), with no refit.
+    # The intercept is left unpenalised, as in Ridge(fit_intercept=True).
+
+    def __init__(self, X, y):
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        self.n = len(y)
+        self.mean_x = X.mean(axis=0)
+        self.mean_y = y.mean()
+        self.yc = y - self.mean_y
+        self.U, self.s, self.Vt = np.linalg.svd(X - self.mean_x, full_matrices=False)
+        self.uty = self.U.T @ self.yc
+        self.yy = self.yc @ self.yc
+
+    def _shrinkage(self, alphas):
+        # (rank, n_alphas) matrix of s^2 / (s^2 + alpha)
+        s2 = (self.s ** 2)[:, np.newaxis]
+        return s2 / (s2 + np.asarray(alphas, dtype=np.float64)[np.newaxis, :])
+
+    def coefficients(self, alpha):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d = np.where(self.s > 0, self.s / (self.s ** 2 + alpha), 0.0)
+        coefs = self.Vt.T @ (d * self.uty)
+        return coefs, self.mean_y - self.mean_x @ coefs
+
+    def gcv(self, alphas):
+        # Mean squared GCV error per alpha: (RSS / n) / (1 - df / n)^2
+        shrink = self._shrinkage(alphas)
+        rss = self.yy - self.uty @ self.uty + (((1 - shrink) * self.uty[:, np.newaxis]) ** 2).sum(axis=0)
+        df = 1 + shrink.sum(axis=0)
+        return (rss / self.n) / (1 - df / self.n) ** 2
+
+    def loo(self, alphas, chunk_rows=65536):
+        # Mean squared leave-one-out error per alpha, accumulated over row chunks
+        shrink = self._shrinkage(alphas)
+        weights = shrink * self.uty[:, np.newaxis]
+        errors = np.zeros(shrink.shape[1])
+        for start in range(0, self.n, chunk_rows):
+            U = self.U[start:start + chunk_rows]
+            residuals = self.yc[start:start + chunk_rows, np.newaxis] - U @ weights
+            leverage = 1 / self.n + (U ** 2) @ shrink
+            errors += ((residuals / (1 - leverage)) ** 2).sum(axis=0)
+        return errors / self.n
+
+    def select(self, alphas, criterion='loo'):
+        # (best alpha, error per alpha); ties go to the stronger penalty
+        if criterion not in ALPHA_CRITERIA:
+            raise ValueError(f"criterion must be one of {', '.join(ALPHA_CRITERIA)}")
+        alphas = np.asarray(alphas, dtype=np.float64)
+        errors = self.gcv(alphas) if criterion == 'gcv' else self.loo(alphas)
+        best = np.flatnonzero(errors == np.nanmin(errors))
+        return float(alphas[best].max()), errors
@@ -0,0 +1,144 @@
+import os
+import threading
+
+import pandas as pd
+
+
+# -----------------------------------------------   lazy schema discovery -----------------------------------------------
+
+def first_csv(industry_path):
+    try:
+        csv_files = sorted(f for f in os.listdir(industry_path) if f.endswith('.csv'))
+    except FileNotFoundError:
+        return None
+    return os.path.join(industry_path, csv_files[0]) if csv_files else None
+
+
+def discover_schema(file_path, sample_rows=1000, include_categorical=False, target='Sales Price'):
+    # Header plus a bounded sample decides which columns are factors; the rest of
+    # the file is never read.
+    return schema_from_frame(pd.read_csv(file_path, nrows=sample_rows), include_categorical, target)
+
+
+def schema_from_frame(df, include_categorical=False, target='Sales Price'):
+    # Columns keep their order in the file
+    numeric_cols = df.select_dtypes(include=['float64', 'int64', 'float32', 'int32']).columns
+    # Exclude datetime-like columns explicitly
+    columns = [col for col in numeric_cols if not pd.api.types.is_datetime64_any_dtype(df[col])]
+    if include_categorical:
+        columns += df.select_dtypes(include=['object', 'category']).columns.tolist()
+    columns = [col for col in df.columns if col in columns]
+
+    influencing_columns = [col for col in columns if col != target]
+    if target in columns:
+        return [target] + influencing_columns, influencing_columns, target
+    # Or handle the absence of 'Sales Price' appropriately
+    return columns, columns, target
+
+
+class LazySchemaDict(dict):
+    # Industry -> value mapping whose entries are discovered on first access and
+    # rediscovered when the file they came from changes
+
+    def __init__(self, schemas):
+        super().__init__()
+        self._schemas = schemas
+
+    def __getitem__(self, industry):
+        if self._schemas.load(industry):
+            return dict.__getitem__(self, industry)
+        raise KeyError(industry)
+
+    def __setitem__(self, industry, value):
+        # An explicit assignment is kept as it is, whatever happens to the file
+        self._schemas.sources.pop(industry, None)
+        dict.__setitem__(self, industry, value)
+
+    def __contains__(self, industry):
+        return self._schemas.load(industry)
+
+    def get(self, industry, default=None):
+        try:
+            return self[industry]
+        except KeyError:
+            return default
+
+
+class IndustrySchemas:
+    # Owns the factors / influencing_factors / target_variable dicts. An industry
+    # is discovered from its first CSV the first time any of them is asked for
+    # it, and again whenever that file's stat changes; explicit assignments
+    # (uploads, column edits) are kept as they are. on_change(industry) runs when
+    # a rediscovery changes or drops a schema, so derived state can be dropped.
+
+    def __init__(self, data_dir, sample_rows=1000, include_categorical=False, on_change=None):
+        self.data_dir = data_dir
+        self.sample_rows = sample_rows
+        self.include_categorical = include_categorical
+        self.on_change = on_change
+        self.factors = LazySchemaDict(self)
+        self.influencing_factors = LazySchemaDict(self)
+        self.target_variable = LazySchemaDict(self)
+        self.sources = {}  # industry -> (file it was discovered from, its mtime_ns and size at the time)
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _unchanged(source):
+        try:
+            st = os.stat(source[0])
+        except FileNotFoundError:
+            return False
+        return (st.st_mtime_ns, st.st_size) == source[1:]
+
+    def _schema(self, industry):
+        return (dict.get(self.factors, industry), dict.get(self.influencing_factors, industry),
+                dict.get(self.target_variable, industry))
+
+    def load(self, industry):
+        if not isinstance(industry, str) or industry.startswith('.'):
+            return False
+        with self._lock:
+            known = dict.__contains__(self.factors, industry)
+            source = self.sources.get(industry)
+            if known and (source is None or self._unchanged(source)):
+                return True
+            # Not discovered yet, or its discovery file was replaced, rewritten or removed
+            file_path = source[0] if source is not None and os.path.exists(source[0]) else None
+            file_path = file_path or first_csv(os.path.join(self.data_dir, industry))
+            if file_path is None:
+                # Empty or missing industry directory: nothing to discover
+                if known:
+                    self.forget(industry)
+                    if self.on_change is not None:
+                        self.on_change(industry)
+                return False
+            previous = self._schema(industry)
+            self.refresh(industry, file_path)
+            if known and self._schema(industry) != previous and self.on_change is not None:
+                self.on_change(industry)
+            return True
+
+    def forget(self, industry):
+        with self._lock:
+            for mapping in (self.factors, self.influencing_factors, self.target_variable):
+                dict.pop(mapping, industry, None)
+            self.sources.pop(industry, None)
+
+    def refresh(self, industry, file_path):
+        # (Re)discover an industry from a specific file
+        schema = discover_schema(file_path, self.sample_rows, self.include_categorical)
+        self.assign(industry, schema, file_path)
+
+    def assign(self, industry, schema, file_path):
+        factors_val, influencing, target = schema
+        st = os.stat(file_path)
+        with self._lock:
+            dict.__setitem__(self.factors, industry, factors_val)
+            dict.__setitem__(self.influencing_factors, industry, influencing)
+            dict.__setitem__(self.target_variable, industry, target)
+            self.sources[industry] = (os.path.abspath(file_path), st.st_mtime_ns, st.st_size)
+
+    def load_all(self, industries):
+        # Templates serialise every industry, so pages materialise them all
+        for industry in industries:
+            self.load(industry)
@@ -0,0 +1,167 @@
+import json
+import os
+import sqlite3
+import threading
+
+
+# -----------------------------------------------   shared, versioned state -----------------------------------------------
+
+class SharedState:
+    # Industry schemas, small JSON values and fitted coefficients shared by every
+    # worker process through one SQLite file in WAL mode (readers never block the
+    # writer). Each write runs in its own IMMEDIATE transaction and bumps a global
+    # version; every row remembers the version that last wrote it, so changes()
+    # returns only what moved since a worker last looked. Deletions are kept as
+    # rows with a NULL payload so other workers see them too. Writes also append
+    # to a bounded event log (the /events change feed), in the same transaction.
+
+    def __init__(self, db_path, event_log_size=10000):
+        self.db_path = db_path
+        self.event_log_size = event_log_size
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS state_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO state_version (id, version) VALUES (1, 0)")
+            conn.execute("CREATE TABLE IF NOT EXISTS schemas (industry TEXT PRIMARY KEY, factors TEXT, "
+                         "influencing_factors TEXT, target_variable TEXT, version INTEGER NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS state_values (key TEXT PRIMARY KEY, value TEXT, version INTEGER NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS coefficients (industry TEXT, product TEXT, file_path TEXT, "
+                         "file_version TEXT, coefficients TEXT, version INTEGER NOT NULL, kind TEXT, PRIMARY KEY (industry, product))")
+            if 'kind' not in {row[1] for row in conn.execute("PRAGMA table_info(coefficients)")}:
+                conn.execute("ALTER TABLE coefficients ADD COLUMN kind TEXT")
+            conn.execute("CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, version INTEGER NOT NULL, "
+                         "kind TEXT NOT NULL, industry TEXT, product TEXT, data TEXT)")
+
+    def _connect(self):
+        # One connection per thread; a connection inherited through fork (e.g. a
+        # preloaded gunicorn app) is never reused in the child
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self, mode='IMMEDIATE'):
+        return _Transaction(self._connect(), mode)
+
+    @staticmethod
+    def _bump(conn):
+        conn.execute("UPDATE state_version SET version = version + 1 WHERE id = 1")
+        return conn.execute("SELECT version FROM state_version WHERE id = 1").fetchone()[0]
+
+    def _log(self, conn, version, kind, industry=None, product=None, data=None):
+        cursor = conn.execute("INSERT INTO events (version, kind, industry, product, data) VALUES (?, ?, ?, ?, ?)",
+                              (version, kind, industry, product, json.dumps(data or {})))
+        conn.execute("DELETE FROM events WHERE id <= ?", (cursor.lastrowid - self.event_log_size,))
+
+    def version(self):
+        return self._connect().execute("SELECT version FROM state_version WHERE id = 1").fetchone()[0]
+
+    def update_schema(self, industry, change):
+        # change(current) -> (factors, influencing_factors, target) or None to delete.
+        # The industry's stored coefficients are dropped with any schema change.
+        with self._transaction() as conn:
+            row = conn.execute("SELECT factors, influencing_factors, target_variable FROM schemas WHERE industry = ?",
+                               (industry,)).fetchone()
+            current = None if row is None or row[0] is None else (json.loads(row[0]), json.loads(row[1]), row[2])
+            schema = change(current)
+            version = self._bump(conn)
+            if schema is None:
+                values = (industry, None, None, None, version)
+            else:
+                factors_val, influencing, target = schema
+                values = (industry, json.dumps(list(factors_val)), json.dumps(list(influencing)), target, version)
+            conn.execute("INSERT OR REPLACE INTO schemas VALUES (?, ?, ?, ?, ?)", values)
+            self._log(conn, version, 'factors' if schema is not None else 'industry-removed', industry)
+            conn.execute("UPDATE coefficients SET coefficients = NULL, file_version = NULL, version = ? "
+                         "WHERE industry = ? AND coefficients IS NOT NULL", (version, industry))
+        return schema
+
+    def update_value(self, key, change, default=None):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT value FROM state_values WHERE key = ?", (key,)).fetchone()
+            value = change(default if row is None or row[0] is None else json.loads(row[0]))
+            version = self._bump(conn)
+            conn.execute("INSERT OR REPLACE INTO state_values VALUES (?, ?, ?)", (key, json.dumps(value), version))
+        return value
+
+    def set_coefficients(self, industry, product, file_path, file_version, coefficients, kind=None):
+        self.set_many_coefficients([(industry, product, file_path, file_version, coefficients)], kind)
+
+    def set_many_coefficients(self, entries, kind=None):
+        # entries: (industry, product, file_path, file_version, coefficients); one transaction, one version.
+        # `kind` names the model settings they were fitted under, so a worker configured
+        # differently (another alpha, say) refits instead of serving them
+        rows = [(industry, product, file_path, file_version,
+                 json.dumps({name: float(value) for name, value in coefs.items()}))
+                for industry, product, file_path, file_version, coefs in entries]
+        if not rows:
+            return
+        with self._transaction() as conn:
+            version = self._bump(conn)
+            conn.executemany("INSERT OR REPLACE INTO coefficients (industry, product, file_path, file_version, "
+                             "coefficients, version, kind) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             [row + (version, kind) for row in rows])
+            for industry, product, _, file_version, _ in rows:
+                self._log(conn, version, 'coefficients', industry, product, {'file_version': file_version})
+
+    def publish(self, kind, industry=None, product=None, data=None):
+        # An event with no state of its own here, e.g. a product file that changed
+        with self._transaction() as conn:
+            version = self._bump(conn)
+            self._log(conn, version, kind, industry, product, data)
+        return version
+
+    def last_event_id(self):
+        row = self._connect().execute("SELECT MAX(id) FROM events").fetchone()
+        return row[0] or 0
+
+    def first_event_id(self):
+        # Oldest event still in the log; anything before it has been trimmed
+        row = self._connect().execute("SELECT MIN(id) FROM events").fetchone()
+        return row[0] or 0
+
+    def events(self, after_id, limit=500):
+        rows = self._connect().execute("SELECT id, version, kind, industry, product, data FROM events "
+                                       "WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)).fetchall()
+        return [{'id': event_id, 'version': version, 'kind': kind, 'industry': industry, 'product': product, **json.loads(data)}
+                for event_id, version, kind, industry, product, data in rows]
+
+    def changes(self, since):
+        # Everything written after version `since`, read in one snapshot
+        with self._transaction('DEFERRED') as conn:
+            version = conn.execute("SELECT version FROM state_version WHERE id = 1").fetchone()[0]
+            schemas = {}
+            for industry, factors_val, influencing, target in conn.execute(
+                    "SELECT industry, factors, influencing_factors, target_variable FROM schemas WHERE version > ?", (since,)):
+                schemas[industry] = None if factors_val is None else (json.loads(factors_val), json.loads(influencing), target)
+            values = {key: None if value is None else json.loads(value) for key, value in conn.execute(
+                "SELECT key, value FROM state_values WHERE version > ?", (since,))}
+            coefficients = {}
+            for industry, product, file_path, file_version, payload, kind in conn.execute(
+                    "SELECT industry, product, file_path, file_version, coefficients, kind FROM coefficients WHERE version > ?", (since,)):
+                coefficients[(industry, product)] = (file_path, file_version, None if payload is None else json.loads(payload), kind)
+        return {'version': version, 'schemas': schemas, 'values': values, 'coefficients': coefficients}
+
+
+class _Transaction:
+    # Writers BEGIN IMMEDIATE to take the write lock up front, so read-modify-write
+    # sequences from different processes serialise instead of deadlocking;
+    # readers BEGIN DEFERRED and only see a consistent WAL snapshot
+
+    def __init__(self, conn, mode):
+        self.conn = conn
+        self.mode = mode
+
+    def __enter__(self):
+        self.conn.execute(f"BEGIN {self.mode}")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type is not None else "COMMIT")
+        return False
@@ -204,25 +204,59 @@ document.addEventListener('DOMContentLoaded', () => {
         delIndustryForm.style.display = "block";
     }
 
+    async function readProgress(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = '';
+        let last = null;
+        while (true) {
+            const { done, value } = await reader.read();
+            buffered += decoder.decode(value || new Uint8Array(), { stream: !done });
+            const lines = buffered.split('\n');
+            buffered = done ? '' : lines.pop();
+            for (const line of lines) {
+                if (line.trim()) {
+                    last = JSON.parse(line);
+                    onEvent(last);
+                }
+            }
+            if (done) {
+                return last;
+            }
+        }
+    }
+
     function handleFiles(files) {
         const industryName = document.getElementById('industry-name').value;
         if (files.length > 0 && industryName) {
             const formData = new FormData();
             formData.append('csvFile', files[0]);
             formData.append('industryName', industryName);
-            fetch('/upload-csv', {
+            const status = dropArea.querySelector('p');
+            const statusText = status.textContent;
+            fetch('/upload-csv?progress=1', {
                 method: 'POST',
                 body: formData
             })
-            .then(response => response.json())
+            .then(response => readProgress(response, event => {
+                // One JSON line per parsed chunk until the final result
+                if (event.rows !== undefined && event.success === undefined) {
+                    const percent = event.total_bytes ? Math.round(100 * event.bytes / event.total_bytes) : null;
+                    status.textContent = `Processed ${event.rows} rows` + (percent !== null ? ` (${percent}%)` : '');
+                }
+            }))
             .then(data => {
-                if (data.success) {
+                status.textContent = statusText;
+                if (data && data.success) {
                     alert('CSV file uploaded successfully.');
                 } else {
-                    alert('Failed to upload CSV file.');
+                    alert('Failed to upload CSV file.' + (data && data.message ? ' ' + data.message : ''));
                 }
             })
-            .catch(error => console.error('Error:', error));
+            .catch(error => {
+                status.textContent = statusText;
+                console.error('Error:', error);
+            });
         } else {
             alert('Please enter an industry name and select a CSV file.');
         }
@@ -21,37 +21,80 @@ function updateTableHeaders(selectedColumns, productTableHead) {
 
 // Function to update table values
 async function updateTableValues(selectedColumns, industry, products, productTableBody) {
-    // Fetch and display data for each product
+    // Fetch defaults for every product of the industry in one request
     productTableBody.innerHTML = '';
+    const defaultsResponse = await fetch(`/data/${industry}/defaults`);
+    const data = await defaultsResponse.json();
+    if (data.error) {
+        console.error('Error fetching defaults:', data.error);
+        return;
+    }
+    const industry_factors = data.factors;
     for (const product of products) {
-        const defaultFactorsResponse = await fetch(`/data/${industry}/${product}`);
-        const defaultFactors = await defaultFactorsResponse.json();
-        const industry_factors = factors[selectedIndustry];
-        const tr = document.createElement('tr');
-        const factor1 = industry_factors.indexOf('COG');
-        const factor2 = industry_factors.indexOf('Sales Price');
-        const factorVal1 = defaultFactors[factor1];
-        const factorVal2 = defaultFactors[factor2];
-        const Margin = ((factorVal2 - factorVal1)/factorVal2)*100;
-        tr.innerHTML = `
-            <td><label class="ch">
-                    <input type="checkbox" class="product-checkbox" data-product="${industry}-${product}">
-                    <span class="checkbox-container1"></span>
-                </label>
-            </td>
-            <td>${product}</td>
-            ${selectedColumns.map(column => {
-                //console.log(column);
-                const factorIndex = industry_factors.indexOf(column);
-                const factorValue = defaultFactors[factorIndex];
-                //console.log(factorIndex);
-                //console.log(factorValue);
-                return `<td><input type="number" id="${industry}-${product}-${column}" value="${factorValue}"></td>`;
-            }).join('')}
-            <td><input type="number" id="${industry}-${product}-Margin" placeholder="${Margin.toFixed(2)}"></td>
-            <td><input type="number" id="${industry}-${product}-DynamicPrice" placeholder="Enter a value"></td>
-        `;
-        productTableBody.appendChild(tr);
+        const entry = data.products[product];
+        if (!entry) {
+            console.error(`No defaults for ${product}:`, data.errors[product]);
+            continue;
+        }
+        productTableBody.appendChild(buildProductRow(selectedColumns, industry, product, entry, industry_factors));
+    }
+}
+
+// Table row for one product from its entry in /data/<industry>/defaults
+function buildProductRow(selectedColumns, industry, product, entry, industry_factors) {
+    const defaultFactors = entry.defaults;
+    const tr = document.createElement('tr');
+    const Margin = entry.margin !== null ? entry.margin : NaN;
+    tr.innerHTML = `
+        <td><label class="ch">
+                <input type="checkbox" class="product-checkbox" data-product="${industry}-${product}">
+                <span class="checkbox-container1"></span>
+            </label>
+        </td>
+        <td>${product}</td>
+        ${selectedColumns.map(column => {
+            //console.log(column);
+            const factorIndex = industry_factors.indexOf(column);
+            const factorValue = defaultFactors[factorIndex];
+            //console.log(factorIndex);
+            //console.log(factorValue);
+            return `<td><input type="number" id="${industry}-${product}-${column}" value="${factorValue}"></td>`;
+        }).join('')}
+        <td><input type="number" id="${industry}-${product}-Margin" placeholder="${Margin.toFixed(2)}"></td>
+        <td><input type="number" id="${industry}-${product}-DynamicPrice" placeholder="Enter a value"></td>
+    `;
+    return tr;
+}
+
+// Re-render only the given products' rows from fresh defaults, keeping their selection;
+// new products are appended and removed ones dropped
+async function refreshProductRows(industry, changed) {
+    const productTableBody = document.getElementById('product-table').querySelector('tbody');
+    const response = await fetch(`/data/${industry}/defaults`);
+    const data = await response.json();
+    if (data.error) {
+        console.error('Error fetching defaults:', data.error);
+        return;
+    }
+    for (const product of changed) {
+        const entry = data.products[product];
+        const checkbox = productTableBody.querySelector(`.product-checkbox[data-product="${industry}-${product}"]`);
+        const row = checkbox ? checkbox.closest('tr') : null;
+        if (!entry) {
+            if (row) {
+                row.remove();
+            }
+            products = products.filter(name => name !== product);
+            continue;
+        }
+        const tr = buildProductRow(selectedColumns, industry, product, entry, data.factors);
+        if (row) {
+            tr.querySelector('.product-checkbox').checked = checkbox.checked;
+            row.replaceWith(tr);
+        } else {
+            products.push(product);
+            productTableBody.appendChild(tr);
+        }
     }
 }
 
@@ -239,67 +282,94 @@ function getInputValue(id, defaultValue) {
 async function calculateDynamicPrices(industry) {
     const checkboxes = document.querySelectorAll('.product-checkbox:checked');
 
+    // Collect every checked product's overrides and price them server-side in one request
+    const requested = [];
     for (const checkbox of checkboxes) {
         const product = checkbox.getAttribute('data-product'); // Gives I1-p1 actual product is p1
-        const defaultFactorsResponse = await fetch(`/data/${industry}/${product.split('-')[1]}`);
-        const defaultFactors = await defaultFactorsResponse.json();
-        //console.log(defaultFactors);
-        // Retrieve factor values dynamically
-        const factorValues = factors[industry].reduce((acc, factor, index) => {
-            const id = `${product}-${factor}`;
-            const elementExists = !!document.getElementById(id);
-            //console.log(`Checking ID: ${id}, Element exists: ${elementExists}`); // Log the ID and its existence
-
-            // Use the default value from defaultFactors if the element does not exist
-            // Assuming defaultFactors is an array, use index to access the values
-            acc[factor] = elementExists ? getInputValue(`${product}-${factor}`) : defaultFactors[index];
-            //console.log(`Value for ${factor}:`, acc[factor]);
-            //console.log(`Default value for ${factor}:`, defaultFactors[index]);
-            return acc;
-        }, {});
-
-        let dynamicPrice = 0;
-        let SP = factorValues['Sales Price'];
-        //console.log(SP);
-        let COG = factorValues['COG'];
-        let prevMargin = ((SP - COG)/SP)*100;
-        let margin =  getInputValue(`${product}-Margin`,prevMargin);
-        let change = margin - prevMargin;
-        //console.log(change);
-        const weights = await getCoefficients(industry, product.split('-')[1]);
-        // Add the constant term to dynamic price
-        //console.log(weights.const);
-        //console.log(weights);
-        if (weights.const !== undefined) {
-            dynamicPrice += parseFloat(weights.const);
+        const overrides = {};
+        for (const factor of factors[industry]) {
+            // Factors without an input keep the server-side default (mean of the last 30 rows)
+            if (document.getElementById(`${product}-${factor}`)) {
+                overrides[factor] = getInputValue(`${product}-${factor}`, null);
+            }
         }
-        // Iterate over each factor to calculate the dynamic price
-        for (const factor of influencing_factors[industry]) {
-            if (weights[factor] !== undefined) {
-                dynamicPrice += weights[factor] * parseFloat(factorValues[factor]);
-                //console.log(factorValues[factor]);
-                //console.log(factor)
+        requested.push({
+            product: product.split('-')[1],
+            factors: overrides,
+            margin: getInputValue(`${product}-Margin`, null)
+        });
+    }
+    if (requested.length === 0) {
+        return;
+    }
+
+    try {
+        const response = await fetch(`/price/${industry}`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ products: requested })
+        });
+        const data = await response.json();
+        if (data.error) {
+            alert(data.error);
+            return;
+        }
+        for (const [productName, result] of Object.entries(data.prices)) {
+            const product = `${industry}-${productName}`;
+            // Update the Dynamic Price input field for the product
+            const dynamicPriceElement = document.getElementById(`${product}-DynamicPrice`);
+            const marginElement = document.getElementById(`${product}-Margin`);
+            if (dynamicPriceElement && marginElement && result.dynamic_price !== null) {
+                marginElement.value = result.margin.toFixed(2);
+                dynamicPriceElement.value = result.dynamic_price.toFixed(2);
             }
         }
-        dynamicPrice = 1/( (1/dynamicPrice) - (change/(100*COG)) );
-        // Update the Dynamic Price input field for the product
-        const dynamicPriceElement = document.getElementById(`${product}-DynamicPrice`);
-        const marginElement = document.getElementById(`${product}-Margin`);
-        const id2 = `${product}-Margin`;
-        const id1 = `${product}-DynamicPrice`;
-        const Exists = !!document.getElementById(id1);
-        //console.log(`Checking ID: ${id1}, Element exists: ${Exists}`); // Log the ID and its existence
-
-        if (dynamicPriceElement && marginElement) {
-            marginElement.value = margin.toFixed(2);
-            dynamicPriceElement.value = dynamicPrice.toFixed(2);
+        for (const [productName, error] of Object.entries(data.errors)) {
+            if (!(data.jobs && data.jobs[productName])) {
+                console.error(`Error pricing ${productName}:`, error);
+            }
+        }
+        // Gradient-boosted models still training (app2): wait for them, then price again
+        const jobs = Object.values(data.jobs || {});
+        if (jobs.length > 0) {
+            const finished = await Promise.all(jobs.map(waitForJob));
+            if (finished.some(job => job.status === 'done')) {
+                await calculateDynamicPrices(industry);
+            }
         }
+    } catch (error) {
+        console.error('Error calculating dynamic prices:', error);
     }
 }
 
+// Wait for a background training job to finish
+async function waitForJob(jobId) {
+    while (true) {
+        const response = await fetch(`/jobs/${jobId}`);
+        const job = await response.json();
+        if (!response.ok || job.status === 'done' || job.status === 'failed') {
+            return job;
+        }
+        await new Promise(resolve => setTimeout(resolve, 500));
+    }
+}
+
+// Fetch coefficients, following 202 responses while the model trains in the background
+async function fetchCoefficients(url, options = {}) {
+    let response = await fetch(url, options);
+    while (response.status === 202) {
+        const job = await response.json();
+        await waitForJob(job.job_id);
+        response = await fetch(url, options);
+    }
+    return response;
+}
+
 async function getCoefficients(industry, product) {
     try {
-        let response = await fetch(`/coefficients/${industry}/${product}`);
+        let response = await fetchCoefficients(`/coefficients/${industry}/${product}`);
         let data = await response.json();
         return data;
     } catch (error) {
@@ -307,31 +377,84 @@ async function getCoefficients(industry, product) {
         return null;
     }
 }
-// Periodically check for updates and calculate dynamic prices
+// Server-sent change notifications: refresh only what changed, as it changes
+const changeEvents = new EventSource('/events');
+const seenFileVersions = {};
+let pendingRows = new Set();
+let pendingRowsTimer = null;
+
+function scheduleRowRefresh(product) {
+    // Changes arriving together are fetched together
+    pendingRows.add(product);
+    if (pendingRowsTimer === null) {
+        pendingRowsTimer = setTimeout(() => {
+            const changed = Array.from(pendingRows);
+            pendingRows = new Set();
+            pendingRowsTimer = null;
+            refreshProductRows(selectedIndustry, changed);
+        }, 250);
+    }
+}
 
-setInterval(async () => {
-    let selectedFactors = JSON.parse(localStorage.getItem('selectedFactors'));
-    if(getSelectedFactors(industries) !== ''){
-        selectedFactors = getSelectedFactors(industries);
-        localStorage.setItem('selectedFactors', JSON.stringify(selectedFactors));
+function reloadSelectedIndustry() {
+    // Full refetch of the table and chart, as when the industry is picked again
+    document.getElementById('industry-select').dispatchEvent(new Event('change'));
+}
+
+// The changes since our last event were trimmed from the server's log
+changeEvents.addEventListener('reset', reloadSelectedIndustry);
+
+// The server refused or dropped the stream for good (e.g. too many open streams):
+// fall back to refreshing every 5 minutes
+changeEvents.addEventListener('error', () => {
+    if (changeEvents.readyState === EventSource.CLOSED) {
+        setInterval(reloadSelectedIndustry, 300000);
     }
-    const selectedColumns = selectedFactors[selectedIndustry];
-    
-    // Clear existing content in main-content div
-    const productTableHead = document.getElementById('product-table').querySelector('thead');
-    const productTableBody = document.getElementById('product-table').querySelector('tbody');
-    const productsResponse = await fetch(`/data/${selectedIndustry}`);
-    const products = await productsResponse.json();
-    productTableBody.innerHTML = '';  // Clear table values
-    updateTableHeaders(selectedColumns, productTableHead);
-    updateTableValues(selectedColumns, selectedIndustry, products, productTableBody);
-    
-    const checkboxes = document.querySelectorAll('.product-checkbox:checked');
-    checkboxes.forEach(checkbox => {
-        const product = checkbox.getAttribute('data-product').split('-')[1];
-        getCoefficients(selectedIndustry, product);
+});
+
+changeEvents.addEventListener('file', event => {
+    const change = JSON.parse(event.data);
+    if (change.industry !== selectedIndustry) {
+        return;
+    }
+    const key = `${change.industry}-${change.product}`;
+    if (change.file_version && seenFileVersions[key] === change.file_version) {
+        return;  // Already shown, e.g. reported by several workers
+    }
+    seenFileVersions[key] = change.file_version;
+    scheduleRowRefresh(change.product);
+});
+
+changeEvents.addEventListener('coefficients', event => {
+    const change = JSON.parse(event.data);
+    const productSelect = document.getElementById('product-select');
+    if (change.industry === selectedIndustry && productSelect.value === change.product) {
+        productSelect.dispatchEvent(new Event('change'));  // Redraw the importance chart
+    }
+});
+
+changeEvents.addEventListener('factors', event => {
+    const change = JSON.parse(event.data);
+    if (change.industry === selectedIndustry) {
+        updateSelectedColumns();
+    }
+});
+
+['industry-added', 'industry-removed'].forEach(kind => {
+    changeEvents.addEventListener(kind, event => {
+        const change = JSON.parse(event.data);
+        const industrySelect = document.getElementById('industry-select');
+        const option = Array.from(industrySelect.options).find(item => item.value === change.industry);
+        if (kind === 'industry-added' && !option) {
+            const newOption = document.createElement('option');
+            newOption.value = change.industry;
+            newOption.textContent = change.industry;
+            industrySelect.appendChild(newOption);
+        } else if (kind === 'industry-removed' && option && change.industry !== selectedIndustry) {
+            option.remove();
+        }
     });
-}, 300000);
+});
 
 // Function to get selected factors on button click
 function getSelectedFactors(industry) {
@@ -427,12 +550,7 @@ async function showGraph() {
             const url = `/coefficients/${selectedIndustry}/${selectedProduct}`;
             const url2 = `/sales_trend/${selectedIndustry}/${selectedProduct}`;
             try {
-                const response = await fetch(url, {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    }
-                });
+                const response = await fetchCoefficients(url);
                 if (!response.ok) {
                     throw new Error('Network response was not ok');
                 }
@@ -441,7 +559,7 @@ async function showGraph() {
 
                 // Extract labels and values from the feature importance data
                 const df = data;
-                const filteredData = Object.entries(df).filter(([key, value]) => !key.startsWith("const"));
+                const filteredData = Object.entries(df).filter(([key, value]) => !key.startsWith("const") && key !== "alpha");
                 const labels = filteredData.map(([key, value]) => key);
                 const values = filteredData.map(([key, value]) => value);
 
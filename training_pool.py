@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.compose import ColumnTransformer
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sklearn.inspection import permutation_importance
+from sklearn.pipeline import Pipeline
+
+from columnar_store import ColumnarStore
+
+
+# -----------------------------------------------   gradient boosting pipeline -----------------------------------------------
+
+def build_model_pipeline(X):
+    # Identify numeric and categorical columns
+    numeric_cols = X.select_dtypes(include=['float64', 'int64', 'float32', 'int32']).columns
+    categorical_cols = X.select_dtypes(include=['object', 'category']).columns
+
+    # Define preprocessing steps for numeric and categorical data
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ('num', StandardScaler(), numeric_cols),
+            ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_cols)
+        ])
+
+    # Create a pipeline with preprocessing and model fitting
+    return Pipeline(steps=[
+        ('preprocessor', preprocessor),
+        ('regressor', HistGradientBoostingRegressor())
+    ])
+
+
+def fit_pipeline_job(file_path, feature_names, target):
+    # Runs inside a pool worker: maps the product's columnar copy itself so only
+    # the path crosses the process boundary, and returns the fitted pipeline
+    df = ColumnarStore().load(file_path, list(feature_names) + [target])
+    X = df[list(feature_names)]
+    y = df[target]
+    model = build_model_pipeline(X)
+    model.fit(X, y)
+    return model
+
+
+def pipeline_importances(model, X, y, max_rows=5000, n_repeats=5, seed=0, n_jobs=1):
+    # Permutation importance of each original factor: a column is shuffled before
+    # the preprocessor, so a categorical factor's one-hot columns move together.
+    # Scored on a seeded subsample of at most `max_rows` rows. 'const' is the mean
+    # target, the regressor's starting prediction.
+    if max_rows and len(X) > max_rows:
+        rows = np.sort(np.random.default_rng(seed).choice(len(X), max_rows, replace=False))
+        X, y = X.iloc[rows], y.iloc[rows]
+    result = permutation_importance(model, X, y, n_repeats=n_repeats, random_state=seed, n_jobs=n_jobs)
+    importances = {name: float(value) for name, value in zip(X.columns, result.importances_mean)}
+    importances['const'] = float(np.mean(y))
+    return importances
+
+
+def fit_and_explain_job(file_path, feature_names, target, importance_options, model=None):
+    # Pool job behind /coefficients: fits the pipeline unless one is passed in, then
+    # computes its importances on the same read of the data -> (model, importances)
+    df = ColumnarStore().load(file_path, list(feature_names) + [target])
+    X = df[list(feature_names)]
+    y = df[target]
+    if model is None:
+        model = build_model_pipeline(X)
+        model.fit(X, y)
+    return model, pipeline_importances(model, X, y, **importance_options)
+
+
+def timed_job(fn, *args):
+    # Runs `fn` in the worker and reports how long it took there, excluding time queued
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+# -----------------------------------------------   training job pool -----------------------------------------------
+
+class TrainingPool:
+    # Runs fits in worker processes. Jobs are keyed, and a submit for a key that
+    # already has a job in flight returns that job instead of starting another;
+    # submit() returns (job, created) so callers can tell the two apart.
+
+    def __init__(self, max_workers=None, keep_finished=1000):
+        self.max_workers = max_workers or os.cpu_count()
+        self.keep_finished = keep_finished
+        self._executor = None
+        self._jobs = {}     # job id -> job dict
+        self._by_key = {}   # key -> job id of the queued/running job
+        self._failed = {}   # key -> error of its last failed job
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created on first use so importing the app never forks workers
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def _submit_future(self, fn, *args):
+        # A worker that died (OOM kill, segfault) breaks the whole executor; its
+        # queued futures fail, and the next submit starts a fresh one
+        try:
+            return self._get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            return self._get_executor().submit(fn, *args)
+
+    def submit(self, key, fn, *args, on_done=None):
+        with self._lock:
+            job_id = self._by_key.get(key)
+            if job_id is not None:
+                return self._jobs[job_id], False
+
+            # Registered only once the executor has taken it, so a failed submit
+            # leaves no orphaned queued job behind
+            future = self._submit_future(fn, *args)
+            job = {'id': uuid.uuid4().hex, 'key': key, 'status': 'queued', 'error': None,
+                   'submitted_at': time.time(), 'finished_at': None, 'future': future}
+            self._jobs[job['id']] = job
+            self._by_key[key] = job['id']
+            self._prune()
+
+        def finish(done_future):
+            try:
+                result = done_future.result()
+                if on_done is not None:
+                    on_done(result)
+                status, error = 'done', None
+            except Exception as e:
+                status, error = 'failed', str(e)
+            with self._lock:
+                job['status'] = status
+                job['error'] = error
+                job['finished_at'] = time.time()
+                if self._by_key.get(key) == job['id']:
+                    del self._by_key[key]
+                if error is None:
+                    self._failed.pop(key, None)
+                else:
+                    self._failed[key] = error
+
+        future.add_done_callback(finish)
+        return job, True
+
+    def failure(self, key):
+        # Error of the last failed job for `key`, so callers don't resubmit it forever
+        with self._lock:
+            return self._failed.get(key)
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            status = job['status']
+            if status == 'queued' and self._running(job):
+                status = 'running'
+            end = job['finished_at'] or time.time()
+            queued = [j for j in self._jobs.values() if j['status'] == 'queued' and not self._running(j)]
+            return {
+                'job_id': job['id'],
+                'key': list(job['key']),
+                'status': status,
+                'error': job['error'],
+                'elapsed': round(end - job['submitted_at'], 3),
+                'queue_position': queued.index(job) if job in queued else 0,
+            }
+
+    @staticmethod
+    def _running(job):
+        future = job.get('future')
+        return future is not None and future.running()
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j['finished_at'] is not None]
+        if len(finished) > self.keep_finished:
+            finished.sort(key=lambda j: j['finished_at'])
+            for job in finished[:len(finished) - self.keep_finished]:
+                del self._jobs[job['id']]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
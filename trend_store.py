@@ -0,0 +1,117 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+# -----------------------------------------------   sales trend aggregates -----------------------------------------------
+
+AGG_COLUMNS = ['count', 'sum', 'mean', 'm2', 'min', 'max']
+
+
+def aggregate(df, by, value_col):
+    # count/sum/mean/min/max plus m2 (sum of squared deviations) per group
+    grouped = df.groupby(list(by), sort=True)[value_col]
+    agg = grouped.agg(['count', 'sum', 'mean', 'min', 'max'])
+    agg['m2'] = grouped.var(ddof=0).fillna(0.0) * agg['count']
+    return agg[AGG_COLUMNS]
+
+
+def merge_aggregates(a, b):
+    # Pairwise combination of two aggregate tables (Chan et al.), group by group
+    if a is None or a.empty:
+        return b.copy()
+    if b is None or b.empty:
+        return a.copy()
+    index = a.index.union(b.index)
+    a = a.reindex(index)
+    b = b.reindex(index)
+    na = a['count'].fillna(0)
+    nb = b['count'].fillna(0)
+    n = na + nb
+    delta = b['mean'].fillna(0) - a['mean'].fillna(0)
+    merged = pd.DataFrame(index=index)
+    merged['count'] = n
+    merged['sum'] = a['sum'].fillna(0) + b['sum'].fillna(0)
+    merged['mean'] = merged['sum'] / n
+    merged['m2'] = a['m2'].fillna(0) + b['m2'].fillna(0) + np.where((na > 0) & (nb > 0), delta ** 2 * na * nb / n, 0.0)
+    merged['min'] = np.fmin(a['min'], b['min'])
+    merged['max'] = np.fmax(a['max'], b['max'])
+    return merged[AGG_COLUMNS]
+
+
+def to_records(agg, value_col):
+    # Mean is reported under the value column so existing charts keep working
+    out = agg.copy()
+    out[value_col] = out.pop('mean')
+    out['var'] = np.where(out['count'] > 1, out['m2'] / (out['count'] - 1), np.nan)
+    out = out.drop(columns=['m2'])
+    out['count'] = out['count'].astype(int)
+    out = out.reset_index()
+    out = out.astype(object).where(out.notna(), None)
+    return out.to_dict(orient='records')
+
+
+class TrendStore:
+    # Per-product aggregates for each grouping requested so far, tied to the file
+    # version they were computed from. Appended rows are merged in place; any
+    # other change to the file rebuilds the groupings on their next request.
+
+    def __init__(self, value_col='Sales Price'):
+        self.value_col = value_col
+        self._entries = {}  # path -> {'version': str, 'groupings': {tuple(by): DataFrame}}
+        self._lock = threading.Lock()
+
+    def get(self, file_path, version, by, load_frame):
+        path = os.path.abspath(file_path)
+        by = tuple(by)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry['version'] == version and by in entry['groupings']:
+                return entry['groupings'][by]
+
+        agg = aggregate(load_frame(), by, self.value_col)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry['version'] != version:
+                entry = self._entries[path] = {'version': version, 'groupings': {}}
+            entry['groupings'][by] = agg
+        return agg
+
+    def seed(self, file_path, version, by, agg):
+        # Install aggregates computed elsewhere (e.g. while ingesting an upload)
+        path = os.path.abspath(file_path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry['version'] != version:
+                entry = self._entries[path] = {'version': version, 'groupings': {}}
+            entry['groupings'][tuple(by)] = agg
+
+    def append(self, file_path, old_version, new_version, new_rows):
+        # Fold appended rows into every grouping computed for `old_version`
+        path = os.path.abspath(file_path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry['version'] != old_version:
+                self._entries.pop(path, None)
+                return
+            groupings = {}
+            for by, agg in entry['groupings'].items():
+                if all(col in new_rows.columns for col in by):
+                    groupings[by] = merge_aggregates(agg, aggregate(new_rows, by, self.value_col))
+            self._entries[path] = {'version': new_version, 'groupings': groupings}
+
+    def forget_prefix(self, directory):
+        prefix = os.path.join(os.path.abspath(directory), '')
+        with self._lock:
+            for path in [p for p in self._entries if p.startswith(prefix)]:
+                del self._entries[path]
+
+    @staticmethod
+    def rollup(aggregates):
+        # Industry-wide view: merge the per-product tables group by group
+        merged = None
+        for agg in aggregates:
+            merged = merge_aggregates(merged, agg)
+        return merged